@@ -0,0 +1,277 @@
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+from logger_config import setup_logger
+from metrics import record_stage, admission_in_flight, admission_reserved_bytes, admission_queue_depth, admission_rejected
+
+logger = setup_logger()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Pipelines (/invoke* requests) running at once; 0 disables the cap
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+# Estimated memory of all running pipelines; 0 disables the budget
+ADMISSION_MEMORY_BUDGET_MB = float(os.getenv("ADMISSION_MEMORY_BUDGET_MB", "1024"))
+# Peak memory of a pipeline per byte of payload: the body, the decoded screenshot,
+# its Pillow image and the annotated copy are all alive at the same time
+ADMISSION_MEMORY_FACTOR = float(os.getenv("ADMISSION_MEMORY_FACTOR", "8"))
+# Memory of a pipeline besides its payload (elements, prompt, response)
+ADMISSION_REQUEST_OVERHEAD_MB = float(os.getenv("ADMISSION_REQUEST_OVERHEAD_MB", "2"))
+# Requests waiting for capacity; beyond it requests are rejected at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+ADMISSION_PATH_PREFIX = "/invoke"
+# Body size assumed for requests without a Content-Length (chunked uploads)
+UNKNOWN_BODY_BYTES = 4 * 2**20
+# Assumed expansion of compressed bodies (Content-Encoding); base64 screenshots
+# barely compress, XML dumps a lot more
+COMPRESSED_BODY_RATIO = 4
+MAX_RETRY_AFTER = 60
+
+# The admission ticket of the current request, for charge()
+_current_ticket = contextvars.ContextVar("euporie_admission_ticket", default=None)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Service at capacity ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("cost", "future", "queued", "admitted", "waited")
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.future = None
+        self.queued = time.monotonic()
+        self.admitted = None
+        self.waited = 0.0
+
+
+class AdmissionController:
+    """
+    Admits pipelines while fewer than max_concurrent run and their estimated memory
+    fits the budget; others wait in a bounded FIFO queue. A request is rejected at
+    once when the queue is full, or after queue_timeout seconds of waiting, so a burst
+    fails fast instead of slowing down (or running out of memory for) every request
+    already in flight. A single request larger than the whole budget is admitted when
+    nothing else runs.
+
+    Used from the event loop only.
+    """
+
+    def __init__(self, enabled=ADMISSION_ENABLED, max_concurrent=ADMISSION_MAX_CONCURRENT,
+                 memory_budget=int(ADMISSION_MEMORY_BUDGET_MB * 2**20), max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.enabled = enabled
+        self.max_concurrent = max_concurrent
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.reserved = 0
+        self._queue = deque()
+        # Moving average of how long admitted requests hold their slot
+        self._hold_seconds = None
+        self.stats_counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0,
+                               "peak_in_flight": 0, "peak_reserved_bytes": 0}
+
+    @staticmethod
+    def estimate(body_size):
+        """
+        Estimated peak memory in bytes of a pipeline whose (decompressed) request body has the given size.
+        """
+        if body_size is None:
+            body_size = UNKNOWN_BODY_BYTES
+        return int(body_size * ADMISSION_MEMORY_FACTOR + ADMISSION_REQUEST_OVERHEAD_MB * 2**20)
+
+    def _fits(self, cost):
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return False
+        if self.memory_budget and self.in_flight and self.reserved + cost > self.memory_budget:
+            return False
+        return True
+
+    def _admit(self, ticket):
+        ticket.admitted = time.monotonic()
+        ticket.waited = ticket.admitted - ticket.queued
+        self.in_flight += 1
+        self.reserved += ticket.cost
+        self.stats_counters["admitted"] += 1
+        self.stats_counters["peak_in_flight"] = max(self.stats_counters["peak_in_flight"], self.in_flight)
+        self.stats_counters["peak_reserved_bytes"] = max(self.stats_counters["peak_reserved_bytes"], self.reserved)
+
+    def _wake(self):
+        # Strict FIFO: a large request at the head is not overtaken by smaller ones
+        while self._queue and self._fits(self._queue[0].cost):
+            ticket = self._queue.popleft()
+            if ticket.future.done():
+                continue
+            self._admit(ticket)
+            ticket.future.set_result(None)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        admission_in_flight.set(self.in_flight)
+        admission_reserved_bytes.set(self.reserved)
+        admission_queue_depth.set(len(self._queue))
+
+    def retry_after(self):
+        """
+        Seconds after which a rejected client may expect capacity: the queue ahead of it
+        drained at the recent pace of requests.
+        """
+        hold = self._hold_seconds or 1.0
+        slots = self.max_concurrent or max(1, self.in_flight)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(hold * (len(self._queue) + 1) / slots)))
+
+    def _reject(self, reason):
+        self.stats_counters[f"rejected_{reason}"] += 1
+        admission_rejected.inc(reason=reason)
+        retry_after = self.retry_after()
+        logger.warning("Rejected request at capacity (%s): %d in flight, %.0f MiB reserved, %d queued, retry after %ds",
+                       reason, self.in_flight, self.reserved / 2**20, len(self._queue), retry_after)
+        return AdmissionRejected(reason, retry_after)
+
+    async def acquire(self, cost):
+        """
+        Waits for capacity for a pipeline of the given estimated memory.
+
+        Args:
+            cost (int): Estimated peak memory in bytes (see estimate)
+
+        Returns:
+            _Ticket: To be passed to release once the pipeline has finished
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        ticket = _Ticket(cost)
+        if not self._queue and self._fits(cost):
+            self._admit(ticket)
+            self._update_gauges()
+            return ticket
+        if len(self._queue) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._queue.append(ticket)
+        self.stats_counters["queued"] += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if ticket.admitted is not None:
+                # Admitted in the same iteration the timeout fired
+                return ticket
+            self._remove(ticket)
+            raise self._reject("timeout")
+        except asyncio.CancelledError:
+            # The client went away while queued (or just after being admitted)
+            if ticket.admitted is not None:
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        return ticket
+
+    def _remove(self, ticket):
+        ticket.future.cancel()
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            pass
+        # The removed request may have been the head blocking smaller ones
+        self._wake()
+
+    def charge(self, nbytes):
+        """
+        Adds memory to the current request's reservation, for payloads that are only
+        known after admission (screenshots downloaded from image_url). The budget may
+        be exceeded by this; it delays later admissions only.
+        """
+        ticket = _current_ticket.get()
+        if ticket is None or ticket.admitted is None:
+            return
+        extra = int(nbytes * ADMISSION_MEMORY_FACTOR)
+        ticket.cost += extra
+        self.reserved += extra
+        admission_reserved_bytes.set(self.reserved)
+
+    def release(self, ticket):
+        self.in_flight -= 1
+        self.reserved -= ticket.cost
+        hold = time.monotonic() - ticket.admitted
+        self._hold_seconds = hold if self._hold_seconds is None else 0.8 * self._hold_seconds + 0.2 * hold
+        self._wake()
+
+    def record_wait(self):
+        """
+        Records the current request's wait for admission as the 'admission' stage.
+        """
+        ticket = _current_ticket.get()
+        if ticket is not None:
+            record_stage("admission", ticket.waited)
+
+    def stats(self):
+        return {**self.stats_counters, "enabled": self.enabled, "in_flight": self.in_flight,
+                "reserved_bytes": self.reserved, "queued_now": len(self._queue),
+                "max_concurrent": self.max_concurrent, "memory_budget_bytes": self.memory_budget,
+                "max_queue": self.max_queue, "retry_after": self.retry_after()}
+
+
+admission = AdmissionController()
+
+
+def _body_size(scope):
+    # The body size after decompression, as far as the headers tell
+    length, encoded = None, False
+    for name, value in scope.get("headers") or ():
+        if name == b"content-length":
+            try:
+                length = int(value)
+            except ValueError:
+                return None
+        elif name == b"content-encoding" and value.strip().lower() != b"identity":
+            encoded = True
+    if length is not None and encoded:
+        return length * COMPRESSED_BODY_RATIO
+    return length
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that puts POST requests to the /invoke endpoints through the
+    admission controller and answers 503 with Retry-After when they are rejected.
+    The slot is held until the response is complete, streamed responses included.
+    """
+
+    def __init__(self, app, controller=None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if (not self.controller.enabled or scope["type"] != "http" or scope["method"] != "POST"
+                or not scope["path"].startswith(ADMISSION_PATH_PREFIX)):
+            await self.app(scope, receive, send)
+            return
+        try:
+            ticket = await self.controller.acquire(self.controller.estimate(_body_size(scope)))
+        except AdmissionRejected as e:
+            response = JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        token = _current_ticket.set(ticket)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_ticket.reset(token)
+            self.controller.release(ticket)
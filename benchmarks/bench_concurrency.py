@@ -0,0 +1,207 @@
+"""
+Concurrency benchmark for the /invoke pipeline against a stub LLM.
+
+Serves the FastAPI app with uvicorn on a background thread of this process, so the
+stub LLM can be patched in and no OpenAI key is needed. The stub sleeps for
+--llm-latency seconds, which is how a real gpt-4o call behaves from the event
+loop's point of view.
+
+Compares the async path (/invoke) with the previous blocking path, where
+run_service called the synchronous generate_data, and reports requests/sec, the
+number of LLM calls behind them and /health latency while the load is running. The
+load and the /health probe run on threads of their own, outside the server's event
+loop, so a blocked loop shows up in both.
+
+Every request sends the same screen, so the features that answer requests without
+the LLM (response cache, single-flight, screen diff, fast path) are off unless
+enabled with their flags; otherwise the benchmark would measure them instead.
+
+Usage:
+    python benchmarks/bench_concurrency.py --requests 200 --concurrency 50 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("LANGSMITH_TRACING", "false")
+
+import httpx
+import uvicorn
+from PIL import Image
+
+STUB_RESPONSE = json.dumps({
+    "data_generation_required": True,
+    "fields": [{"id": "1", "field_name": "email", "input_type": "text", "value": "a@b.com", "source": "llm", "type": "email"}],
+    "reason": "stub",
+})
+
+SAMPLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<hierarchy rotation="0">
+  <node class="android.widget.FrameLayout" clickable="false" bounds="[0,0][1080,1920]">
+    <node class="android.widget.EditText" resource-id="app:id/email" clickable="true" enabled="true" bounds="[40,200][1040,320]" text="" />
+    <node class="android.widget.EditText" resource-id="app:id/password" clickable="true" password="true" bounds="[40,360][1040,480]" text="" />
+    <node class="android.widget.Button" resource-id="app:id/login" clickable="true" bounds="[40,520][1040,640]" text="Log in" />
+  </node>
+</hierarchy>
+"""
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubLLM:
+    """Stand-in for ChatOpenAI with a fixed latency."""
+
+    calls = 0
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def invoke(self, messages, **kwargs):
+        StubLLM.calls += 1
+        time.sleep(self.latency)
+        return _Message(STUB_RESPONSE)
+
+    async def ainvoke(self, messages, **kwargs):
+        StubLLM.calls += 1
+        await asyncio.sleep(self.latency)
+        return _Message(STUB_RESPONSE)
+
+    async def astream(self, messages, **kwargs):
+        StubLLM.calls += 1
+        for offset in range(0, len(STUB_RESPONSE), 16):
+            await asyncio.sleep(self.latency / (len(STUB_RESPONSE) / 16))
+            yield _Message(STUB_RESPONSE[offset:offset + 16])
+
+
+def _sample_image():
+    buffered = BytesIO()
+    Image.new("RGB", (1080, 1920), "white").save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def _install_blocking_route(service):
+    """Registers the pre-async behaviour: an async handler calling the blocking generate_data."""
+    from utils import process_xml, validate_base64
+
+    @service.app.post("/_bench/invoke_blocking")
+    async def invoke_blocking(request: service.APIRequest):
+        messages = [("system", service.system_prompt)]
+        encoded_image = request.image if validate_base64(request.image) else None
+        processed_elements = process_xml(request.xml)
+        return service.generate_data(request=request, messages=messages, processed_elements=processed_elements, encoded_image=encoded_image)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app):
+    """Serves the app with uvicorn on a thread with its own event loop; returns the server and its URL."""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _probe_health(base_url, done, health_latencies):
+    """
+    Polls /health from its own thread, so the start time of a probe is taken while
+    the server's event loop is blocked rather than after it.
+    """
+    with httpx.Client(base_url=base_url, timeout=None) as client:
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get("/health")
+            health_latencies.append(time.perf_counter() - start)
+            done.wait(0.05)
+
+
+async def _run(base_url, path, payload, total, concurrency):
+    latencies = []
+    health_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    done = threading.Event()
+    prober = threading.Thread(target=_probe_health, args=(base_url, done, health_latencies), daemon=True)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, json=payload)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        prober.start()
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        prober.join()
+
+    return elapsed, latencies, health_latencies
+
+
+def _report(name, total, elapsed, latencies, health_latencies, llm_calls):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    health = max(health_latencies) if health_latencies else 0
+    print(f"{name:<10} {total / elapsed:10.1f} req/s   {llm_calls:6d} LLM calls"
+          f"   p50 {statistics.median(latencies) * 1000:8.1f} ms"
+          f"   p95 {p95 * 1000:8.1f} ms   max /health {health * 1000:8.1f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--mode", choices=["async", "blocking", "both"], default="both")
+    parser.add_argument("--cache", action="store_true", help="Enable the response cache")
+    parser.add_argument("--singleflight", action="store_true", help="Enable coalescing of identical requests")
+    parser.add_argument("--screen-diff", action="store_true", help="Enable reuse of similar earlier screens")
+    parser.add_argument("--fast-path", action="store_true", help="Enable rule-based answers for obvious screens")
+    args = parser.parse_args()
+
+    # Read by the service at import
+    for name, enabled in (("RESPONSE_CACHE_ENABLED", args.cache), ("SINGLEFLIGHT_ENABLED", args.singleflight),
+                          ("SCREEN_DIFF_ENABLED", args.screen_diff), ("FAST_PATH_ENABLED", args.fast_path)):
+        os.environ[name] = "true" if enabled else "false"
+    os.environ["RESPONSE_CACHE_DIR"] = ""
+    import main as service
+
+    service.initialize_llm = lambda api_key, model=None: StubLLM(args.llm_latency)
+    _install_blocking_route(service)
+    payload = {"image": _sample_image(), "xml": SAMPLE_XML}
+
+    server, base_url = _serve(service.app)
+    modes = ["async", "blocking"] if args.mode == "both" else [args.mode]
+    try:
+        for mode in modes:
+            path = "/invoke" if mode == "async" else "/_bench/invoke_blocking"
+            calls_before = StubLLM.calls
+            elapsed, latencies, health_latencies = asyncio.run(_run(base_url, path, payload, args.requests, args.concurrency))
+            _report(mode, args.requests, elapsed, latencies, health_latencies, StubLLM.calls - calls_before)
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main_cli()
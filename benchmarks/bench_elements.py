@@ -0,0 +1,162 @@
+"""
+Compares the single-pass process_clickable_elements with the previous pair of passes
+over actionable elements (process_clickable_elements + trim_element_jsons) on
+synthetic screens.
+
+The previous passes expected different attribute shapes (a name/value list and a
+mapping), so each is fed the shape it understood; the single pass reads the list.
+Both are run in alternation, so that load on the machine affects them alike, and the
+best and median wall times of preparing one screen are reported with the peak traced
+Python memory, then the time of building the compact prompt table from the records.
+
+Usage:
+    python benchmarks/bench_elements.py --elements 1000 5000 10000 --repeat 15
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from element_encoding import encode_elements_compact
+from screen_elements import ScreenElement, ScreenIndex, parse_bounds
+from utils import process_clickable_elements
+
+
+def previous_process_clickable_elements(clickable_elements, os_name="android"):
+    """The previous implementation: a chain of name checks per attribute."""
+    interactable_elements = ScreenIndex()
+    type_attribute = 'type' if os_name == 'ios' else 'class'
+    for idx, element in enumerate(clickable_elements, start=1):
+        element_id = str(element.get('elementId', idx))
+        element_type = element.get('className', '')
+        bounds = element.get('bounds', '')
+        if not bounds and 'x1' in element and 'y1' in element and 'x2' in element and 'y2' in element:
+            bounds = f"[{element['x1']},{element['y1']}][{element['x2']},{element['y2']}]"
+        resource_id = ''
+        content_desc = ''
+        enabled = False
+        password = False
+        text = element.get('text', '')
+        attribute_type = ''
+        if 'attributes' in element:
+            for attr in element['attributes']:
+                if attr.get('name') == 'resource-id':
+                    resource_id = attr.get('value', '')
+                elif attr.get('name') == 'content-desc':
+                    content_desc = attr.get('value', '')
+                elif attr.get('name') == 'clickable':
+                    enabled = attr.get('value') == 'true'
+                elif attr.get('name') == 'password':
+                    password = attr.get('value') == 'true'
+                elif attr.get('name') == 'text' and not text:
+                    text = attr.get('value', '')
+                elif attr.get('name') == type_attribute:
+                    attribute_type = attr.get('value') or ''
+        element_type = element_type or attribute_type
+        interactable_elements[element_id] = ScreenElement(
+            element_id,
+            text=text,
+            resource_id=resource_id,
+            type=element_type.split('.')[-1].split('XCUIElementType')[-1] if element_type else '',
+            bounds=bounds,
+            class_name=element_type,
+            content_desc=content_desc,
+            enabled=enabled,
+            password=password,
+            rect=parse_bounds(bounds),
+        )
+    return interactable_elements
+
+
+def previous_trim_element_jsons(elements_to_trim, os_name):
+    trimmed_elements = []
+    for element in elements_to_trim:
+        attributes = element.get("attributes")
+        trimmed_element = {
+            "node_id": element.get("node_id"),
+            "description": element.get("description"),
+            "bounds": attributes.get("bounds")
+        }
+        if os_name == 'android':
+            trimmed_element["element_type"] = attributes.get("class")
+        elif os_name == 'ios':
+            trimmed_element["element_type"] = attributes.get("type")
+        trimmed_elements.append(trimmed_element)
+    return trimmed_elements
+
+
+def actionable_screen(count):
+    """Actionable elements as sent by the crawler, with the usual uiautomator attributes."""
+    elements = []
+    for i in range(count):
+        class_name = "android.widget.EditText" if i % 10 == 0 else "android.widget.TextView"
+        y = (i * 40) % 2300
+        bounds = f"[16,{y}][1064,{y + 40}]"
+        values = {
+            "index": "0", "package": "com.example", "class": class_name, "text": f"Item {i}",
+            "resource-id": f"com.example:id/item_{i}", "content-desc": "", "checkable": "false", "checked": "false",
+            "clickable": "true", "enabled": "true", "focusable": "true", "focused": "false", "long-clickable": "false",
+            "password": "false", "scrollable": "false", "selected": "false", "bounds": bounds, "displayed": "true",
+        }
+        elements.append({
+            "elementId": f"e{i}", "node_id": i, "description": f"Item {i}", "className": class_name, "bounds": bounds,
+            "attributes": [{"name": name, "value": value} for name, value in values.items()],
+        })
+    return elements
+
+
+def as_mapping(elements):
+    return [{**element, "attributes": {attr["name"]: attr["value"] for attr in element["attributes"]}} for element in elements]
+
+
+def measure(funcs, repeat):
+    """Runs the functions in turn repeat times; returns name -> (timings, peak traced bytes)."""
+    timings = {name: [] for name in funcs}
+    for _ in range(repeat):
+        for name, func in funcs.items():
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            timings[name].append(time.perf_counter() - start)
+    results = {}
+    for name, func in funcs.items():
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (timings[name], peak)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'elements':>9}  {'impl':<10}{'best ms':>10}{'median ms':>11}{'peak MiB':>10}{'encode ms':>11}")
+    for count in args.elements:
+        elements = actionable_screen(count)
+        mapped = as_mapping(elements)
+        processed_elements = process_clickable_elements(elements, "android")
+        results = measure({
+            "previous": lambda: (previous_process_clickable_elements(elements),
+                                 previous_trim_element_jsons(mapped, "android")),
+            "single": lambda: process_clickable_elements(elements, "android"),
+            "encode": lambda: encode_elements_compact(processed_elements, 0),
+        }, args.repeat)
+        encode_ms = min(results["encode"][0]) * 1000
+        for name in ("previous", "single"):
+            timings, peak = results[name]
+            encode = f"{encode_ms:>11.1f}" if name == "single" else f"{'':>11}"
+            print(f"{count:>9}  {name:<10}{min(timings) * 1000:>10.1f}{statistics.median(timings) * 1000:>11.1f}"
+                  f"{peak / 2**20:>10.1f}{encode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Peak RSS and time to ingest large requests: the JSON body as /invoke parsed it before
+(stdlib json, base64.b64decode), the orjson body path, the same body gzip-compressed,
+and the multipart /invoke/upload path.
+
+Each measurement runs in a fresh process that drives the service's ASGI app directly,
+feeding the body from a file in 64 KiB chunks as a server would. Ingestion ends once
+the screenshot is decoded into bytes and the XML is parsed; no LLM is involved. A small
+request of the same kind warms the process up first; peak RSS is reported above the
+process's RSS just before the measured request (the kernel's high-water mark is reset
+then where /proc/self/clear_refs allows it). Times and peaks are medians of --runs
+processes.
+
+Usage:
+    python benchmarks/bench_ingestion.py --sizes 5 10 20
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VARIANTS = ("json_previous", "json", "json_gzip", "multipart")
+BOUNDARY = "benchboundary"
+
+
+def sample_xml(nodes=4000):
+    rows = "".join(
+        f'<node index="{i}" text="Item {i}" resource-id="com.example:id/item_{i}" class="android.widget.'
+        f'{"EditText" if i % 10 == 0 else "TextView"}" package="com.example" content-desc="" clickable="true" '
+        f'enabled="true" password="false" bounds="[0,{i * 40 % 2300}][1080,{i * 40 % 2300 + 40}]"/>'
+        for i in range(nodes))
+    return f'<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">{rows}</hierarchy>'
+
+
+def write_bodies(directory, size_mb):
+    """Writes the request bodies of every variant; returns variant -> (path, content type, encoding)."""
+    image = os.urandom(int(size_mb * 2**20))  # incompressible, like a PNG
+    xml = sample_xml()
+    json_body = json.dumps({"image": base64.b64encode(image).decode(), "xml": xml}).encode()
+    bodies = {}
+    for variant, content_type, encoding, data in (
+        ("json_previous", "application/json", None, json_body),
+        ("json", "application/json", None, json_body),
+        ("json_gzip", "application/json", "gzip", gzip.compress(json_body, compresslevel=1)),
+    ):
+        path = os.path.join(directory, f"{variant}-{size_mb}")
+        with open(path, "wb") as f:
+            f.write(data)
+        bodies[variant] = (path, content_type, encoding)
+    path = os.path.join(directory, f"multipart-{size_mb}")
+    with open(path, "wb") as f:
+        for name, filename, part_type, data in (("image", "screen.png", "image/png", image),
+                                                ("xml", "screen.xml", "text/xml", xml.encode())):
+            f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f'Content-Type: {part_type}\r\n\r\n'.encode())
+            f.write(data)
+            f.write(b"\r\n")
+        f.write(f"--{BOUNDARY}--\r\n".encode())
+    bodies["multipart"] = (path, f"multipart/form-data; boundary={BOUNDARY}", None)
+    return bodies
+
+
+def current_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss(reset):
+    if reset:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    # Since the start of the process, so it includes the import of the service
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def install_routes(main):
+    """Endpoints that stop after ingestion, mirroring the previous and the current request handling."""
+    from fastapi import File, UploadFile
+    from fastapi.routing import APIRoute
+
+    from image_payload import ImagePayload
+    from utils import process_xml
+
+    async def previous(request: main.APIRequest):
+        raw = base64.b64decode(request.image)
+        return {"image_bytes": len(raw), "elements": len(process_xml(request.xml))}
+
+    async def current(request: main.APIRequest):
+        payload = ImagePayload.from_base64(request.image)
+        return {"image_bytes": payload.size_bytes, "elements": len(process_xml(request.xml))}
+
+    async def upload(image: UploadFile = File(None), xml: UploadFile = File(None)):
+        payload = ImagePayload.from_bytes(await image.read())
+        await xml.seek(0)
+        return {"image_bytes": payload.size_bytes, "elements": len(process_xml(xml.file))}
+
+    main.app.router.add_api_route("/_bench/json_previous", previous, methods=["POST"], route_class_override=APIRoute)
+    main.app.router.add_api_route("/_bench/json", current, methods=["POST"])
+    main.app.router.add_api_route("/_bench/upload", upload, methods=["POST"])
+
+
+async def drive(app, path, body_path, content_type, encoding):
+    headers = [(b"content-type", content_type.encode()), (b"content-length", str(os.path.getsize(body_path)).encode())]
+    if encoding:
+        headers.append((b"content-encoding", encoding.encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": headers,
+             "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000)}
+    body_file = open(body_path, "rb")
+    done = asyncio.Event()
+    response = {"body": b""}
+
+    async def receive():
+        if body_file.closed:
+            await done.wait()
+            return {"type": "http.disconnect"}
+        chunk = body_file.read(65536)
+        if not chunk:
+            body_file.close()
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunk)}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    return response
+
+
+def child(variant, warmup_path, body_path, content_type, encoding):
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("LOG_FILE", "")
+    import main
+
+    install_routes(main)
+    path = {"json_previous": "/_bench/json_previous", "multipart": "/_bench/upload"}.get(variant, "/_bench/json")
+    asyncio.run(drive(main.app, path, warmup_path, content_type, encoding))
+    reset = reset_peak_rss()
+    rss_before = current_rss()
+    start = time.perf_counter()
+    response = asyncio.run(drive(main.app, path, body_path, content_type, encoding))
+    elapsed = time.perf_counter() - start
+    peak = peak_rss(reset)
+    print(json.dumps({"status": response.get("status"), "seconds": elapsed,
+                      "peak_mb": max(0, peak - rss_before) / 2**20, "body": json.loads(response["body"] or b"{}")}))
+
+
+def run_child(directory, variant, warmup_path, body_path, content_type, encoding):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", variant, warmup_path, body_path, content_type,
+         encoding or "-"],
+        capture_output=True, text=True, check=True, cwd=directory,
+    ).stdout.strip().splitlines()[-1]
+    result = json.loads(output)
+    if result["status"] != 200:
+        raise SystemExit(f"{variant} failed with {result['status']}: {result['body']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[5, 10, 20], help="Screenshot sizes in MiB")
+    parser.add_argument("--runs", type=int, default=3, help="Processes per variant and size")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        variant, warmup_path, body_path, content_type, encoding = args.child
+        child(variant, warmup_path, body_path, content_type, encoding if encoding != "-" else None)
+        return
+
+    print(f"{'screenshot':>10}  {'variant':<14}{'body MiB':>9}{'ms':>9}{'peak RSS +MiB':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        warmup = write_bodies(directory, 0.05)
+        for size in args.sizes:
+            bodies = write_bodies(directory, size)
+            for variant in VARIANTS:
+                body_path, content_type, encoding = bodies[variant]
+                results = [run_child(directory, variant, warmup[variant][0], body_path, content_type, encoding)
+                           for _ in range(args.runs)]
+                seconds = statistics.median(result["seconds"] for result in results)
+                peak_mb = statistics.median(result["peak_mb"] for result in results)
+                print(f"{size:>8.0f} M  {variant:<14}{os.path.getsize(body_path) / 2**20:>9.1f}"
+                      f"{seconds * 1000:>9.1f}{peak_mb:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compares the previous parsing of model answers (clean_markdown_json + json.loads) with
+loads_agent_output on the answer shapes seen in free-form JSON mode.
+
+Reports per shape whether each parser fails or returns values that differ from the
+intended answer (the previous parser replaced True/False everywhere, including inside
+strings), and the time to parse a typical answer. With structured output the model
+answers in the "plain" shape; the live parse-failure rate is exported as
+euporie_llm_output_parse_total.
+
+Usage:
+    python benchmarks/bench_output_parsing.py --repeat 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_schema import loads_agent_output
+
+# Values that contain the words True/False
+TRICKY_ANSWER = {
+    "data_generation_required": True,
+    "fields": [
+        {"id": "3", "field_name": "email", "input_type": "email", "value": "jane.doe@example.com", "source": "config",
+         "type": "email", "context": "Login email taken from config"},
+        {"id": "5", "field_name": "search", "input_type": "search", "value": "True Detective", "source": "llm",
+         "type": "search_term", "context": "Streaming app: a show title. False positives are fine"},
+    ],
+    "reason": "Login and search fields are present",
+}
+ANSWER = {
+    "data_generation_required": True,
+    "fields": [{**TRICKY_ANSWER["fields"][0]}],
+    "reason": "A login field is present",
+}
+
+
+def shapes(answer):
+    plain = json.dumps(answer)
+    return {
+        "plain": plain,
+        "fenced": f"```json\n{plain}\n```",
+        "fenced_no_newline": f"```json{plain}```",
+        "bare_fence": f"```\n{plain}\n```",
+        "indented_fenced": f"  ```json\n{json.dumps(answer, indent=2)}\n```  ",
+        "python_literals": json.dumps(answer).replace(": true", ": True").replace(": false", ": False"),
+    }
+
+
+def legacy_clean_markdown_json(content):
+    """The previous implementation."""
+    if content.startswith("```json\n"):
+        content = content[8:]
+    elif content.startswith("```json"):
+        content = content[7:]
+    if content.endswith("\n```"):
+        content = content[:-4]
+    elif content.endswith("```"):
+        content = content[:-3]
+    content = content.replace("True", "true").replace("False", "false")
+    return content
+
+
+def legacy_parse(content):
+    return json.loads(legacy_clean_markdown_json(content))
+
+
+def new_parse(content):
+    return loads_agent_output(content)[0]
+
+
+def outcome(parse, content, answer):
+    try:
+        parsed = parse(content)
+    except ValueError:
+        return "failed"
+    return "ok" if parsed == answer else "wrong values"
+
+
+def best_time(parse, content, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(content)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'shape':<20}{'values':<12}{'previous':>14}{'new':>14}")
+    failures = {"previous": 0, "new": 0}
+    total = 0
+    for label, answer in (("plain", ANSWER), ("True/False", TRICKY_ANSWER)):
+        for name, content in shapes(answer).items():
+            previous, new = outcome(legacy_parse, content, answer), outcome(new_parse, content, answer)
+            failures["previous"] += previous != "ok"
+            failures["new"] += new != "ok"
+            total += 1
+            print(f"{name:<20}{label:<12}{previous:>14}{new:>14}")
+    print(f"{'unusable':<32}{failures['previous']:>11}/{total}{failures['new']:>11}/{total}")
+    print()
+    cases = shapes(ANSWER)
+    for name in ("plain", "fenced"):
+        previous = best_time(legacy_parse, cases[name], args.repeat)
+        new = best_time(new_parse, cases[name], args.repeat)
+        print(f"parse {name:<14} previous {previous * 1e6:6.1f} us   new {new * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compares the streaming process_xml with the previous ElementTree implementation
+on large synthetic Android and iOS Appium dumps.
+
+Reports wall time per parse and peak traced Python memory, and checks that both
+implementations return the same elements.
+
+Usage:
+    python benchmarks/bench_xml_parse.py --elements 5000 20000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import process_xml
+
+
+def legacy_process_xml(xml_content):
+    """The pre-streaming implementation: full tree, one walk to detect iOS, one to extract."""
+    root = ET.fromstring(xml_content)
+    is_ios = any("XCUIElementType" in elem.tag for elem in root.iter())
+    interactable_elements = {}
+    if is_ios:
+        ios_input_field_types = {
+            'XCUIElementTypeTextField',
+            'XCUIElementTypeSecureTextField',
+            'XCUIElementTypeTextView',
+            'XCUIElementTypeSearchField'
+        }
+        for idx, elem in enumerate(root.findall('.//*'), start=1):
+            element_type = elem.tag
+            if (any(field_type in element_type for field_type in ios_input_field_types) and
+                    elem.get('enabled', 'true') == 'true' and
+                    elem.get('visible', 'true') == 'true'):
+                try:
+                    x = int(elem.get('x', 0))
+                    y = int(elem.get('y', 0))
+                    width = int(elem.get('width', 0))
+                    height = int(elem.get('height', 0))
+                    bounds = f"[{x},{y}][{x+width},{y+height}]"
+                except (ValueError, TypeError):
+                    bounds = ''
+                interactable_elements[str(idx)] = {
+                    'text': elem.get('value', '') or elem.get('label', ''),
+                    'resource_id': elem.get('resource-id', '') or elem.get('name', ''),
+                    'type': element_type.split('XCUIElementType')[-1],
+                    'bounds': bounds,
+                    'class': element_type,
+                    'content_desc': elem.get('label', ''),
+                    'enabled': elem.get('enabled', 'true') == 'true',
+                    'password': 'Secure' in element_type
+                }
+    else:
+        for idx, action_elem in enumerate(root.findall('.//*[@clickable="true"]'), start=1):
+            interactable_elements[str(idx)] = {
+                'text': action_elem.get('text', ''),
+                'resource_id': action_elem.get('resource-id', ''),
+                'type': action_elem.tag.split('.')[-1],
+                'bounds': action_elem.get('bounds', ''),
+                'class': action_elem.get('class', ''),
+                'content_desc': action_elem.get('content-desc', ''),
+                'enabled': action_elem.get('enabled', 'true') == 'true',
+                'password': action_elem.get('password', 'false') == 'true'
+            }
+    return interactable_elements
+
+
+def android_dump(count):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?><hierarchy index="0" class="hierarchy" rotation="0" width="1080" height="2340">',
+             '<android.widget.FrameLayout index="0" class="android.widget.FrameLayout" clickable="false" bounds="[0,0][1080,2340]">']
+    for i in range(count):
+        tag = "android.widget.EditText" if i % 10 == 0 else "android.widget.TextView"
+        y = (i * 40) % 2300
+        parts.append(
+            f'<android.widget.LinearLayout index="{i}" class="android.widget.LinearLayout" clickable="false" bounds="[0,{y}][1080,{y + 40}]">'
+            f'<{tag} index="0" package="com.example" class="{tag}" text="Item {i}" resource-id="com.example:id/item_{i}" '
+            f'content-desc="" checkable="false" checked="false" clickable="{"true" if i % 3 == 0 else "false"}" enabled="true" '
+            f'focusable="true" focused="false" long-clickable="false" password="false" scrollable="false" selected="false" '
+            f'bounds="[16,{y}][1064,{y + 40}]" displayed="true" /></android.widget.LinearLayout>'
+        )
+    parts.append('</android.widget.FrameLayout></hierarchy>')
+    return "".join(parts)
+
+
+def ios_dump(count):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?><AppiumAUT>',
+             '<XCUIElementTypeApplication type="XCUIElementTypeApplication" name="Example" enabled="true" visible="true" x="0" y="0" width="390" height="844">']
+    for i in range(count):
+        tag = "XCUIElementTypeTextField" if i % 10 == 0 else "XCUIElementTypeStaticText"
+        y = (i * 20) % 820
+        parts.append(
+            f'<XCUIElementTypeOther type="XCUIElementTypeOther" enabled="true" visible="true" x="0" y="{y}" width="390" height="20">'
+            f'<{tag} type="{tag}" name="field_{i}" label="Label {i}" value="Value {i}" enabled="true" visible="true" '
+            f'accessible="true" x="10" y="{y}" width="370" height="20" index="0"/></XCUIElementTypeOther>'
+        )
+    parts.append('</XCUIElementTypeApplication></AppiumAUT>')
+    return "".join(parts)
+
+
+def measure(func, xml_content, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(xml_content)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(xml_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'dump':<16}{'size':>10}  {'impl':<10}{'best ms':>10}{'peak MiB':>10}")
+    for count in args.elements:
+        for platform, builder in (("android", android_dump), ("ios", ios_dump)):
+            xml_content = builder(count)
+            size = f"{len(xml_content) / 1e6:.1f}MB"
+            legacy_time, legacy_peak, legacy_result = measure(legacy_process_xml, xml_content, args.repeat)
+            new_time, new_peak, new_result = measure(process_xml, xml_content, args.repeat)
+            new_result = {element_id: element.as_dict() for element_id, element in new_result.items()}
+            assert legacy_result == new_result, f"{platform}/{count}: outputs differ"
+            name = f"{platform}/{count}"
+            print(f"{name:<16}{size:>10}  {'legacy':<10}{legacy_time * 1000:>10.1f}{legacy_peak / 2**20:>10.1f}")
+            print(f"{name:<16}{size:>10}  {'streaming':<10}{new_time * 1000:>10.1f}{new_peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Builds the benchmark corpus: Android (uiautomator) and iOS (XCUITest/Appium) page
+source dumps with matching screenshots.
+
+The dumps follow the attribute layout of real dumps from those tools, with the
+screens the service sees most (login, sign-up, feed, checkout) at realistic sizes.
+Output is deterministic, so the checked-in files can be regenerated at any time:
+
+    python benchmarks/corpus/build_corpus.py
+"""
+import os
+import random
+from xml.sax.saxutils import quoteattr
+
+from PIL import Image, ImageDraw, ImageFont
+
+CORPUS_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(CORPUS_DIR)), "Arial.ttf")
+
+ANDROID_SIZE = (1080, 2340)
+IOS_POINTS = (390, 844)
+IOS_SCALE = 3
+
+ANDROID_CLASSES = {
+    "input": "android.widget.EditText",
+    "password": "android.widget.EditText",
+    "spinner": "android.widget.Spinner",
+    "button": "android.widget.Button",
+    "text": "android.widget.TextView",
+    "image": "android.widget.ImageView",
+    "check": "android.widget.CheckBox",
+}
+IOS_TYPES = {
+    "input": "XCUIElementTypeTextField",
+    "password": "XCUIElementTypeSecureTextField",
+    "search": "XCUIElementTypeSearchField",
+    "button": "XCUIElementTypeButton",
+    "text": "XCUIElementTypeStaticText",
+    "image": "XCUIElementTypeImage",
+    "switch": "XCUIElementTypeSwitch",
+}
+
+# (kind, label, id) rows, laid out top to bottom
+SCREENS = {
+    "login": [
+        ("image", "", "logo"), ("text", "Welcome back", "title"),
+        ("input", "Email", "email"), ("password", "Password", "password"),
+        ("check", "Remember me", "remember"), ("button", "Log in", "login"),
+        ("text", "Forgot password?", "forgot"), ("button", "Create account", "signup"),
+    ],
+    "signup": [
+        ("text", "Create your account", "title"),
+        ("input", "First name", "first_name"), ("input", "Last name", "last_name"),
+        ("input", "Email", "email"), ("input", "Phone number", "phone"),
+        ("spinner", "Country", "country"), ("input", "Date of birth", "dob"),
+        ("password", "Password", "password"), ("password", "Confirm password", "password_confirm"),
+        ("check", "I accept the terms", "terms"), ("button", "Sign up", "submit"),
+    ],
+    "checkout": [
+        ("text", "Checkout", "title"), ("text", "Shipping address", "shipping_header"),
+        ("input", "Full name", "full_name"), ("input", "Street address", "street"),
+        ("input", "City", "city"), ("input", "Postal code", "postal_code"),
+        ("text", "Payment", "payment_header"), ("input", "Card number", "card_number"),
+        ("input", "MM/YY", "card_expiry"), ("password", "CVC", "card_cvc"),
+        ("button", "Pay now", "pay"),
+    ],
+}
+
+
+def feed_rows(count, rng):
+    rows = [("input", "Search", "search")]
+    for index in range(count):
+        rows.append(("image", "", f"thumbnail_{index}"))
+        rows.append(("text", rng.choice(["New arrivals", "Top picks", "Trending", "On sale", "For you"]) + f" {index}",
+                     f"headline_{index}"))
+        rows.append(("text", f"{rng.randint(1, 999)} likes", f"likes_{index}"))
+        rows.append(("button", "Share", f"share_{index}"))
+    return rows
+
+
+def _layout(rows, width, height, top, row_height, gap):
+    y = top
+    for kind, label, element_id in rows:
+        yield kind, label, element_id, (40, y, width - 40, y + row_height)
+        y += row_height + gap
+        if y + row_height > height:
+            y = top  # lists longer than the screen wrap, as recycled rows do
+
+
+def android_dump(rows, package="com.example.shop"):
+    width, height = ANDROID_SIZE
+    lines = [
+        "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>",
+        '<hierarchy rotation="0">',
+        f'  <node index="0" text="" resource-id="" class="android.widget.FrameLayout" package="{package}" content-desc="" '
+        f'checkable="false" checked="false" clickable="false" enabled="true" focusable="false" focused="false" scrollable="false" '
+        f'long-clickable="false" password="false" selected="false" bounds="[0,0][{width},{height}]">',
+        f'    <node index="0" text="" resource-id="{package}:id/content" class="android.widget.LinearLayout" package="{package}" '
+        f'content-desc="" checkable="false" checked="false" clickable="false" enabled="true" focusable="false" focused="false" '
+        f'scrollable="true" long-clickable="false" password="false" selected="false" bounds="[0,120][{width},{height}]">',
+    ]
+    boxes = []
+    for index, (kind, label, element_id, (x1, y1, x2, y2)) in enumerate(_layout(rows, width, height, 160, 120, 36)):
+        editable = kind in ("input", "password")
+        clickable = kind not in ("text", "image")
+        text = "" if editable else label
+        lines.append(
+            f'      <node index="{index}" text={quoteattr(text)} resource-id="{package}:id/{element_id}" '
+            f'class="{ANDROID_CLASSES[kind]}" package="{package}" content-desc={quoteattr(label if kind == "image" else "")} '
+            f'checkable="{str(kind == "check").lower()}" checked="false" clickable="{str(clickable).lower()}" enabled="true" '
+            f'focusable="{str(clickable).lower()}" focused="false" scrollable="false" long-clickable="false" '
+            f'password="{str(kind == "password").lower()}" selected="false" bounds="[{x1},{y1}][{x2},{y2}]" '
+            f'hint={quoteattr(label if editable else "")} />'
+        )
+        boxes.append((kind, label, (x1, y1, x2, y2)))
+    lines += ["    </node>", "  </node>", "</hierarchy>", ""]
+    return "\n".join(lines), boxes
+
+
+def ios_dump(rows, name="Shop"):
+    width, height = IOS_POINTS
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        "<AppiumAUT>",
+        f'  <XCUIElementTypeApplication type="XCUIElementTypeApplication" name="{name}" label="{name}" enabled="true" '
+        f'visible="true" accessible="false" x="0" y="0" width="{width}" height="{height}" index="0">',
+        f'    <XCUIElementTypeWindow type="XCUIElementTypeWindow" enabled="true" visible="true" accessible="false" '
+        f'x="0" y="0" width="{width}" height="{height}" index="0">',
+    ]
+    boxes = []
+    for index, (kind, label, element_id, (x1, y1, x2, y2)) in enumerate(_layout(rows, width, height, 100, 44, 12)):
+        kind = {"spinner": "button", "check": "switch"}.get(kind, kind)
+        if kind == "input" and element_id == "search":
+            kind = "search"
+        value = label if kind in ("input", "password", "search") else ""
+        lines.append(
+            f'      <XCUIElementTypeOther type="XCUIElementTypeOther" enabled="true" visible="true" accessible="false" '
+            f'x="0" y="{y1}" width="{width}" height="{y2 - y1}" index="{index}">'
+        )
+        lines.append(
+            f'        <{IOS_TYPES[kind]} type="{IOS_TYPES[kind]}" name="{element_id}" label={quoteattr(label)} '
+            f'value={quoteattr(value)} enabled="true" visible="true" accessible="true" x="{x1}" y="{y1}" '
+            f'width="{x2 - x1}" height="{y2 - y1}" index="0"/>'
+        )
+        lines.append("      </XCUIElementTypeOther>")
+        scaled = tuple(coordinate * IOS_SCALE for coordinate in (x1, y1, x2, y2))
+        boxes.append((kind, label, scaled))
+    lines += ["    </XCUIElementTypeWindow>", "  </XCUIElementTypeApplication>", "</AppiumAUT>", ""]
+    return "\n".join(lines), boxes
+
+
+def render_screenshot(size, boxes, rng):
+    """
+    Draws the elements over a noisy gradient; the noise keeps the JPEG close to the
+    size of a real screenshot.
+    """
+    width, height = size
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, max(24, height // 60))
+    for kind, label, (x1, y1, x2, y2) in boxes:
+        if kind in ("input", "password", "search"):
+            draw.rounded_rectangle((x1, y1, x2, y2), radius=16, fill="white", outline=(120, 120, 120), width=3)
+            draw.text((x1 + 24, y1 + (y2 - y1) // 4), label, fill=(150, 150, 150), font=font)
+        elif kind in ("button", "spinner", "switch", "check"):
+            draw.rounded_rectangle((x1, y1, x2, y2), radius=16, fill=(rng.randint(0, 80), 90, 200))
+            draw.text((x1 + 24, y1 + (y2 - y1) // 4), label, fill="white", font=font)
+        elif kind == "image":
+            draw.rectangle((x1, y1, x2, y2), fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+        else:
+            draw.text((x1, y1 + (y2 - y1) // 4), label, fill="black", font=font)
+    return image
+
+
+def build():
+    rng = random.Random(1234)
+    screens = dict(SCREENS, feed=feed_rows(120, rng))
+    for screen, rows in screens.items():
+        for platform, dump, size in (
+            ("android", android_dump, ANDROID_SIZE),
+            ("ios", ios_dump, (IOS_POINTS[0] * IOS_SCALE, IOS_POINTS[1] * IOS_SCALE)),
+        ):
+            name = f"{platform}_{screen}"
+            xml, boxes = dump(rows)
+            with open(os.path.join(CORPUS_DIR, f"{name}.xml"), "w", encoding="utf-8") as f:
+                f.write(xml)
+            render_screenshot(size, boxes, rng).save(os.path.join(CORPUS_DIR, f"{name}.jpg"), quality=85)
+            print(f"{name}: {len(rows)} elements")
+
+
+if __name__ == "__main__":
+    build()
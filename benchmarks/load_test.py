@@ -0,0 +1,406 @@
+"""
+Offline load test for /invoke.
+
+Starts the stub OpenAI-compatible server (stub_llm_server.py) and the service as
+separate processes, points the service at the stub through LLM_BASE_URL, and replays
+traffic built from a JSONL file (default: benchmarks/traffic.jsonl). Each traffic
+line names a corpus screen and optional APIRequest fields:
+
+    {"screen": "android_login", "os": "android", "run_id": "r1", "node_id": "n1",
+     "config_data": {...}, "image": true, "xml": true}
+
+"image"/"xml" (default true) choose whether the corpus screenshot and XML dump are
+sent. Lines are replayed round-robin until --requests have been sent.
+
+Reports throughput with the number of LLM calls it took, client p50/p95/p99 latency,
+per-stage latency and CPU from the service's /metrics, and the service's CPU time and
+RSS (idle, under load, after). No network access or OpenAI key is needed; CPU and RSS
+are read from /proc (Linux).
+
+The features that answer requests without the LLM (response cache, single-flight,
+screen diff, fast path) are off unless enabled with their flags, so that replayed
+screens measure the full pipeline. A run where LLM calls per request drop well below
+one measures those features instead.
+
+Usage:
+    python benchmarks/load_test.py --requests 500 --concurrency 32 --llm-latency 1.0
+    python benchmarks/load_test.py --json results.json --max-p95-ms 2500
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+DEFAULT_TRAFFIC = os.path.join(BENCH_DIR, "traffic.jsonl")
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_traffic(path):
+    """
+    Reads traffic lines and turns them into /invoke request bodies.
+    """
+    encoded = {}
+    bodies = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            screen = entry.pop("screen")
+            send_image = entry.pop("image", True)
+            send_xml = entry.pop("xml", True)
+            body = dict(entry)
+            if send_image:
+                if screen not in encoded:
+                    with open(os.path.join(CORPUS_DIR, f"{screen}.jpg"), "rb") as image_file:
+                        encoded[screen] = base64.b64encode(image_file.read()).decode()
+                body["image"] = encoded[screen]
+            if send_xml:
+                with open(os.path.join(CORPUS_DIR, f"{screen}.xml"), encoding="utf-8") as xml_file:
+                    body["xml"] = xml_file.read()
+            bodies.append((screen, body))
+    return bodies
+
+
+def parse_metrics(text):
+    """
+    Parses Prometheus text output into {(name, frozenset(labels)): value}.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        label_set = frozenset(_LABEL.findall(labels or ""))
+        samples[(name, label_set)] = float(value)
+    return samples
+
+
+def stage_summary(before, after, family):
+    """
+    Per-stage count, mean and estimated p50/p95/p99 (from bucket deltas) for a histogram family.
+    """
+    buckets = defaultdict(list)
+    totals = defaultdict(dict)
+    for (name, labels), value in after.items():
+        delta = value - before.get((name, labels), 0.0)
+        labels = dict(labels)
+        stage = labels.get("stage")
+        if stage is None:
+            continue
+        if name == f"{family}_bucket":
+            bound = math.inf if labels["le"] == "+Inf" else float(labels["le"])
+            buckets[stage].append((bound, delta))
+        elif name == f"{family}_sum":
+            totals[stage]["sum"] = delta
+        elif name == f"{family}_count":
+            totals[stage]["count"] = delta
+
+    summary = {}
+    for stage, values in totals.items():
+        count = values.get("count", 0)
+        if not count:
+            continue
+        entry = {"count": int(count), "mean_ms": values.get("sum", 0.0) / count * 1000}
+        ordered = sorted(buckets[stage])
+        for quantile in (0.5, 0.95, 0.99):
+            entry[f"p{int(quantile * 100)}_ms"] = _bucket_quantile(ordered, count, quantile) * 1000
+        summary[stage] = entry
+    return summary
+
+
+def _bucket_quantile(ordered, count, quantile):
+    # Linear interpolation inside the bucket that holds the rank, as Prometheus does
+    rank = quantile * count
+    lower, below = 0.0, 0.0
+    for bound, cumulative in ordered:
+        if cumulative >= rank:
+            if math.isinf(bound):
+                return lower
+            width = cumulative - below
+            return lower + (bound - lower) * ((rank - below) / width if width else 1.0)
+        lower, below = bound, cumulative
+    return lower
+
+
+def percentile(values, quantile):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(quantile * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ProcessSampler:
+    """
+    Samples a process's RSS and CPU time from /proc in a background thread.
+    """
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            return 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self.peak_rss = self.rss()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_processes(args):
+    stub_port, service_port = _free_port(), _free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stub_llm_server.py"), "--port", str(stub_port),
+         "--latency", str(args.llm_latency), "--ttft", str(args.llm_ttft),
+         "--rpm", str(args.llm_rpm), "--tpm", str(args.llm_tpm)],
+        cwd=REPO_DIR,
+    )
+    env = dict(
+        os.environ,
+        LLM_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        OPENAI_API_KEY="stub",
+        LANGSMITH_TRACING="false",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        LOG_FILE="",
+        RESPONSE_CACHE_ENABLED="true" if args.cache else "false",
+        RESPONSE_CACHE_DIR="",
+        SINGLEFLIGHT_ENABLED="true" if args.singleflight else "false",
+        SCREEN_DIFF_ENABLED="true" if args.screen_diff else "false",
+        FAST_PATH_ENABLED="true" if args.fast_path else "false",
+    )
+    service = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(service_port),
+         "--log-level", "warning"],
+        cwd=REPO_DIR, env=env,
+    )
+    try:
+        _wait_until_up(f"http://127.0.0.1:{stub_port}/v1/models", stub)
+        _wait_until_up(f"http://127.0.0.1:{service_port}/health", service)
+    except Exception:
+        stub.terminate()
+        service.terminate()
+        raise
+    return stub, service, f"http://127.0.0.1:{service_port}", f"http://127.0.0.1:{stub_port}"
+
+
+async def replay(base_url, bodies, total, concurrency):
+    latencies = defaultdict(list)
+    errors = 0
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def worker():
+            nonlocal next_index, errors
+            while next_index < total:
+                screen, body = bodies[next_index % len(bodies)]
+                next_index += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/invoke", json=body)
+                    ok = response.status_code == 200 and response.json().get("status") == "success"
+                except httpx.HTTPError:
+                    ok = False
+                latencies[screen].append(time.perf_counter() - start)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def run(args):
+    bodies = load_traffic(args.traffic)
+    stub, service, base_url, stub_url = start_processes(args)
+    sampler = ProcessSampler(service.pid)
+    try:
+        idle_rss = sampler.rss()
+        sampler.start()
+        if args.warmup:
+            asyncio.run(replay(base_url, bodies, args.warmup, min(args.concurrency, args.warmup)))
+        warm_rss = sampler.rss()
+        metrics_before = parse_metrics(httpx.get(f"{base_url}/metrics").text)
+        stub_before = httpx.get(f"{stub_url}/stats").json()
+        cpu_before = sampler.cpu_seconds()
+        sampler.peak_rss = warm_rss
+
+        elapsed, latencies, errors = asyncio.run(replay(base_url, bodies, args.requests, args.concurrency))
+
+        cpu_used = sampler.cpu_seconds() - cpu_before
+        metrics_after = parse_metrics(httpx.get(f"{base_url}/metrics").text)
+        stub_stats = httpx.get(f"{stub_url}/stats").json()
+        sampler.stop()
+        end_rss = sampler.rss()
+    finally:
+        service.terminate()
+        stub.terminate()
+        service.wait()
+        stub.wait()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    rate_limited = stub_stats.get("rate_limited", 0) - stub_before.get("rate_limited", 0)
+    # Completions the stub answered; calls it refused with 429 are retried and counted once
+    llm_calls = stub_stats.get("requests", 0) - stub_before.get("requests", 0) - rate_limited
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency_s": args.llm_latency,
+        "errors": errors,
+        "error_rate": errors / args.requests if args.requests else 0.0,
+        "elapsed_s": elapsed,
+        "throughput_rps": args.requests / elapsed if elapsed else 0.0,
+        "latency_ms": {f"p{int(q * 100)}": percentile(all_latencies, q) * 1000 for q in (0.5, 0.95, 0.99)},
+        "latency_by_screen_ms": {
+            screen: {f"p{int(q * 100)}": percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99)}
+            for screen, values in sorted(latencies.items())
+        },
+        "stages": stage_summary(metrics_before, metrics_after, "euporie_stage_seconds"),
+        "stage_cpu": stage_summary(metrics_before, metrics_after, "euporie_stage_cpu_seconds"),
+        "service": {
+            "cpu_seconds": cpu_used,
+            "cpu_ms_per_request": cpu_used / args.requests * 1000 if args.requests else 0.0,
+            "cpu_utilization": cpu_used / elapsed if elapsed else 0.0,
+            "rss_idle_mb": idle_rss / 2**20,
+            "rss_warm_mb": warm_rss / 2**20,
+            "rss_peak_mb": sampler.peak_rss / 2**20,
+            "rss_end_mb": end_rss / 2**20,
+        },
+        "llm_calls": llm_calls,
+        "llm_calls_per_request": llm_calls / args.requests if args.requests else 0.0,
+        "llm_rate_limited": rate_limited,
+        "features": {"cache": args.cache, "singleflight": args.singleflight, "screen_diff": args.screen_diff,
+                     "fast_path": args.fast_path},
+    }
+
+
+def print_report(result):
+    latency = result["latency_ms"]
+    enabled = [name for name, on in result["features"].items() if on]
+    print(f"{result['requests']} requests, concurrency {result['concurrency']}, "
+          f"stub LLM {result['llm_latency_s']}s, {result['errors']} errors, "
+          f"enabled: {', '.join(enabled) if enabled else 'none'}")
+    print(f"throughput {result['throughput_rps']:.1f} req/s with {result['llm_calls']} LLM calls "
+          f"({result['llm_calls_per_request']:.2f}/request)   "
+          f"p50 {latency['p50']:.1f} ms   p95 {latency['p95']:.1f} ms   p99 {latency['p99']:.1f} ms")
+    print()
+    print(f"{'screen':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for screen, values in result["latency_by_screen_ms"].items():
+        print(f"{screen:<20}{values['p50']:>10.1f}{values['p95']:>10.1f}{values['p99']:>10.1f}")
+    print()
+    print(f"{'stage':<20}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu ms':>10}")
+    for stage, values in sorted(result["stages"].items()):
+        cpu = result["stage_cpu"].get(stage, {}).get("mean_ms")
+        cpu_text = f"{cpu:>10.2f}" if cpu is not None else f"{'-':>10}"
+        print(f"{stage:<20}{values['count']:>8}{values['mean_ms']:>10.2f}{values['p50_ms']:>10.1f}"
+              f"{values['p95_ms']:>10.1f}{values['p99_ms']:>10.1f}{cpu_text}")
+    service = result["service"]
+    print()
+    print(f"service cpu {service['cpu_seconds']:.2f} s ({service['cpu_ms_per_request']:.1f} ms/request, "
+          f"{service['cpu_utilization'] * 100:.0f}% of a core)")
+    print(f"service rss idle {service['rss_idle_mb']:.0f} MB, warm {service['rss_warm_mb']:.0f} MB, "
+          f"peak {service['rss_peak_mb']:.0f} MB, end {service['rss_end_mb']:.0f} MB")
+    if result["llm_rate_limited"]:
+        print(f"stub LLM answered {result['llm_rate_limited']} calls with 429")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", default=DEFAULT_TRAFFIC)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Stub LLM seconds per completion")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="Stub LLM seconds to first token")
+    parser.add_argument("--llm-rpm", type=int, default=0, help="Stub LLM requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--llm-tpm", type=int, default=0, help="Stub LLM prompt tokens per minute before 429s (0 = unlimited)")
+    parser.add_argument("--cache", action="store_true", help="Enable the response cache")
+    parser.add_argument("--singleflight", action="store_true", help="Enable coalescing of identical requests")
+    parser.add_argument("--screen-diff", action="store_true", help="Enable reuse of similar earlier screens")
+    parser.add_argument("--fast-path", action="store_true", help="Enable rule-based answers for obvious screens")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit with status 1 if client p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Exit with status 1 above this error rate")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failed = result["error_rate"] > args.max_error_rate
+    if args.max_p95_ms is not None and result["latency_ms"]["p95"] > args.max_p95_ms:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Token-count report for the element messages sent to the LLM: the legacy Python-repr
+format against the compact table format, on synthetic Android and iOS screens of
+increasing size.
+
+Counts use tiktoken's o200k_base encoding (gpt-4o) when its files are available
+locally, otherwise the service's chars/4 estimate.
+
+Usage:
+    python benchmarks/report_prompt_tokens.py --elements 20 100 500 2000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_xml_parse import android_dump, ios_dump
+from element_encoding import encode_elements_compact, estimate_tokens
+from utils import process_xml
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return "o200k_base", lambda text: len(encoding.encode(text))
+    except Exception:
+        return "chars/4 estimate", estimate_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[20, 100, 500, 2000])
+    parser.add_argument("--budget", type=int, default=0, help="Token budget for the compact format (0 = none)")
+    args = parser.parse_args()
+
+    name, count = token_counter()
+    print(f"token counter: {name}")
+    print(f"{'screen':<16}{'elements':>9}{'legacy':>10}{'compact':>10}{'saved':>8}")
+    for size in args.elements:
+        for platform, builder in (("android", android_dump), ("ios", ios_dump)):
+            processed_elements = process_xml(builder(size))
+            legacy_elements = {element_id: element.as_dict() for element_id, element in processed_elements.items()}
+            legacy = count(f'This is the xml source of that screen: {legacy_elements}')
+            compact = count(f'This is the xml source of that screen: {encode_elements_compact(processed_elements, args.budget)}')
+            saved = 1 - compact / legacy if legacy else 0
+            print(f"{platform + '/' + str(size):<16}{len(processed_elements):>9}{legacy:>10}{compact:>10}{saved:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+OpenAI-compatible stand-in for the chat completions API, for offline benchmarks.
+
+Serves POST /v1/chat/completions (plain and streamed) with canned JSON answers and
+configurable latency, so the service can run unchanged against it:
+
+    python benchmarks/stub_llm_server.py --port 8100 --ttft 0.3 --latency 1.0
+    LLM_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+With --rpm/--tpm the server enforces per-minute budgets like the provider: every
+response carries x-ratelimit-* headers, and requests beyond the budget get 429 with
+Retry-After.
+
+The answer for a request is picked from --responses (a JSON list of model answers,
+default: a login-form answer and a no-input answer) by hashing the last message, so
+the same screen always gets the same answer. Reported usage counts 4 characters per prompt token; the
+system prompt is reported as cached after the first request, like the provider's
+prefix cache.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_RESPONSES = [
+    {
+        "data_generation_required": True,
+        "fields": [
+            {"id": "1", "field_name": "email", "input_type": "text", "value": "jane.doe@example.com",
+             "source": "llm", "type": "email", "context": "login form"},
+            {"id": "2", "field_name": "password", "input_type": "password", "value": "S3cure!pass",
+             "source": "llm", "type": "password", "context": "login form"},
+        ],
+        "reason": "Login screen with empty email and password fields",
+    },
+    {
+        "data_generation_required": False,
+        "fields": [],
+        "reason": "No input fields on screen",
+    },
+]
+
+CHUNK_CHARS = 24
+
+
+def _message_text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _usage(messages, completion, seen_prefixes):
+    prompt_tokens = sum(len(_message_text(message)) for message in messages) // 4
+    system_text = "".join(_message_text(message) for message in messages if message.get("role") == "system")
+    prefix = hashlib.sha256(system_text.encode()).digest()
+    cached_tokens = len(system_text) // 4 if prefix in seen_prefixes else 0
+    seen_prefixes.add(prefix)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(completion) // 4,
+        "total_tokens": prompt_tokens + len(completion) // 4,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+class RateLimits:
+    """
+    Per-minute request and prompt-token budgets that refill continuously, like the
+    provider's; a limit of 0 is unlimited.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+
+    def check(self, tokens):
+        """
+        Returns (allowed, headers) for a request of the given prompt tokens.
+        """
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        allowed = (not self.rpm or self.requests >= 1) and (not self.tpm or self.tokens >= tokens)
+        if allowed:
+            self.requests -= 1 if self.rpm else 0
+            self.tokens -= tokens if self.tpm else 0
+        headers = {}
+        # Seconds until the next request (and the missing tokens) are available
+        waits = [0.0]
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(int(self.requests))
+            headers["x-ratelimit-reset-requests"] = f"{(self.rpm - self.requests) * 60 / self.rpm:.3f}s"
+            waits.append(max(0.0, 1 - self.requests) * 60 / self.rpm)
+        if self.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(int(self.tokens))
+            headers["x-ratelimit-reset-tokens"] = f"{(self.tpm - self.tokens) * 60 / self.tpm:.3f}s"
+            waits.append(max(0.0, tokens - self.tokens) * 60 / self.tpm)
+        if not allowed:
+            headers["retry-after-ms"] = str(max(1, int(max(waits) * 1000)))
+        return allowed, headers
+
+
+def create_app(responses, latency, ttft, jitter, rpm=0, tpm=0):
+    app = FastAPI()
+    answers = [json.dumps(response) for response in responses]
+    stats = {"requests": 0, "streamed": 0, "rate_limited": 0}
+    seen_prefixes = set()
+    limits = RateLimits(rpm, tpm)
+
+    def pick(messages):
+        digest = hashlib.sha256(_message_text(messages[-1]).encode() if messages else b"").digest()
+        return answers[digest[0] % len(answers)]
+
+    def delay(seconds):
+        return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        answer = pick(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        stats["requests"] += 1
+        allowed, headers = limits.check(sum(len(_message_text(message)) for message in messages) // 4)
+        if not allowed:
+            stats["rate_limited"] += 1
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                status_code=429, headers=headers)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay(latency))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": _usage(messages, answer, seen_prefixes),
+            }, headers=headers)
+
+        stats["streamed"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            def chunk(delta, finish_reason=None, usage=None):
+                data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else []}
+                if usage is not None:
+                    data["usage"] = usage
+                return f"data: {json.dumps(data)}\n\n"
+
+            await asyncio.sleep(delay(ttft))
+            yield chunk({"role": "assistant", "content": ""})
+            pieces = [answer[offset:offset + CHUNK_CHARS] for offset in range(0, len(answer), CHUNK_CHARS)]
+            step = max(0.0, latency - ttft) / max(1, len(pieces))
+            for piece in pieces:
+                yield chunk({"content": piece})
+                if step:
+                    await asyncio.sleep(delay(step))
+            yield chunk({}, "stop")
+            if include_usage:
+                yield chunk({}, usage=_usage(messages, answer, seen_prefixes))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "benchmarks"}]}
+
+    @app.get("/stats")
+    async def server_stats():
+        return stats
+
+    return app
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=1.0, help="Total seconds per completion")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first streamed token")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Relative +/- random variation of the delays")
+    parser.add_argument("--responses", help="JSON file with a list of canned model answers")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Prompt tokens per minute before 429s (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    responses = DEFAULT_RESPONSES
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    app = create_app(responses, args.latency, args.ttft, args.jitter, args.rpm, args.tpm)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main_cli()
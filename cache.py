@@ -0,0 +1,281 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import orjson
+from PIL import Image
+
+from element_encoding import PROMPT_ELEMENT_FORMAT
+from image_payload import ImagePayload
+from logger_config import setup_logger
+from prompts import PROMPT_VERSION
+
+logger = setup_logger()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Empty RESPONSE_CACHE_DIR disables the on-disk tier
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "response_cache")
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# "bytes" hashes the screenshot payload, "perceptual" hashes a downscaled grayscale copy
+RESPONSE_CACHE_IMAGE_HASH = os.getenv("RESPONSE_CACHE_IMAGE_HASH", "bytes")
+# Response fields that describe the LLM call itself; a hit makes no call, so they are not stored
+UNCACHED_FIELDS = ("usage", "routing")
+
+
+def _json_default(value):
+    # Screen elements are keyed by their response metadata and what else the prompt shows
+    if hasattr(value, "as_dict"):
+        return {**value.as_dict(), "node_id": value.node_id, "description": value.description}
+    return str(value)
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+def _dump_value(value):
+    # Cached values keep their key order so hits look exactly like misses
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def image_dhash(image, hash_size=8):
+    """
+    Computes a difference hash of a screenshot, stable across re-encoding and small
+    rendering noise such as a blinking cursor.
+
+    Args:
+        image (str or ImagePayload): Base64 encoded image or image payload
+        hash_size (int): Width/height of the hash grid
+
+    Returns:
+        str: Hex encoded hash
+    """
+    if isinstance(image, ImagePayload):
+        image = image.image
+    else:
+        image = Image.open(BytesIO(base64.b64decode(image)))
+    image = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def image_fingerprint(image):
+    if not image:
+        return None
+    image = ImagePayload.coerce(image)
+    if RESPONSE_CACHE_IMAGE_HASH == "perceptual":
+        try:
+            return "d:" + image_dhash(image)
+        except Exception as e:
+            logger.warning("Perceptual hash failed, falling back to byte hash: %s", e)
+    return "b:" + image.digest
+
+
+def request_fingerprint(processed_elements, encoded_image, config_data, os_name, source=None, context=None):
+    """
+    Builds a content-addressed key for a screen analysis request.
+
+    Args:
+        processed_elements (dict): Normalized screen elements
+        encoded_image (str or ImagePayload): Screenshot, if any
+        config_data (dict): Configuration data sent with the request
+        os_name (str): Target platform
+        source (str): Where the elements came from (e.g. 'actionable' or 'xml')
+        context: Any other prompt input that affects the answer (e.g. trimmed actionable elements)
+
+    Returns:
+        str: Hex sha256 key
+    """
+    key_material = _canonical_json({
+        "elements": processed_elements or {},
+        "image": image_fingerprint(encoded_image),
+        "config": config_data or {},
+        "os": (os_name or "").lower(),
+        "source": source,
+        "context": context,
+        "prompt": PROMPT_VERSION,
+        "element_format": PROMPT_ELEMENT_FORMAT,
+    })
+    return hashlib.sha256(key_material.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of /invoke responses: an in-memory LRU bounded by entry count
+    and bytes, backed by an optional on-disk tier bounded by bytes. Entries expire
+    after the TTL in both tiers.
+
+    Values are stored as serialized JSON so every hit returns an independent copy.
+    The token usage and routing of the call that produced a response are not stored,
+    so hits do not report the cost of a call they did not make.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, directory=RESPONSE_CACHE_DIR,
+                 disk_max_bytes=RESPONSE_CACHE_DISK_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self._disk_bytes = self._scan_disk() if directory else 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _scan_disk(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _memory_put(self, key, stored_at, payload):
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key)[1])
+            self._memory[key] = (stored_at, payload)
+            self._memory_bytes += len(payload)
+            while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def get(self, key):
+        """
+        Returns (value, age_seconds, tier) for a live entry, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return orjson.loads(payload), now - stored_at, "memory"
+                del self._memory[key]
+                self._memory_bytes -= len(payload)
+                self._stats["expired"] += 1
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    entry = orjson.loads(f.read())
+                if now - entry["stored_at"] <= self.ttl:
+                    payload = _dump_value(entry["value"])
+                    self._memory_put(key, entry["stored_at"], payload)
+                    self._count("disk_hits")
+                    return entry["value"], now - entry["stored_at"], "disk"
+                self._remove_file(path)
+                self._count("expired")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning("Discarding unreadable cache entry %s: %s", key, e)
+                self._remove_file(path)
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        value = {name: item for name, item in value.items() if name not in UNCACHED_FIELDS}
+        stored_at = time.time()
+        payload = _dump_value(value)
+        self._memory_put(key, stored_at, payload)
+        self._count("stores")
+        if self.directory:
+            try:
+                self._disk_put(key, stored_at, value)
+            except Exception as e:
+                logger.warning("Failed to write cache entry %s to disk: %s", key, e)
+
+    def _disk_put(self, key, stored_at, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = _dump_value({"stored_at": stored_at, "value": value})
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._disk_lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._disk_bytes += len(data) - previous
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _remove_file(self, path):
+        with self._disk_lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+
+    def _evict_disk(self):
+        # Caller holds _disk_lock. Drop expired files first, then the oldest ones.
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        target = self.disk_max_bytes * 0.9
+        evicted = 0
+        for mtime, size, path in files:
+            if self._disk_bytes <= target and now - mtime <= self.ttl:
+                continue
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+                evicted += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._stats["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+response_cache = ResponseCache()
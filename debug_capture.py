@@ -0,0 +1,165 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+DEBUG_CAPTURE_DIR = os.getenv("DEBUG_CAPTURE_DIR", "screenshot_combined_debug")
+# Fraction of requests (sampled per run_id, else per request_id) whose annotated image is kept
+DEBUG_CAPTURE_SAMPLE_RATE = float(os.getenv("DEBUG_CAPTURE_SAMPLE_RATE", "0"))
+# Comma separated run ids that are always captured
+DEBUG_CAPTURE_RUN_IDS = {run_id.strip() for run_id in os.getenv("DEBUG_CAPTURE_RUN_IDS", "").split(",") if run_id.strip()}
+DEBUG_CAPTURE_MAX_FILES = int(os.getenv("DEBUG_CAPTURE_MAX_FILES", "500"))
+DEBUG_CAPTURE_MAX_BYTES = int(os.getenv("DEBUG_CAPTURE_MAX_BYTES", str(200 * 1024 * 1024)))
+DEBUG_CAPTURE_MAX_AGE = float(os.getenv("DEBUG_CAPTURE_MAX_AGE", str(24 * 3600)))
+DEBUG_CAPTURE_QUEUE_SIZE = int(os.getenv("DEBUG_CAPTURE_QUEUE_SIZE", "64"))
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def should_capture(request_id=None, run_id=None, requested=None):
+    """
+    Decides whether a request's annotated screenshot is written to disk.
+
+    Args:
+        request_id (str): Request identifier
+        run_id (str): Run identifier; sampling by run keeps whole runs together
+        requested (bool): Explicit per-request switch, overrides sampling when set
+
+    Returns:
+        bool: True if the image should be captured
+    """
+    if requested is not None:
+        return requested
+    if run_id and run_id in DEBUG_CAPTURE_RUN_IDS:
+        return True
+    if DEBUG_CAPTURE_SAMPLE_RATE <= 0:
+        return False
+    if DEBUG_CAPTURE_SAMPLE_RATE >= 1:
+        return True
+    key = run_id or request_id
+    if not key:
+        return False
+    bucket = int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < DEBUG_CAPTURE_SAMPLE_RATE
+
+
+class DebugCapture:
+    """
+    Writes debug images from a background thread with a bounded queue. When the queue
+    is full new captures are dropped rather than slowing the request down. After each
+    write the directory is trimmed to max_files, max_bytes and max_age.
+    """
+
+    def __init__(self, directory=DEBUG_CAPTURE_DIR, max_files=DEBUG_CAPTURE_MAX_FILES,
+                 max_bytes=DEBUG_CAPTURE_MAX_BYTES, max_age=DEBUG_CAPTURE_MAX_AGE,
+                 queue_size=DEBUG_CAPTURE_QUEUE_SIZE):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = None  # deque of (mtime, size, path), oldest first
+        self._bytes = 0
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "errors": 0, "deleted": 0}
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="euporie-debug-capture", daemon=True)
+                    self._thread.start()
+
+    def submit(self, data, extension, request_id=None, run_id=None):
+        """
+        Queues already encoded image bytes for writing. Never blocks.
+
+        Returns:
+            bool: False if the capture was dropped
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        parts = [run_id or "norun", request_id or "noreq", timestamp]
+        filename = "annotated_image_" + "_".join(_UNSAFE_CHARS.sub("-", part) for part in parts) + f".{extension}"
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((filename, data))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        self._files = deque(files)
+        self._bytes = sum(size for _, size, _ in files)
+
+    def _enforce_retention(self):
+        cutoff = time.time() - self.max_age
+        while self._files and (
+            len(self._files) > self.max_files
+            or self._bytes > self.max_bytes
+            or self._files[0][0] < cutoff
+        ):
+            _, size, path = self._files.popleft()
+            self._bytes -= size
+            try:
+                os.remove(path)
+                self.stats["deleted"] += 1
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                filename, data = item
+                if self._files is None:
+                    self._load_index()
+                path = os.path.join(self.directory, filename)
+                with open(path, "wb") as f:
+                    f.write(data)
+                self._files.append((time.time(), len(data), path))
+                self._bytes += len(data)
+                self.stats["written"] += 1
+                self._enforce_retention()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning("Error saving debug capture: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def close(self, timeout=5.0):
+        """
+        Flushes pending captures and stops the writer thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+
+debug_capture = DebugCapture()
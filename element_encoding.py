@@ -0,0 +1,202 @@
+import math
+import os
+
+# "compact" renders elements as a pipe-separated table, "legacy" as Python reprs
+PROMPT_ELEMENT_FORMAT = os.getenv("PROMPT_ELEMENT_FORMAT", "compact").lower()
+# Estimated tokens allowed for each element message of a request; 0 disables pruning
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+
+INPUT_TYPE_MARKERS = (
+    "EditText", "AutoCompleteTextView", "TextField", "SecureTextField", "SearchField",
+    "XCUIElementTypeTextView", "Spinner", "SearchView",
+)
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (about four characters per token for English and markup).
+    Used for budgeting only; no tokenizer files are needed at runtime.
+    """
+    return math.ceil(len(text) / 4)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return str(value).replace("\\", "\\\\").replace("|", "\\|").replace("\n", "\\n")
+
+
+def _short_resource_id(resource_id):
+    # "com.example.app:id/email" -> "email"
+    return resource_id.rsplit(":id/", 1)[-1] if resource_id else ""
+
+
+def _short_bounds(bounds):
+    # "[0,0][100,100]" -> "0,0,100,100"
+    if isinstance(bounds, str) and bounds.startswith("["):
+        return bounds.replace("][", ",").strip("[]")
+    return bounds or ""
+
+
+def has_widget_type(element):
+    """
+    True if the element's widget class or type is known. uiautomator dumps use <node>
+    tags, so a node without a class attribute tells nothing about what it is.
+    """
+    return bool(element.class_name) or element.type not in ("", "node")
+
+
+def is_input_element(element):
+    """
+    True for screen elements that accept text input (edit/text fields, spinners, search).
+    """
+    element_class = f"{element.class_name} {element.type}"
+    return element.password or any(marker in element_class for marker in INPUT_TYPE_MARKERS)
+
+
+def _element_score(element):
+    """
+    Relative value of an element to the model: input fields first, then elements with
+    something readable, then anonymous containers.
+    """
+    if is_input_element(element):
+        return 2
+    if element.text or element.content_desc or element.resource_id or element.description:
+        return 1
+    return 0
+
+
+def _element_type(element):
+    # uiautomator dumps use <node> tags, so fall back to the short class name
+    element_type = element.type
+    if not element_type or element_type == "node":
+        element_type = element.class_name.split(".")[-1]
+    return element_type
+
+
+def _element_row(element_id, element):
+    element_type = _element_type(element)
+    flags = []
+    if element.password:
+        flags.append("pw")
+    if element.enabled is False:
+        flags.append("off")
+    return [
+        element_id,
+        element_type,
+        _short_resource_id(element.resource_id),
+        element.text,
+        element.content_desc if element.content_desc != element.text else "",
+        _short_bounds(element.bounds),
+        " ".join(flags),
+        element.node_id,
+        element.description if element.description not in (element.text, element.content_desc) else "",
+    ]
+
+
+def _render_table(columns, rows):
+    # Drop columns that are empty for every row
+    keep = [index for index in range(len(columns)) if index == 0 or any(row[index] not in ("", None) for row in rows)]
+    lines = ["|".join(columns[index] for index in keep)]
+    lines.extend("|".join(_cell(row[index]) for index in keep) for row in rows)
+    return "\n".join(lines)
+
+
+def _prune(rows, scores, budget, render):
+    """
+    Drops the lowest scoring rows (latest first) until the rendered text fits the budget.
+    Returns the rendered text and the number of rows omitted.
+    """
+    text = render(rows)
+    if not budget or estimate_tokens(text) <= budget:
+        return text, 0
+    order = sorted(range(len(rows)), key=lambda index: (scores[index], -index))
+    dropped = set()
+    for index in order:
+        if scores[index] >= 2:
+            break  # never drop input fields
+        dropped.add(index)
+        # Re-render only occasionally; rows have similar sizes
+        if len(dropped) % 10 == 0 or len(dropped) == len(order):
+            text = render([row for i, row in enumerate(rows) if i not in dropped])
+            if estimate_tokens(text) <= budget:
+                break
+    text = render([row for i, row in enumerate(rows) if i not in dropped])
+    return text, len(dropped)
+
+
+def encode_elements_compact(processed_elements, token_budget=None):
+    """
+    Renders processed screen elements as a compact pipe-separated table.
+
+    Empty and default values are dropped, resource ids lose their package prefix and
+    bounds are written as x1,y1,x2,y2. Actionable elements also carry the crawler's
+    node id and description, so they need no separate list. If the table exceeds the token budget, the
+    least useful non-input elements are omitted and the omission is noted.
+
+    Args:
+        processed_elements (dict): Element id -> ScreenElement (process_xml/process_clickable_elements)
+        token_budget (int): Estimated token limit, defaults to PROMPT_TOKEN_BUDGET
+
+    Returns:
+        str: The encoded table
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    columns = ["id", "type", "rid", "text", "desc", "bounds", "flags", "node", "description"]
+    rows = [_element_row(element_id, element) for element_id, element in processed_elements.items()]
+    scores = [_element_score(element) for element in processed_elements.values()]
+    text, omitted = _prune(rows, scores, budget, lambda kept: _render_table(columns, kept))
+    if omitted:
+        text += f"\n({omitted} of {len(rows)} low-value elements omitted)"
+    return text
+
+
+def encode_actionable_compact(trimmed_elements, token_budget=None):
+    """
+    Renders the output of trim_element_jsons as a compact table; see encode_elements_compact.
+    """
+    if not trimmed_elements:
+        return "none"
+    if not isinstance(trimmed_elements, list) or not all(isinstance(element, dict) for element in trimmed_elements):
+        return str(trimmed_elements)
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    columns = ["node", "type", "desc", "bounds"]
+    rows = [
+        [element.get("node_id"), element.get("element_type"), element.get("description"), _short_bounds(element.get("bounds"))]
+        for element in trimmed_elements
+    ]
+    scores = [
+        2 if any(marker in str(element.get("element_type") or "") for marker in INPUT_TYPE_MARKERS) else int(bool(element.get("description")))
+        for element in trimmed_elements
+    ]
+    text, omitted = _prune(rows, scores, budget, lambda kept: _render_table(columns, kept))
+    if omitted:
+        text += f"\n({omitted} of {len(rows)} low-value elements omitted)"
+    return text
+
+
+def _legacy_dict(element):
+    legacy = element.as_dict()
+    if element.node_id is not None or element.description is not None:
+        legacy.update(node_id=element.node_id, description=element.description)
+    return legacy
+
+
+def format_elements(processed_elements):
+    """
+    Formats processed elements for a prompt according to PROMPT_ELEMENT_FORMAT.
+    """
+    if not isinstance(processed_elements, dict):
+        return f"{processed_elements}"
+    if PROMPT_ELEMENT_FORMAT == "legacy":
+        return f"{ {element_id: _legacy_dict(element) for element_id, element in processed_elements.items()} }"
+    return encode_elements_compact(processed_elements)
+
+
+def format_actionable_elements(trimmed_elements):
+    """
+    Formats trimmed actionable elements for a prompt according to PROMPT_ELEMENT_FORMAT.
+    """
+    if PROMPT_ELEMENT_FORMAT == "legacy":
+        return f"{trimmed_elements}"
+    return encode_actionable_compact(trimmed_elements)
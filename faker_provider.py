@@ -0,0 +1,244 @@
+import inspect
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+from faker import Faker
+
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+FAKER_FIELDS_FILE = os.getenv("FAKER_FIELDS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faker_fields.json"))
+FAKER_LOCALE = os.getenv("FAKER_LOCALE", "en_US")
+# Seeding makes values reproducible for a given request order; it disables the background pools
+FAKER_SEED = os.getenv("FAKER_SEED") or None
+# Values kept ready per (locale, function); 0 disables pre-generation
+FAKER_POOL_SIZE = int(os.getenv("FAKER_POOL_SIZE", "64"))
+# Functions whose pools are filled at startup for the default locale
+FAKER_WARM_FUNCTIONS = [
+    name.strip() for name in os.getenv(
+        "FAKER_WARM_FUNCTIONS",
+        "email,name,first_name,last_name,user_name,password,basic_phone_number,address,city,"
+        "zipcode,country,company,date_of_birth,credit_card_number,sentence",
+    ).split(",") if name.strip()
+]
+
+# Members of the Faker proxy that are listed in faker_fields.json but are not value
+# generators (provider management, seeding, parsing and formatter helpers)
+NON_GENERATORS = {
+    "add_provider", "cache_pattern", "del_arguments", "factories", "format", "generator_attrs",
+    "get_arguments", "get_formatter", "get_providers", "get_words_list", "locales", "optional",
+    "parse", "provider", "providers", "random", "seed", "seed_instance", "seed_locale",
+    "set_arguments", "set_formatter", "unique", "weights",
+}
+# Generators whose output is bytes or files and cannot be used as a field value
+NON_TEXT_GENERATORS = {"binary", "image", "tar", "zip", "json_bytes"}
+
+
+def _load_allowlist(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            names = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Could not load Faker allowlist %s: %s", path, e)
+        return []
+    if not isinstance(names, list):
+        logger.error("Faker allowlist %s must be a JSON list of function names", path)
+        return []
+    return [name for name in names if isinstance(name, str) and not name.startswith("_")]
+
+
+def _takes_no_arguments(func):
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return all(
+        parameter.default is not parameter.empty or parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD)
+        for parameter in parameters
+    )
+
+
+class FakerProvider:
+    """
+    Generates Faker values by function name from a validated allowlist.
+
+    Every locale gets its own Faker instance and a dispatch table of bound callables,
+    built once. Unless the provider is seeded, values are pre-generated into per
+    function pools by a background thread, so requests pop a ready value instead of
+    running Faker; an empty pool falls back to a direct call and schedules a refill.
+    """
+
+    def __init__(self, allowlist_path=FAKER_FIELDS_FILE, default_locale=FAKER_LOCALE,
+                 seed=FAKER_SEED, pool_size=FAKER_POOL_SIZE):
+        self.default_locale = default_locale
+        self.seed = int(seed) if seed is not None else None
+        self.pool_size = 0 if self.seed is not None else pool_size
+        self.allowlist = frozenset(
+            name for name in _load_allowlist(allowlist_path)
+            if name not in NON_GENERATORS and name not in NON_TEXT_GENERATORS
+        )
+        self._lock = threading.Lock()
+        self._tables = {}   # locale -> {function name: bound callable}
+        self._pools = {}    # (locale, function name) -> deque of values
+        self._pending = set()
+        self._unknown_locales = set()
+        self._refills = queue.Queue()
+        self._thread = None
+        self.stats_counters = {"pool_hits": 0, "pool_misses": 0, "generated": 0, "refills": 0, "errors": 0}
+
+    def _build_table(self, locale):
+        fake = Faker(locale)
+        if self.seed is not None:
+            fake.seed_instance(self.seed)
+        table = {}
+        for name in self.allowlist:
+            try:
+                func = getattr(fake, name)
+            except Exception:
+                continue
+            if callable(func) and _takes_no_arguments(func):
+                table[name] = func
+        return table
+
+    def functions(self, locale=None):
+        """
+        Returns the dispatch table for a locale, creating it on first use.
+
+        Raises:
+            ValueError: If Faker does not know the locale
+        """
+        locale = locale or self.default_locale
+        table = self._tables.get(locale)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(locale)
+                if table is None:
+                    try:
+                        table = self._build_table(locale)
+                    except AttributeError as e:
+                        raise ValueError(f"Unsupported Faker locale: {locale}") from e
+                    self._tables[locale] = table
+                    logger.info("Built Faker dispatch table for %s with %d functions", locale, len(table))
+        return table
+
+    def supports(self, name, locale=None):
+        """
+        True if name is an allowed generator for the locale (default locale if None).
+        """
+        return name in self._resolve(locale)[1]
+
+    def _resolve(self, locale):
+        # Unknown locales fall back to the default one, with a single warning each
+        locale = locale or self.default_locale
+        if locale not in self._unknown_locales:
+            try:
+                return locale, self.functions(locale)
+            except ValueError:
+                self._unknown_locales.add(locale)
+                logger.warning("Unknown Faker locale %s, using %s", locale, self.default_locale)
+        return self.default_locale, self.functions(self.default_locale)
+
+    def generate(self, name, locale=None):
+        """
+        Returns a value of the Faker function `name`, from the pool when one is ready.
+
+        Args:
+            name (str): Faker function name
+            locale (str): Faker locale, defaults to FAKER_LOCALE
+
+        Returns:
+            The generated value
+
+        Raises:
+            KeyError: If name is not an allowed generator
+        """
+        locale, table = self._resolve(locale)
+        func = table[name]
+        if not self.pool_size:
+            if self.seed is not None:
+                # Serialize seeded calls so concurrent requests cannot interleave inside Faker's generator
+                with self._lock:
+                    return func()
+            return func()
+
+        key = (locale, name)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools.setdefault(key, deque())
+        try:
+            value = pool.popleft()
+            self.stats_counters["pool_hits"] += 1
+        except IndexError:
+            self.stats_counters["pool_misses"] += 1
+            value = func()
+        if len(pool) < self.pool_size // 2:
+            self._schedule_refill(key)
+        return value
+
+    def _schedule_refill(self, key):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="euporie-faker-pool", daemon=True)
+                self._thread.start()
+        self._refills.put(key)
+
+    def _run(self):
+        while True:
+            key = self._refills.get()
+            if key is None:
+                return
+            locale, name = key
+            try:
+                func = self.functions(locale)[name]
+                pool = self._pools[key]
+                while len(pool) < self.pool_size:
+                    pool.append(func())
+                    self.stats_counters["generated"] += 1
+                self.stats_counters["refills"] += 1
+            except Exception as e:
+                self.stats_counters["errors"] += 1
+                logger.warning("Faker pool refill failed for %s/%s: %s", locale, name, e)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def warm(self, names=None, locale=None):
+        """
+        Schedules pools for the given functions (FAKER_WARM_FUNCTIONS by default) to be filled.
+        """
+        if not self.pool_size:
+            return
+        locale = locale or self.default_locale
+        table = self.functions(locale)
+        for name in names if names is not None else FAKER_WARM_FUNCTIONS:
+            if name in table:
+                self._pools.setdefault((locale, name), deque())
+                self._schedule_refill((locale, name))
+
+    def close(self, timeout=5.0):
+        """
+        Stops the refill thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._refills.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            **self.stats_counters,
+            "seeded": self.seed is not None,
+            "pool_size": self.pool_size,
+            "allowed_functions": len(self.allowlist),
+            "locales": sorted(self._tables),
+            "pooled_values": sum(len(pool) for pool in self._pools.values()),
+        }
+
+
+faker_provider = FakerProvider()
@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+
+from element_encoding import has_widget_type, is_input_element
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+# "all" also answers screens whose every input field is recognized by FIELD_RULES,
+# "none" answers only screens without input fields
+FAST_PATH_FIELDS = os.getenv("FAST_PATH_FIELDS", "all").lower()
+
+# Field type (also the Faker function) -> how the field is recognized. Keywords are
+# matched against the words of the resource id and content description; config keys
+# are the config_data entries that fill the field instead of Faker.
+FIELD_RULES = {
+    "email": {
+        "input_type": "email",
+        "keywords": {"email", "mail", "emailaddress"},
+        "config_keys": ("email", "email_address", "mail"),
+    },
+    "password": {
+        "input_type": "password",
+        "keywords": {"password", "passwd", "pwd", "passcode"},
+        "config_keys": ("password", "pwd"),
+    },
+    "basic_phone_number": {
+        "input_type": "phone",
+        "keywords": {"phone", "mobile", "tel", "telephone", "phonenumber", "msisdn"},
+        "config_keys": ("phone", "phone_number", "mobile", "basic_phone_number"),
+    },
+}
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_CAMEL_BOUNDARY = re.compile(r"([a-z0-9])([A-Z])")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def element_words(element):
+    """
+    The lowercase words of an element's resource id and content description:
+    "com.example:id/userEmail" -> {"user", "email"}.
+    """
+    words = set()
+    for value in (element.resource_id, element.content_desc):
+        if value:
+            value = value.rsplit(":id/", 1)[-1]
+            words.update(word for word in _NON_WORD.split(_CAMEL_BOUNDARY.sub(r"\1 \2", value).lower()) if word)
+    return words
+
+
+def field_type(element):
+    """
+    The FIELD_RULES type of an input element, or None if it is not recognized or ambiguous
+    (for example "email_or_phone").
+    """
+    words = element_words(element)
+    matches = [name for name, rule in FIELD_RULES.items() if words & rule["keywords"]]
+    if not matches and element.password and not words:
+        # A secure field without any name; named ones (CVC, PIN) are left to the model
+        matches = ["password"]
+    return matches[0] if len(matches) == 1 else None
+
+
+def _config_value(name, config_data):
+    if not config_data:
+        return None
+    values = {str(key).lower(): value for key, value in config_data.items()}
+    for key in FIELD_RULES[name]["config_keys"]:
+        if values.get(key) not in (None, ""):
+            return values[key]
+    if name == "email":
+        # Email addresses are used for email fields regardless of the config key
+        for value in values.values():
+            if isinstance(value, str) and EMAIL_PATTERN.match(value):
+                return value
+    return None
+
+
+class FastPath:
+    """
+    Deterministic pre-classifier that answers obvious screens without the LLM: screens
+    without input fields, and (with FAST_PATH_FIELDS=all) screens whose input fields
+    are all email, password or phone fields.
+    """
+
+    def __init__(self, enabled=FAST_PATH_ENABLED, fields=FAST_PATH_FIELDS):
+        self.enabled = enabled
+        self.fields = fields
+        self._lock = threading.Lock()
+        self.stats_counters = {"no_inputs": 0, "known_fields": 0, "unknown_fields": 0, "untyped_elements": 0,
+                               "no_elements": 0}
+
+    def _count(self, reason):
+        with self._lock:
+            self.stats_counters[reason] += 1
+
+    def classify(self, processed_elements, config_data=None):
+        """
+        Answers a screen locally if it is obvious.
+
+        Args:
+            processed_elements (dict): Output of process_xml or process_clickable_elements
+            config_data (dict): The request's config data
+
+        Returns:
+            tuple: (agent_response, reason). agent_response is None when the screen needs
+            the LLM; Faker fields carry their faker_function and no value yet.
+        """
+        if not getattr(processed_elements, "parsed", False):
+            # Screenshot only, or XML that could not be downloaded or parsed: nothing
+            # to decide on, and an empty screen here does not mean one without inputs
+            self._count("no_elements")
+            return None, "no_elements"
+
+        if not all(has_widget_type(element) for element in processed_elements.values()):
+            # Any of them may be an input field; only the model can tell
+            self._count("untyped_elements")
+            return None, "untyped_elements"
+
+        inputs = [(element_id, element) for element_id, element in processed_elements.items() if is_input_element(element)]
+        if not inputs:
+            self._count("no_inputs")
+            return {"data_generation_required": False, "fields": [],
+                    "reason": "No input fields on screen (rule-based)"}, "no_inputs"
+
+        types = [field_type(element) for _, element in inputs]
+        if self.fields != "all" or None in types:
+            self._count("unknown_fields")
+            return None, "unknown_fields"
+
+        fields = []
+        for (element_id, element), name in zip(inputs, types):
+            field = {
+                "id": element_id,
+                "field_name": name if name != "basic_phone_number" else "phone",
+                "input_type": FIELD_RULES[name]["input_type"],
+                "type": name,
+                "context": "Recognized from the element's resource id, description or password flag",
+            }
+            value = _config_value(name, config_data)
+            if value is not None:
+                field.update(value=value, source="config")
+            else:
+                field.update(value=None, source="faker", faker_function=name)
+            fields.append(field)
+        self._count("known_fields")
+        return {"data_generation_required": True, "fields": fields,
+                "reason": "Every input field is an email, password or phone field (rule-based)"}, "known_fields"
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.stats_counters)
+        hits = counters["no_inputs"] + counters["known_fields"]
+        total = hits + counters["unknown_fields"] + counters["untyped_elements"] + counters["no_elements"]
+        return {"enabled": self.enabled, "fields": self.fields, **counters,
+                "hit_rate": round(hits / total, 4) if total else None}
+
+
+fast_path = FastPath()
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import hashlib
+from io import BytesIO
+
+from PIL import Image
+
+
+class ImagePayload:
+    """
+    A screenshot as it moves through the pipeline. Holds the raw bytes and creates
+    the base64 string and the Pillow image lazily, caching both, so every payload
+    is decoded and encoded at most once per request.
+    """
+
+    __slots__ = ("_raw", "_base64", "_image", "_digest")
+
+    def __init__(self, raw=None, base64_string=None):
+        if raw is None and base64_string is None:
+            raise ValueError("ImagePayload needs raw bytes or a base64 string")
+        self._raw = raw
+        self._base64 = base64_string
+        self._image = None
+        self._digest = None
+
+    @classmethod
+    def from_base64(cls, base64_string):
+        """
+        Decodes and validates a base64 payload: a str, or bytes-like data (bytes,
+        bytearray, memoryview) such as a slice of a request body. Decoding reads the
+        input in place; base64.b64decode would first copy a str into ASCII bytes. A
+        data URL prefix ("data:image/png;base64,") is skipped.
+
+        Raises:
+            ValueError: If the data is not valid base64
+        """
+        data = base64_string
+        try:
+            if isinstance(data, str):
+                if data.startswith("data:"):
+                    data = data[data.index(",") + 1:]
+            else:
+                data = memoryview(data).cast("B")
+                if data[:5] == b"data:":
+                    # A view past the prefix, without copying the payload
+                    data = data[bytes(data[:256]).index(b",") + 1:]
+            raw = binascii.a2b_base64(data)
+        except Exception as e:
+            raise ValueError("Invalid base64 image data") from e
+        # The string is kept for sending on; bytes-like input is re-encoded if needed
+        return cls(raw=raw, base64_string=data if isinstance(data, str) else None)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(raw=bytes(data))
+
+    @classmethod
+    def coerce(cls, value):
+        """
+        Accepts an ImagePayload, a base64 string, raw bytes or None.
+        """
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return cls.from_bytes(value)
+        return cls(base64_string=value)
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = binascii.a2b_base64(self._base64)
+        return self._raw
+
+    @property
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._raw).decode()
+        return self._base64
+
+    @property
+    def image(self):
+        """
+        The decoded Pillow image. Shared, so callers must not draw on it.
+        """
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.raw))
+        return self._image
+
+    def open(self):
+        """
+        Returns a fresh, not yet loaded Pillow image over the raw bytes. Useful when the
+        caller wants draft-mode decoding or intends to modify the image.
+        """
+        return Image.open(BytesIO(self.raw))
+
+    @property
+    def digest(self):
+        """
+        sha256 of the raw image bytes.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.raw).hexdigest()
+        return self._digest
+
+    @property
+    def size_bytes(self):
+        return len(self.raw)
+
+    def __bool__(self):
+        return True
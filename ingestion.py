@@ -0,0 +1,165 @@
+import os
+import zlib
+
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import zstandard
+except ImportError:  # zstd request bodies are then refused with 415
+    zstandard = None
+
+# Largest request body accepted after decompression
+INGEST_MAX_BODY_MB = float(os.getenv("INGEST_MAX_BODY_MB", "64"))
+MAX_BODY_BYTES = int(INGEST_MAX_BODY_MB * 2**20)
+
+
+class _ZlibStream:
+    # gzip and deflate; max_length bounds each step, so a small bomb cannot expand at once
+    def __init__(self, wbits):
+        self._decompressor = zlib.decompressobj(wbits)
+
+    def decompress(self, data, limit):
+        output = self._decompressor.decompress(data, limit + 1)
+        if self._decompressor.unconsumed_tail:
+            return None
+        return output
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+# Most a zstd block expands per compressed byte: a 128 KiB run-length block takes 4 bytes
+ZSTD_MAX_EXPANSION = 128 * 1024 // 4
+ZSTD_MIN_STEP = 64
+
+
+class _ZstdStream:
+    # decompressobj has no output bound, so the input is fed in slices small enough that
+    # even a run-length bomb cannot expand much past what is left of the limit
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data, limit):
+        output = bytearray()
+        view = memoryview(data)
+        while view:
+            step = max(ZSTD_MIN_STEP, (limit - len(output)) // ZSTD_MAX_EXPANSION)
+            output += self._decompressor.decompress(view[:step])
+            view = view[step:]
+            if len(output) > limit:
+                return None
+        return bytes(output)
+
+    def flush(self):
+        return b""
+
+
+def _decompressor(encoding):
+    if encoding in ("gzip", "x-gzip"):
+        return _ZlibStream(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return _ZlibStream(zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdStream()
+    return None
+
+
+class DecompressionMiddleware:
+    """
+    ASGI middleware that decompresses gzip, deflate and zstd request bodies chunk by
+    chunk while the endpoint reads them, so the compressed body is never held as a
+    whole. Endpoints see a plain body without Content-Encoding and Content-Length.
+    Bodies that decompress to more than INGEST_MAX_BODY_MB are answered with 413.
+    """
+
+    def __init__(self, app, max_body=MAX_BODY_BYTES):
+        self.app = app
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"content-encoding":
+                encoding = value.decode("latin-1").strip().lower()
+        if not encoding or encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+        stream = _decompressor(encoding)
+        if stream is None:
+            response = JSONResponse({"detail": f"Unsupported Content-Encoding: {encoding}"}, status_code=415)
+            await response(scope, receive, send)
+            return
+
+        scope = dict(scope, headers=[(name, value) for name, value in scope["headers"]
+                                     if name not in (b"content-encoding", b"content-length")])
+        received = 0
+
+        async def receive_decompressed():
+            nonlocal received
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            try:
+                body = stream.decompress(message.get("body", b""), self.max_body - received)
+                if body is not None and not message.get("more_body", False):
+                    body += stream.flush()
+            except Exception as e:
+                # zlib.error or zstandard.ZstdError
+                raise HTTPException(status_code=400, detail=f"Invalid {encoding} request body: {e}")
+            if body is None or received + len(body) > self.max_body:
+                raise HTTPException(status_code=413, detail="Request body too large after decompression")
+            received += len(body)
+            return {**message, "body": body}
+
+        await self.app(scope, receive_decompressed, send)
+
+
+class ORJSONRequest(Request):
+    """
+    Request that reads its body into a single buffer (instead of a list of chunks
+    joined at the end, which briefly doubles a large body) and parses JSON with orjson.
+    Once parsed, the buffer is emptied: FastAPI holds on to the raw body for the whole
+    request, next to the decoded strings, so body() returns nothing after json().
+    """
+
+    async def body(self):
+        if not hasattr(self, "_body"):
+            # Filled in place when the size is announced; a buffer grown chunk by chunk
+            # leaves its earlier, smaller copies behind in the heap
+            length = self.headers.get("content-length", "")
+            body = bytearray(min(int(length), MAX_BODY_BYTES)) if length.isdigit() else bytearray()
+            received = 0
+            async for chunk in self.stream():
+                body[received:received + len(chunk)] = chunk
+                received += len(chunk)
+            del body[received:]
+            self._body = body
+        return self._body
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            self._json = orjson.loads(body)
+            if isinstance(body, bytearray):
+                body.clear()
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """
+    Route class whose JSON request bodies go through ORJSONRequest.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def orjson_route_handler(request):
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_route_handler
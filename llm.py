@@ -1,12 +1,345 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import openai
 from langchain_openai import ChatOpenAI
 
-def initialize_llm(OPENAI_API_KEY):
+from llm_scheduler import LLMScheduler
+
+# Pool configuration, read once at import. Timeouts are in seconds.
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+# OpenAI-compatible endpoint, e.g. the stub server in benchmarks/ for offline runs
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Retries go back through the scheduler, so a 429 waits for its Retry-After like every
+# other call; other failures wait LLM_RETRY_BACKOFF seconds, doubled per retry
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "32"))
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class PooledLLM:
+    """
+    Long-lived wrapper around a ChatOpenAI client that owns its HTTP connection
+    pools and caps the number of concurrent calls.
+
+    invoke/ainvoke/astream first wait for rate limit budget (see llm_scheduler.py),
+    then for a free slot before calling the model; every other attribute is
+    delegated to the underlying ChatOpenAI instance. The SDK does not retry on its
+    own: a retryable failure (429, 5xx, connection error) is retried up to
+    LLM_MAX_RETRIES times through the scheduler, and a stream only before its
+    first chunk.
+    """
+
+    def __init__(self, model, api_key, key_id):
+        self.model = model
+        self.key_id = key_id
+        self.max_in_flight = LLM_MAX_INFLIGHT
+        self.scheduler = LLMScheduler()
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        self.client = ChatOpenAI(
+            model=model,
+            temperature=0,
+            max_tokens=None,
+            timeout=LLM_TIMEOUT,
+            max_retries=0,
+            api_key=api_key,
+            base_url=LLM_BASE_URL,
+            stream_usage=True,
+            # Every provider response feeds its rate-limit headers to the scheduler
+            http_client=httpx.Client(timeout=timeout, limits=limits,
+                                     event_hooks={"response": [self._observe_response]}),
+            http_async_client=httpx.AsyncClient(timeout=timeout, limits=limits,
+                                                event_hooks={"response": [self._aobserve_response]}),
+        )
+        self._sync_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "waiting": 0,
+            "calls": 0,
+            "saturated_calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "wait_seconds_total": 0.0,
+            "call_seconds_total": 0.0,
+            # Provider-side prompt caching
+            "input_tokens_total": 0,
+            "cached_tokens_total": 0,
+            "output_tokens_total": 0,
+            "cache_hit_calls": 0,
+            "cache_hit_seconds_total": 0.0,
+            "cache_miss_seconds_total": 0.0,
+            "streams": 0,
+            "cache_hit_streams": 0,
+            "cache_hit_ttft_seconds_total": 0.0,
+            "cache_miss_ttft_seconds_total": 0.0,
+        }
+
+    def __getattr__(self, name):
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def _observe_response(self, response):
+        self.scheduler.observe(response.status_code, response.headers)
+
+    async def _aobserve_response(self, response):
+        self.scheduler.observe(response.status_code, response.headers)
+
+    def _async_semaphore(self):
+        # asyncio primitives are bound to one event loop, so keep one per loop
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_slots.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._async_slots[loop] = semaphore
+        return semaphore
+
+    def _enter(self, waited):
+        with self._stats_lock:
+            self._stats["waiting"] -= 1
+            self._stats["in_flight"] += 1
+            self._stats["calls"] += 1
+            self._stats["wait_seconds_total"] += waited
+            if waited > 0.001:
+                self._stats["saturated_calls"] += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    def _exit(self, elapsed, error=None):
+        with self._stats_lock:
+            self._stats["in_flight"] -= 1
+            self._stats["call_seconds_total"] += elapsed
+            if error is not None:
+                self._stats["errors"] += 1
+                if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)) or "timeout" in type(error).__name__.lower():
+                    self._stats["timeouts"] += 1
+
+    def _record_usage(self, usage, elapsed, ttft=None):
+        if not usage:
+            return
+        hit = usage["cached_tokens"] > 0
+        with self._stats_lock:
+            self._stats["input_tokens_total"] += usage["input_tokens"]
+            self._stats["cached_tokens_total"] += usage["cached_tokens"]
+            self._stats["output_tokens_total"] += usage["output_tokens"]
+            self._stats["cache_hit_calls"] += hit
+            self._stats["cache_hit_seconds_total" if hit else "cache_miss_seconds_total"] += elapsed
+            if ttft is not None:
+                self._stats["streams"] += 1
+                self._stats["cache_hit_streams"] += hit
+                self._stats["cache_hit_ttft_seconds_total" if hit else "cache_miss_ttft_seconds_total"] += ttft
+
+    def _queued(self):
+        with self._stats_lock:
+            self._stats["waiting"] += 1
+
+    def _retry_delay(self, error, retry):
+        # Seconds to wait before the given retry (1-based) of a failed call, or None if
+        # it is not retried. A 429 has already paused the scheduler for its Retry-After.
+        if retry > LLM_MAX_RETRIES or not is_retryable(error):
+            return None
+        with self._stats_lock:
+            self._stats["retries"] += 1
+        if getattr(error, "status_code", None) == 429:
+            return 0.0
+        return LLM_RETRY_BACKOFF * 2 ** (retry - 1)
+
+    def invoke(self, messages, **kwargs):
+        for retry in itertools.count(1):
+            reserved = self.scheduler.acquire_blocking(messages)
+            self._queued()
+            start = time.perf_counter()
+            self._sync_slots.acquire()
+            started = time.perf_counter()
+            self._enter(started - start)
+            try:
+                result = self.client.invoke(messages, **kwargs)
+            except Exception as e:
+                self._exit(time.perf_counter() - started, e)
+                delay = self._retry_delay(e, retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            finally:
+                self._sync_slots.release()
+            elapsed = time.perf_counter() - started
+            self._exit(elapsed)
+            usage = extract_usage(result)
+            self.scheduler.settle(reserved, usage)
+            self._record_usage(usage, elapsed)
+            return result
+
+    async def ainvoke(self, messages, timeout=None, **kwargs):
+        """
+        Awaits the model with an optional per-call timeout (defaults to LLM_TIMEOUT),
+        which starts once the call is admitted and covers each try separately.
+        """
+        for retry in itertools.count(1):
+            reserved = await self.scheduler.acquire(messages)
+            semaphore = self._async_semaphore()
+            self._queued()
+            start = time.perf_counter()
+            await semaphore.acquire()
+            started = time.perf_counter()
+            self._enter(started - start)
+            try:
+                result = await asyncio.wait_for(self.client.ainvoke(messages, **kwargs), timeout or LLM_TIMEOUT)
+            except BaseException as e:
+                # Cancellation frees the slot but is not counted as an error
+                self._exit(time.perf_counter() - started, e if isinstance(e, Exception) else None)
+                delay = self._retry_delay(e, retry) if isinstance(e, Exception) else None
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                semaphore.release()
+            elapsed = time.perf_counter() - started
+            self._exit(elapsed)
+            usage = extract_usage(result)
+            self.scheduler.settle(reserved, usage)
+            self._record_usage(usage, elapsed)
+            return result
+
+    async def astream(self, messages, **kwargs):
+        """
+        Streams message chunks while holding an in-flight slot for the whole stream.
+        """
+        for retry in itertools.count(1):
+            reserved = await self.scheduler.acquire(messages)
+            semaphore = self._async_semaphore()
+            self._queued()
+            start = time.perf_counter()
+            await semaphore.acquire()
+            started = time.perf_counter()
+            self._enter(started - start)
+            error = None
+            ttft = None
+            usage = None
+            streamed = False
+            try:
+                async for chunk in self.client.astream(messages, **kwargs):
+                    if ttft is None and chunk.content:
+                        ttft = time.perf_counter() - started
+                    usage = extract_usage(chunk) or usage
+                    streamed = True
+                    yield chunk
+            except BaseException as e:
+                error = e if isinstance(e, Exception) else None
+                delay = self._retry_delay(error, retry) if error is not None and not streamed else None
+                if delay is None:
+                    raise
+            finally:
+                semaphore.release()
+                elapsed = time.perf_counter() - started
+                self._exit(elapsed, error)
+                if error is None:
+                    self.scheduler.settle(reserved, usage)
+                    self._record_usage(usage, elapsed, ttft if ttft is not None else elapsed)
+            if error is None:
+                return
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["model"] = self.model
+        stats["key_id"] = self.key_id
+        stats["max_in_flight"] = self.max_in_flight
+        stats["saturation"] = stats["in_flight"] / self.max_in_flight if self.max_in_flight else 0.0
+        stats["prefix_cache_hit_rate"] = stats["cached_tokens_total"] / stats["input_tokens_total"] if stats["input_tokens_total"] else 0.0
+        stats["scheduler"] = self.scheduler.stats()
+        return stats
+
+
+def is_retryable(error):
+    """
+    Whether a failed call may be retried: connection errors and timeouts of the
+    provider, and the statuses the OpenAI SDK retries (408, 409, 429 and 5xx).
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(error, openai.APIStatusError) and (status in (408, 409, 429) or status >= 500)
+
+
+def extract_usage(message):
+    """
+    Reads token usage, including the provider's cached prompt tokens, from an AI message
+    or message chunk.
+
+    Returns:
+        dict: input_tokens, cached_tokens and output_tokens, or None if the message has no usage
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    details = usage.get("input_token_details") or {}
+    cached_tokens = details.get("cache_read") or 0
+    if not cached_tokens:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_tokens": cached_tokens,
+        "output_tokens": usage.get("output_tokens", 0),
+    }
+
+
+def get_llm(api_key, model=None):
+    """
+    Returns the process-wide pooled client for (model, api_key), creating it on first use.
+
+    Args:
+        api_key (str): OpenAI API key
+        model (str): Model name, defaults to LLM_MODEL
+
+    Returns:
+        PooledLLM: The shared client
+    """
+    model = model or LLM_MODEL
+    key_id = hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    registry_key = (model, key_id)
+    llm = _registry.get(registry_key)
+    if llm is None:
+        with _registry_lock:
+            llm = _registry.get(registry_key)
+            if llm is None:
+                llm = PooledLLM(model, api_key, key_id)
+                _registry[registry_key] = llm
+    return llm
+
+
+def pool_stats():
+    """
+    Returns saturation metrics for every pooled client.
+    """
+    return [llm.stats() for llm in list(_registry.values())]
+
+
+def initialize_llm(OPENAI_API_KEY, model=None):
 
-    return ChatOpenAI(
-        model="gpt-4o",
-        temperature=0,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=OPENAI_API_KEY,
-    )
\ No newline at end of file
+    return get_llm(OPENAI_API_KEY, model)
@@ -0,0 +1,362 @@
+import asyncio
+import base64
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from element_encoding import estimate_tokens
+from logger_config import setup_logger
+from metrics import record_stage, llm_queue_depth, llm_queue_wait_seconds, llm_rate_limited
+
+logger = setup_logger()
+
+# Provider budgets per minute; 0 means unknown until the rate-limit headers report it
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+# Tokens reserved for the completion until the call reports its usage
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "500"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+PRIORITY_NAMES = {rank: name for name, rank in PRIORITIES.items()}
+# Priority of the LLM calls made by the current request; batch work runs at "low"
+llm_priority = contextvars.ContextVar("euporie_llm_priority", default="normal")
+
+# Base64 characters decoded to read an image's size from its header
+IMAGE_HEADER_CHARS = 16384
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def estimate_image_tokens(width, height):
+    """
+    Input tokens of an image in high detail: it is fit into 2048x2048, scaled down to a
+    shortest side of 768 and billed 170 tokens per 512px tile plus 85.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _image_size(url):
+    # Only the start of a data URL is decoded; Pillow reads the size from the header
+    if not url.startswith("data:"):
+        return None
+    header = url.partition(",")[2][:IMAGE_HEADER_CHARS]
+    try:
+        with Image.open(BytesIO(base64.b64decode(header[:len(header) // 4 * 4]))) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def estimate_message_tokens(messages):
+    """
+    Estimates the prompt tokens of assembled chat messages, including their images.
+
+    Args:
+        messages (list): (role, content) tuples or message objects
+
+    Returns:
+        int: Estimated input tokens
+    """
+    tokens = 0
+    for message in messages:
+        content = message[1] if isinstance(message, tuple) else getattr(message, "content", "")
+        tokens += 4  # per-message framing
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for part in content or ():
+            if part.get("type") == "text":
+                tokens += estimate_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                size = _image_size(part.get("image_url", {}).get("url", ""))
+                # Unknown sizes count as a full-height phone screenshot
+                tokens += estimate_image_tokens(*size) if size else estimate_image_tokens(1080, 2340)
+    return tokens
+
+
+def parse_duration(value):
+    """
+    Parses the provider's reset durations: "1s", "6m0s", "20ms" -> seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts) if parts else None
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A budget of `limit` units per `period` seconds that refills continuously. A limit
+    of 0 never blocks.
+    """
+
+    def __init__(self, limit, period=60.0):
+        self.limit = limit
+        self.period = period
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.limit:
+            self.level = min(self.limit, self.level + (now - self.updated) * self.limit / self.period)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """
+        Seconds until amount is available. A call larger than the whole budget waits for a full bucket.
+        """
+        if not self.limit:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.limit)
+        return 0.0 if self.level >= amount else (amount - self.level) * self.period / self.limit
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def give_back(self, amount, now):
+        self._refill(now)
+        self.level = min(self.limit, self.level + amount) if self.limit else self.level
+
+    def observe(self, limit, remaining, now):
+        """
+        Adopts the provider's view: its limit if none was configured (or it is lower),
+        and its remaining budget whenever that is lower than ours.
+        """
+        if limit and (not self.limit or limit < self.limit):
+            # First report, or lower than the configured limit
+            self.level = float(limit) if not self.limit else min(self.level, limit)
+            self.limit = limit
+        if remaining is not None and self.limit:
+            self._refill(now)
+            self.level = min(self.level, float(remaining))
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future", "loop", "queued")
+
+    def __init__(self, priority, seq, tokens, future, loop):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.loop = loop
+        self.queued = time.perf_counter()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Admits LLM calls within the provider's requests-per-minute and tokens-per-minute
+    budgets. Calls that do not fit wait in a priority queue (high, normal, low; FIFO
+    within a priority) instead of being sent and rejected with 429.
+
+    The budgets follow the provider's x-ratelimit-* response headers, and a 429 pauses
+    all admissions for its Retry-After, so one rejected call slows every caller down
+    rather than each of them retrying on its own.
+    """
+
+    def __init__(self, rpm=LLM_RPM_LIMIT, tpm=LLM_TPM_LIMIT, output_tokens=LLM_OUTPUT_TOKEN_ESTIMATE):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.output_tokens = output_tokens
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+        self.stats_counters = {"admitted": 0, "queued": 0, "wait_seconds_total": 0.0, "rate_limited": 0,
+                               "header_updates": 0, "cancelled": 0}
+
+    def _delay(self, tokens, now):
+        return max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+    def _take(self, tokens, now):
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self.stats_counters["admitted"] += 1
+
+    def _depth(self, rank):
+        llm_queue_depth.set(sum(1 for waiter in self._waiters if waiter.priority == rank and not waiter.future.done()),
+                            priority=PRIORITY_NAMES[rank])
+
+    def _waited(self, priority, seconds):
+        self.stats_counters["wait_seconds_total"] += seconds
+        llm_queue_wait_seconds.observe(seconds, priority=priority)
+        record_stage("llm_queue", seconds)
+
+    async def acquire(self, messages, priority=None):
+        """
+        Waits until the call fits the budgets and reserves them.
+
+        Args:
+            messages (list): The assembled messages, used to estimate the call's tokens
+            priority (str): "high", "normal" or "low"; defaults to the request's llm_priority
+
+        Returns:
+            int: The tokens reserved, to be passed to settle()
+        """
+        priority = priority or llm_priority.get()
+        if priority not in PRIORITIES:
+            priority = "normal"
+        rank = PRIORITIES[priority]
+        tokens = estimate_message_tokens(messages) + self.output_tokens
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = time.monotonic()
+            if not self._waiters and self._delay(tokens, now) <= 0:
+                self._take(tokens, now)
+                self._waited(priority, 0.0)
+                return tokens
+            waiter = _Waiter(rank, next(self._seq), tokens, loop.create_future(), loop)
+            heapq.heappush(self._waiters, waiter)
+            self.stats_counters["queued"] += 1
+            self._depth(rank)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                self.stats_counters["cancelled"] += 1
+                self._depth(rank)
+            self._dispatch()
+            raise
+        self._waited(priority, time.perf_counter() - waiter.queued)
+        return tokens
+
+    def acquire_blocking(self, messages):
+        """
+        Blocking variant of acquire for synchronous callers; they are admitted only
+        while no asynchronous call is queued.
+        """
+        tokens = estimate_message_tokens(messages) + self.output_tokens
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._delay(tokens, now)
+                if delay <= 0 and not self._waiters:
+                    self._take(tokens, now)
+                    break
+            time.sleep(min(max(delay, 0.05), 1.0))
+        self._waited("normal", time.perf_counter() - start)
+        return tokens
+
+    def _dispatch(self):
+        # Admits queued calls in priority order while the budgets allow. Runs on the
+        # event loop of the waiting calls.
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._waiters:
+                waiter = self._waiters[0]
+                if waiter.future.done():
+                    heapq.heappop(self._waiters)
+                    continue
+                now = time.monotonic()
+                delay = self._delay(waiter.tokens, now)
+                if delay > 0:
+                    self._timer = waiter.loop.call_later(delay, self._dispatch)
+                    break
+                heapq.heappop(self._waiters)
+                self._take(waiter.tokens, now)
+                waiter.loop.call_soon_threadsafe(self._admit, waiter)
+                self._depth(waiter.priority)
+
+    def _admit(self, waiter):
+        if waiter.future.done():
+            # Cancelled after it was admitted: its budget goes back
+            self.settle(waiter.tokens, None, admitted=False)
+            return
+        waiter.future.set_result(None)
+
+    def settle(self, reserved, usage, admitted=True):
+        """
+        Replaces a call's token estimate by its actual usage once it is known.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not admitted:
+                self.requests.give_back(1, now)
+                self.tokens.give_back(reserved, now)
+            elif usage:
+                self.tokens.give_back(reserved - usage["input_tokens"] - usage["output_tokens"], now)
+            loop = self._waiters[0].loop if self._waiters else None
+        if loop is not None:
+            # Synchronous calls settle on worker threads
+            loop.call_soon_threadsafe(self._dispatch)
+
+    def observe(self, status_code, headers):
+        """
+        Updates the budgets from a provider response's rate-limit headers; a 429 pauses
+        admissions until its Retry-After has passed.
+        """
+        limit_requests = _header_int(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_int(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        with self._lock:
+            now = time.monotonic()
+            if limit_requests or remaining_requests is not None:
+                self.requests.observe(limit_requests, remaining_requests, now)
+                self.stats_counters["header_updates"] += 1
+            if limit_tokens or remaining_tokens is not None:
+                self.tokens.observe(limit_tokens, remaining_tokens, now)
+            if status_code == 429:
+                retry_after = None
+                if headers.get("retry-after-ms"):
+                    retry_after = (parse_duration(headers["retry-after-ms"]) or 0) / 1000
+                elif headers.get("retry-after"):
+                    retry_after = parse_duration(headers["retry-after"])
+                if retry_after is None:
+                    resets = [parse_duration(headers.get(name)) for name in
+                              ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+                    retry_after = max([reset for reset in resets if reset is not None], default=1.0)
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self.stats_counters["rate_limited"] += 1
+                llm_rate_limited.inc()
+                logger.warning("LLM provider rate limit hit, pausing admissions for %.2fs", retry_after)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests.delay(0, now)
+            self.tokens.delay(0, now)
+            queued = [waiter for waiter in self._waiters if not waiter.future.done()]
+            return {
+                **self.stats_counters,
+                "rpm_limit": self.requests.limit,
+                "tpm_limit": self.tokens.limit,
+                "requests_available": round(self.requests.level, 2) if self.requests.limit else None,
+                "tokens_available": round(self.tokens.level) if self.tokens.limit else None,
+                "paused_for": round(max(0.0, self.paused_until - now), 3),
+                "queue_depth": {name: sum(1 for waiter in queued if waiter.priority == rank)
+                                for name, rank in PRIORITIES.items()},
+            }
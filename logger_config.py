@@ -1,29 +1,123 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+from datetime import datetime, timezone
 
-def setup_logger():
-    log_file = os.path.join( "service.log")
+# Configured from the environment
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "service.log")  # empty disables the file handler
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json or text
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOGGER_NAME = "valetudo"
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def truncate(text, limit=LOG_MAX_MESSAGE_CHARS):
+    if limit and len(text) > limit:
+        return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, including any fields passed with `extra=`
+    (for example request_id, run_id, node_id).
+    """
 
-    logger = logging.getLogger("valetudo")
-    logger.setLevel(logging.DEBUG)
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
 
-    # Create file handler and set level to debug
-    fh = logging.FileHandler(log_file)
-    fh.setLevel(logging.DEBUG)
 
-    # Create console handler and set level to debug
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Renders the message in the calling thread, truncated to LOG_MAX_MESSAGE_CHARS,
+    and hands it to the listener thread. Messages are only rendered for records
+    that pass the level check, so disabled debug payloads are never formatted.
+    """
 
-    # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    def prepare(self, record):
+        message = truncate(record.getMessage())
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = message
+        record.message = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging
+            pass
+
+
+def _build_handlers():
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logger():
+    """
+    Returns the service logger. The first call attaches a QueueHandler whose listener
+    thread writes to stderr and a rotating file; later calls return the same logger
+    without adding handlers, so modules can call this freely.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
 
-    # Add formatter to handlers
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    logger.propagate = False
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    logger.addHandler(TruncatingQueueHandler(log_queue))
 
-    # Add handlers to logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    _listener = logging.handlers.QueueListener(log_queue, *_build_handlers(), respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
 
-    return logger
\ No newline at end of file
+    return logger
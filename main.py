@@ -1,15 +1,35 @@
-from utils import encode_image, process_xml, validate_base64,annotate_image,process_clickable_elements,trim_element_jsons
-from llm import initialize_llm
-from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from utils import process_xml,annotate_image,process_clickable_elements,trim_element_jsons
+from screen_elements import screen_index
+from utils import aload_image, aprocess_xml, run_in_pool, close_http_client, annotation_mime_type
+from image_payload import ImagePayload
+from llm import initialize_llm, pool_stats, extract_usage, LLM_TIMEOUT
+from llm_scheduler import llm_priority
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse, PlainTextResponse, ORJSONResponse
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 from prompts import system_prompt
+from debug_capture import debug_capture, should_capture
+from streaming import IncrementalFieldParser
+from element_encoding import format_elements, format_actionable_elements
+from cache import response_cache, request_fingerprint, RESPONSE_CACHE_ENABLED
+from faker_provider import faker_provider
+from metrics import registry, start_timer, measure, timed, record_stage, record_usage, http_request_seconds, response_cache_requests, singleflight_requests, screen_diff_requests, fast_path_requests, llm_output_parse
+from singleflight import singleflight, SINGLEFLIGHT_ENABLED
+from screen_diff import screen_diff_store, SCREEN_DIFF_ENABLED
+from fast_path import fast_path
+from admission import admission, AdmissionMiddleware
+from ingestion import DecompressionMiddleware, ORJSONRoute
+from model_router import model_router, validate_output, call_failure_reason
+from response_schema import loads_agent_output, llm_call_kwargs
 import os
 import json
-from faker import Faker
-import base64
+import orjson
+import asyncio
+import copy
+from contextlib import nullcontext
+from dataclasses import dataclass
 from logger_config import setup_logger
 import time
 import uuid
@@ -19,9 +39,14 @@ from langsmith import traceable, get_current_run_tree
 logger = setup_logger()
 
 load_dotenv()
-app = FastAPI()
-
+app = FastAPI(default_response_class=ORJSONResponse)
+# JSON request bodies are parsed with orjson (see ingestion.py)
+app.router.route_class = ORJSONRoute
 
+# Innermost: CORS headers and the request log/metrics also cover 503s at capacity.
+# Admission sees the compressed size, decompression happens as the endpoint reads.
+app.add_middleware(DecompressionMiddleware)
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
@@ -31,7 +56,7 @@ app.add_middleware(
 )
 
 class APIRequest(BaseModel):
-    request_id: Optional[str] = uuid.uuid4().hex
+    request_id: Optional[str] = Field(default_factory=lambda: uuid.uuid4().hex)
     run_id: Optional[str] = None
     node_id: Optional[str] = None
     image: Optional[str] = None        # Base64 encoded image string
@@ -41,52 +66,56 @@ class APIRequest(BaseModel):
     config_data: Optional[Dict[str, Any]] = None
     actionable_elements: Optional[list[Any]] = []  # List of actionable elements objects
     os: Optional[str] = "android"
+    locale: Optional[str] = None       # Faker locale for generated values, e.g. "de_DE"
+    use_cache: Optional[bool] = True   # Set to false to bypass the response cache
+    use_screen_diff: Optional[bool] = True  # Set to false to analyze the screen without reusing earlier screens of the run
+    use_fast_path: Optional[bool] = True    # Set to false to send even obvious screens to the LLM
+    priority: Optional[str] = None     # LLM queue priority under rate limits: "high", "normal" or "low"
+    debug_capture: Optional[bool] = None  # Force (true) or suppress (false) saving the annotated screenshot
 
 
-faker = Faker()
-
-# Get all attributes and methods of the Faker instance
-all_methods = dir(faker)
-
-# Filter out private methods and attributes (those starting with '_')
-faker_fields = [method for method in all_methods if not method.startswith('_')]
-
-def validate_base64(base64_string: str) -> bool:
-    try:
-        base64.b64decode(base64_string)
-        return True
-    except Exception:
-        return False
+# Batch endpoint limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
-    logger.info(f"Incoming request: {request.method} {request.url}")
+    logger.info("Incoming request: %s %s", request.method, request.url)
     response = await call_next(request)
     process_time = time.time() - start_time
-    logger.info(f"Completed request: {request.method} {request.url} in {process_time:.4f} seconds")
-    logger.info(f"Response status: {response.status_code}")
+    route = request.scope.get("route")
+    http_request_seconds.observe(process_time, method=request.method,
+                                 route=route.path if route is not None else "unmatched", status=response.status_code)
+    logger.info("Completed request: %s %s in %.4f seconds", request.method, request.url, process_time)
+    logger.info("Response status: %s", response.status_code)
     return response
 
-def clean_markdown_json(content):
-    if content.startswith("```json\n"):
-        content = content[8:]
-    elif content.startswith("```json"):
-        content = content[7:]
-    
-    # Remove the closing fence
-    if content.endswith("\n```"):
-        content = content[:-4]
-    elif content.endswith("```"):
-        content = content[:-3]
-    
-    # Fix Python booleans to be JSON compatible
-    content = content.replace("True", "true").replace("False", "false")
-    
-    return content
+def canonical_config_json(config_data):
+    """
+    Serializes config_data with sorted keys and no whitespace, so the same config
+    always produces the same bytes regardless of the client's key order.
+    """
+    return json.dumps(config_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def parse_agent_output(content):
+    """
+    Parses and validates the model's raw answer, counting how it parsed.
+
+    Returns:
+        tuple: (parsed output or None, what is wrong with it or None)
+    """
+    try:
+        with measure("json_parse"):
+            parsed_output, how = loads_agent_output(content)
+    except orjson.JSONDecodeError:
+        llm_output_parse.inc(result="failed")
+        return None, "invalid_json"
+    llm_output_parse.inc(result=how)
+    return parsed_output, validate_output(parsed_output)
 
 
-def get_field_value(field: Dict[str, Any], config_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def get_field_value(field: Dict[str, Any], config_data: Optional[Dict[str, Any]] = None, locale: Optional[str] = None) -> Dict[str, Any]:
     """
     Get field value based on priority:
     1. Use value from parsed output if source is 'config' or 'llm'
@@ -97,84 +126,127 @@ def get_field_value(field: Dict[str, Any], config_data: Optional[Dict[str, Any]]
     
     # Directly use the value from parsed output if source is 'config' or 'llm'
     if field.get("source") in ["config", "llm"]:
-        logger.info(f"Using value from parsed output for field: {field_name} with source: {field['source']}")
+        logger.info("Using value from parsed output for field: %s with source: %s", field_name, field['source'])
         return field
 
     # Priority 2: Check Faker function
     faker_func = field.get("faker_function")
-    if faker_func and faker_func in faker_fields:
+    if faker_func and faker_provider.supports(faker_func, locale):
         try:
-            logger.info(f"Using Faker function '{faker_func}' for field: {field_name}")
-            field["value"] = getattr(faker, faker_func)()
+            logger.info("Using Faker function '%s' for field: %s", faker_func, field_name)
+            field["value"] = faker_provider.generate(faker_func, locale)
             field["source"] = "faker"
             return field
         except Exception as e:
-            logger.warning(f"Faker generation failed for {faker_func}: {str(e)}")
+            logger.warning("Faker generation failed for %s: %s", faker_func, e)
             # Continue to default placeholder if Faker fails
 
     # Default placeholder if no value is generated
-    logger.warning(f"No value generated for field: {field_name}, using default placeholder.")
+    logger.warning("No value generated for field: %s, using default placeholder.", field_name)
     field["value"] = "Value not generated"
     field["source"] = "llm"
     
     return field
 
-@traceable
-def generate_data(request, messages, processed_elements, encoded_image):
 
+def fill_faker_fields(fields, config_data=None, locale=None, refresh=False, shared=None):
+    """
+    Generates the values of Faker fields that have none yet, or of every field with a
+    Faker function when refresh is set. All password fields of a screen get the same
+    value, so "password" and "confirm password" match; pass the same shared dict to
+    calls that fill one screen's fields a few at a time.
+    """
+    shared = {} if shared is None else shared
+    for field in fields:
+        if refresh:
+            if not field.get("faker_function"):
+                continue
+        elif field.get("source") != "faker" or field.get("value") is not None:
+            continue
+        if field.get("faker_function") == "password" and field.get("source") == "faker" and "password" in shared:
+            field["value"] = shared["password"]
+            continue
+        get_field_value(field, config_data, locale)
+        if field.get("faker_function") == "password" and field.get("source") == "faker":
+            shared["password"] = field["value"]
+    return fields
+
+def error_message(error):
+    """
+    The message of an error response; timeouts and other errors without a text get one.
+    """
+    if isinstance(error, TimeoutError):
+        return f"The LLM did not answer within {LLM_TIMEOUT:g} seconds"
+    return str(error) or type(error).__name__
+
+def _log_context(request):
+    return {"request_id": request.request_id, "run_id": request.run_id, "node_id": request.node_id}
+
+
+def _tag_run_tree(request):
     rt = get_current_run_tree()
     if rt:
         rt.metadata["request_id"] = request.request_id
         rt.metadata["run_id"] = request.run_id
         rt.metadata["node_id"] = request.node_id
-    llm_key = os.getenv("OPENAI_API_KEY")
-    if not llm_key:
-        logger.error("API key not found.")
-        return {"request_id": request.request_id, "status": "error", "message": "API key not found"}
 
-    logger.info("Initializing LLM.")
-    llm = initialize_llm(llm_key)
 
+def build_screen_messages(request, messages, processed_elements, encoded_image, annotated_image=None):
+    """
+    Appends the screenshot and element messages for the current screen to messages.
+
+    Args:
+        request (APIRequest): The incoming request
+        messages (list): Message list that already holds the system and context messages
+        processed_elements (dict): Output of process_xml/process_clickable_elements
+        encoded_image (ImagePayload or str): Screenshot payload or base64 string
+        annotated_image (str): Pre-computed annotated screenshot; computed here if omitted
+
+    Returns:
+        list: The extended messages list
+    """
     # Combine image and elements data if both are available
     if encoded_image and processed_elements:
         logger.info("Both image and elements data provided")
-        logger.debug(f"Processed elements: {processed_elements}")
-        annotated_image = annotate_image(encoded_image, processed_elements)
+        logger.debug("Processed elements: %s", processed_elements)
+        if annotated_image is None:
+            annotated_image = annotate_image(encoded_image, processed_elements)
 
-        messages.extend([
-            ("human", [
-                {"type": "text", "text": "Screenshot of current screen with annotated element IDs"},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{annotated_image}"}},
-            ])])
-        
-        # Add the source data for context
+        # Text before the image: the screenshot differs on every request, so it goes
+        # last to keep the shared prompt prefix as long as possible
         if request.actionable_elements:
             messages.append(
-                ("human", f'These are the actionable elements of that screen: {processed_elements}')
+                ("human", f'These are the actionable elements of that screen: {format_elements(processed_elements)}')
             )
         else:
             messages.append(
-                ("human", f'This is the xml source of that screen: {processed_elements}')
+                ("human", f'This is the xml source of that screen: {format_elements(processed_elements)}')
             )
 
+        messages.extend([
+            ("human", [
+                {"type": "text", "text": "Screenshot of current screen with annotated element IDs"},
+                {"type": "image_url", "image_url": {"url": f"data:{annotation_mime_type()};base64,{annotated_image}"}},
+            ])])
+
     elif encoded_image:
         logger.info("Only image provided")
         messages.extend([
             ("human", [
                 {"type": "text", "text": "Screenshot of current screen"},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{ImagePayload.coerce(encoded_image).base64}"}},
             ])])
     elif processed_elements:
         logger.info("Only elements data provided")
-        logger.debug(f"Processed elements: {processed_elements}")
+        logger.debug("Processed elements: %s", processed_elements)
         
         if hasattr(request, 'clickable_elements') and request.actionable_elements:
             messages.append(
-                ("human", f'These are the clickable elements of that screen: {processed_elements}')
+                ("human", f'These are the clickable elements of that screen: {format_elements(processed_elements)}')
             )
         else:
             messages.append(
-                ("human", f'This is the xml source of that screen: {processed_elements}')
+                ("human", f'This is the xml source of that screen: {format_elements(processed_elements)}')
             )
     else:
         logger.error("Either image or elements data must be provided.")
@@ -182,89 +254,749 @@ def generate_data(request, messages, processed_elements, encoded_image):
             status_code=400,
             detail="Either clickable elements, XML (string/URL), or image (base64/URL) must be provided."
         )
+    return messages
 
-    # Process the rest of the function as before
-    logger.info('Calling LLM')
-    ai_msg = llm.invoke(messages)
-    logger.debug(f"AI message content: {ai_msg.content}")
-    cleaned_content = clean_markdown_json(ai_msg.content)
+
+def attach_field_metadata(field, processed_elements):
+    # Add element metadata if available. The field is matched by id (numeric ids
+    # included), resource id or coordinates through the screen index.
+    if processed_elements:
+        element = screen_index(processed_elements).resolve(field)
+        if element is not None:
+            if field.get("id") is None:
+                field["id"] = element.element_id
+            field["metadata"] = element.as_dict()
+    return field
+
+
+def build_response(request, content, processed_elements, usage=None, parsed=None, faker_values=None):
+    """
+    Parses the raw LLM content and attaches element metadata to the generated fields.
+
+    Args:
+        request (APIRequest): The incoming request
+        content (str): Raw message content returned by the LLM
+        processed_elements (dict): Elements used to build the prompt, if any
+        usage (dict): Token usage of the LLM call, added to successful responses
+        parsed (tuple): parse_agent_output(content), if the caller has already parsed it
+        faker_values (dict): Shared state of fill_faker_fields, if some fields were filled already
+
+    Returns:
+        dict: The /invoke response body
+    """
+    logger.debug("AI message content: %s", content)
+    record_usage(usage)
+
+    parsed_output, _ = parsed or parse_agent_output(content)
+    if parsed_output is None:
+        return {"request_id": request.request_id, "status": "error", "message": "Failed to parse AI response"}
+
+    # Validate response format
+    if not isinstance(parsed_output, dict) or "data_generation_required" not in parsed_output:
+        return {"status": "error", "message": "Invalid response format"}
     
-    try:
-        parsed_output = json.loads(cleaned_content)
-        
-        # Validate response format
-        if "data_generation_required" not in parsed_output:
-            return {"status": "error", "message": "Invalid response format"}
+    # Process fields if data generation is required
+    if parsed_output["data_generation_required"] == True:
+        if "fields" not in parsed_output:
+            return {"status": "error", "message": "Missing fields array"}
         
-        # Process fields if data generation is required
-        if parsed_output["data_generation_required"] == True:
-            if "fields" not in parsed_output:
-                return {"status": "error", "message": "Missing fields array"}
-            
-            # Process each field
-            for field in parsed_output["fields"]:
-                # Add element metadata if available
-                if processed_elements and "id" in field:
-                    field_id = field["id"]
-                    if field_id in processed_elements:
-                        field["metadata"] = processed_elements[field_id]
-        
-        if processed_elements :
-            return {"request_id": request.request_id, "status": "success","message":"XML used for metadata processing", "agent_response": parsed_output}
-        else:
-            return {"request_id": request.request_id, "status": "success","message":"XML was not available for metadata processing", "agent_response": parsed_output}
-        
-    except json.JSONDecodeError:
-        return {"request_id": request.request_id, "status": "error", "message": "Failed to parse AI response"}
+        # Process each field
+        fill_faker_fields(parsed_output["fields"], request.config_data, request.locale, shared=faker_values)
+        for field in parsed_output["fields"]:
+            attach_field_metadata(field, processed_elements)
+    
+    if processed_elements :
+        response = {"request_id": request.request_id, "status": "success","message":"XML used for metadata processing", "agent_response": parsed_output}
+    else:
+        response = {"request_id": request.request_id, "status": "success","message":"XML was not available for metadata processing", "agent_response": parsed_output}
+    if usage:
+        response["usage"] = usage
+    return response
+
+
+def refresh_cached_response(request, cached_response):
+    """
+    Prepares a cached response for reuse: the LLM decision is kept, while the request id
+    and any Faker-generated values are refreshed so repeated visits get fresh data.
+    """
+    cached_response["request_id"] = request.request_id
+    agent_response = cached_response.get("agent_response") or {}
+    fill_faker_fields(agent_response.get("fields") or [], request.config_data, request.locale, refresh=True)
+    return cached_response
+
 
 @traceable
-# Update the FastAPI endpoint to handle clickable elements
-@app.post("/invoke")
-async def run_service(request: APIRequest):
+def generate_data(request, messages, processed_elements, encoded_image):
+    _tag_run_tree(request)
+    llm_key = os.getenv("OPENAI_API_KEY")
+    if not llm_key:
+        logger.error("API key not found.")
+        return {"request_id": request.request_id, "status": "error", "message": "API key not found"}
+
+    logger.info("Getting pooled LLM client.")
+    llm = initialize_llm(llm_key)
+
+    build_screen_messages(request, messages, processed_elements, ImagePayload.coerce(encoded_image))
+
+    logger.info('Calling LLM')
+    with measure("llm"):
+        ai_msg = llm.invoke(messages, **llm_call_kwargs())
+    return build_response(request, ai_msg.content, processed_elements, extract_usage(ai_msg))
+
+
+async def prepare_llm_call(request, messages, processed_elements, encoded_image):
+    """
+    Routes the screen to its models (see model_router.py) and appends the (annotated)
+    screen messages.
+
+    Returns:
+        tuple: (route, messages), or (None, error response) when no API key is configured
+    """
+    llm_key = os.getenv("OPENAI_API_KEY")
+    if not llm_key:
+        logger.error("API key not found.")
+        return None, {"request_id": request.request_id, "status": "error", "message": "API key not found"}
+
+    route = model_router.route(processed_elements, bool(encoded_image), request.config_data)
+    logger.info("Routing to %s (%s, complexity %.0f)", " -> ".join(route.models), route.reason, route.complexity,
+                extra=_log_context(request))
+
+    annotated_image = None
+    if encoded_image and processed_elements:
+        annotated_image = await run_in_pool(
+            timed("annotate", annotate_image), encoded_image, processed_elements,
+            capture=should_capture(request.request_id, request.run_id, getattr(request, "debug_capture", None)),
+            request_id=request.request_id, run_id=request.run_id,
+        )
+    build_screen_messages(request, messages, processed_elements, encoded_image, annotated_image)
+    return route, messages
+
+
+def llm_for(model):
+    """
+    The pooled client of a model, for the configured API key.
+    """
+    return initialize_llm(os.getenv("OPENAI_API_KEY"), model)
+
+
+async def _iter_until(chunks, timeout):
+    """
+    Iterates an async iterator of chunks, raising asyncio.TimeoutError once timeout
+    seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    iterator = chunks.__aiter__()
     try:
-        logger.info("Invoke endpoint called.")
-        processed_elements = None
-        messages = [("system", system_prompt)]
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), deadline - time.monotonic())
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        await iterator.aclose()
 
-        messages.append(("human", f"Actionable elements available on current screen: {trim_element_jsons(1,request.actionable_elements,request.os)}"))
 
-        # Handle config data
-        if request.config_data:
-            logger.debug(f"Config data provided: {request.config_data}")
-            messages.append(
-                ("human", f"Configuration data for field generation: {json.dumps(request.config_data, indent=2)}")
-            )
+async def _astream_content(llm, messages):
+    """
+    Calls the LLM in streaming mode so time to first token can be recorded next to the
+    total LLM time. Returns the joined content and the token usage.
+    """
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    usage = None
+    async for chunk in llm.astream(messages, **llm_call_kwargs()):
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        if first_token is None and content:
+            first_token = time.perf_counter()
+            record_stage("llm_ttft", first_token - started)
+        parts.append(content)
+        usage = extract_usage(chunk) or usage
+    record_stage("llm", time.perf_counter() - started)
+    return "".join(parts), usage
+
+
+@traceable
+async def agenerate_data(request, messages, processed_elements, encoded_image, llm_limiter=None):
+    """
+    Async counterpart of generate_data. Image annotation runs on the CPU thread pool
+    and the LLM is awaited with ainvoke so the event loop stays free. encoded_image
+    may be an ImagePayload, whose decoded bytes are reused for annotation. If given,
+    llm_limiter (an async context manager, e.g. a semaphore) is held only around the
+    LLM call.
+    """
+    _tag_run_tree(request)
+    route, messages = await prepare_llm_call(request, messages, processed_elements, encoded_image)
+    if route is None:
+        return messages
 
-        # Process image (base64 or URL)
-        encoded_image = None
+    logger.info('Calling LLM')
+    async with llm_limiter or nullcontext():
+        # The deadline starts once the limiter admits the call, so queued batch items keep it
+        route.start()
+        for attempt, model in enumerate(route.models, start=1):
+            started = time.perf_counter()
+            try:
+                content, usage = await asyncio.wait_for(_astream_content(llm_for(model), messages),
+                                                        route.attempt_timeout(attempt))
+            except Exception as e:
+                if attempt == len(route.models):
+                    raise
+                # A fast model that fails or is too slow (or is not served at all) escalates
+                reason = call_failure_reason(e)
+                logger.warning("LLM call to %s failed: %r", model, e, extra=_log_context(request))
+                route.record(model, time.perf_counter() - started, None, reason)
+                route.escalate(reason)
+                continue
+            parsed = parse_agent_output(content)
+            route.record(model, time.perf_counter() - started, usage, parsed[1])
+            if parsed[1] is None or attempt == len(route.models):
+                break
+            # The rejected answer's tokens were still spent
+            record_usage(usage)
+            route.escalate(parsed[1])
+    route.finish()
+    response = build_response(request, content, processed_elements, usage, parsed)
+    response["routing"] = route.summary()
+    return response
+
+
+async def agenerate_data_stream(request, messages, processed_elements, encoded_image):
+    """
+    Streaming variant of agenerate_data. Yields ("field", field) for every entry of the
+    model's "fields" array as soon as it is complete, then ("result", response) with
+    the same body agenerate_data would have returned.
+    """
+    _tag_run_tree(request)
+    route, messages = await prepare_llm_call(request, messages, processed_elements, encoded_image)
+    if route is None:
+        yield "result", messages
+        return
+
+    logger.info('Streaming LLM')
+    route.start()
+    streamed = []
+    faker_values = {}
+    for attempt, model in enumerate(route.models, start=1):
+        parser = IncrementalFieldParser()
+        usage = None
+        started = time.perf_counter()
+        first_token = None
+        try:
+            chunks = _iter_until(llm_for(model).astream(messages, **llm_call_kwargs()), route.attempt_timeout(attempt))
+            async for chunk in chunks:
+                usage = extract_usage(chunk) or usage
+                content = chunk.content if isinstance(chunk.content, str) else ""
+                if first_token is None and content:
+                    first_token = time.perf_counter()
+                    record_stage("llm_ttft", first_token - started)
+                for field in parser.feed(content):
+                    fill_faker_fields([field], request.config_data, request.locale, shared=faker_values)
+                    streamed.append(field)
+                    yield "field", attach_field_metadata(field, processed_elements)
+        except Exception as e:
+            if streamed or attempt == len(route.models):
+                raise
+            reason = call_failure_reason(e)
+            logger.warning("LLM call to %s failed: %r", model, e, extra=_log_context(request))
+            route.record(model, time.perf_counter() - started, None, reason)
+            route.escalate(reason)
+            continue
+        elapsed = time.perf_counter() - started
+        record_stage("llm", elapsed)
+        parsed = parse_agent_output(parser.content())
+        route.record(model, elapsed, usage, parsed[1])
+        # Fields the client already received cannot be taken back, so only an answer
+        # that streamed none is retried with the next model
+        if parsed[1] is None or streamed or attempt == len(route.models):
+            break
+        record_usage(usage)
+        route.escalate(parsed[1])
+    route.finish()
+    response = build_response(request, parser.content(), processed_elements, usage, parsed, faker_values)
+    response["routing"] = route.summary()
+    # Keep the Faker values the client already received
+    for field, streamed_field in zip((response.get("agent_response") or {}).get("fields") or [], streamed):
+        if field.get("source") == "faker":
+            field["value"] = streamed_field.get("value")
+    yield "result", response
+
+
+@dataclass
+class PreparedRequest:
+    """
+    A request after parsing, ready for the cache lookup, annotation and LLM call.
+    """
+    request: Any
+    messages: list
+    processed_elements: Optional[dict]
+    image_payload: Optional[ImagePayload]
+    fingerprint: str
+
+
+async def prepare_request(request, image_payload=None, xml_source=None):
+    """
+    Parses a request into its prompt context, screenshot payload, screen elements and
+    content fingerprint.
+
+    Args:
+        request (APIRequest): The request
+        image_payload (ImagePayload): Screenshot that arrived outside the JSON body, if any
+        xml_source (bytes or file-like object): XML that arrived outside the JSON body, if any
+
+    Returns:
+        PreparedRequest: The prepared request
+    """
+    processed_elements = None
+    # Messages go from most to least shared so the provider's prompt cache can reuse
+    # the longest possible byte-identical prefix: the static system prompt, then the
+    # config (usually constant for a run), then the per-screen content.
+    messages = [("system", system_prompt)]
+
+    # Handle config data
+    if request.config_data:
+        logger.debug("Config data provided: %s", request.config_data)
+        messages.append(
+            ("human", f"Configuration data for field generation: {canonical_config_json(request.config_data)}")
+        )
+
+    # Process image (upload, base64 or URL). Each payload is decoded at most once.
+    if image_payload is None:
         if request.image:
-            if not validate_base64(request.image):
+            try:
+                image_payload = await run_in_pool(timed("base64_decode", ImagePayload.from_base64), request.image)
+            except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid base64 image data")
-            encoded_image = request.image
         elif request.image_url:
-            logger.info(f"Image URL: {request.image_url}")
-            encoded_image =   encode_image(request.image_url)
-        
-        # Process elements data (clickable elements, XML, or XML URL)
-        if request.actionable_elements:
-            logger.info("Processing clickable elements.")
-            processed_elements =   process_clickable_elements(request.actionable_elements)
-        elif request.xml:
-            processed_elements =  process_xml(request.xml)
-        elif request.xml_url:
-            logger.info(f"XML URL: {request.xml_url}")
-            processed_elements =  process_xml(request.xml_url)
-        
-        return generate_data(request=request, messages=messages, processed_elements=processed_elements, encoded_image=encoded_image)
+            logger.info("Image URL: %s", request.image_url)
+            image_payload = await aload_image(request.image_url)
+            if image_payload is not None:
+                # Not part of the body the request was admitted with
+                admission.charge(len(image_payload.raw))
+    
+    # Process elements data (clickable elements, XML, or XML URL)
+    if request.actionable_elements:
+        logger.info("Processing clickable elements.")
+        with measure("clickable_elements"):
+            processed_elements = process_clickable_elements(request.actionable_elements, request.os)
+    elif xml_source is not None:
+        processed_elements = await run_in_pool(timed("xml_parse", process_xml), xml_source)
+    elif request.xml:
+        processed_elements = await aprocess_xml(request.xml)
+    elif request.xml_url:
+        logger.info("XML URL: %s", request.xml_url)
+        processed_elements = await aprocess_xml(request.xml_url)
+
+    # Actionable elements that made it into the element table (with their node id and
+    # description) are sent there only; the trimmed list describes them when they could
+    # not be processed
+    trimmed_elements = None
+    if not (request.actionable_elements and processed_elements):
+        trimmed_elements = trim_element_jsons(request.request_id, request.actionable_elements, request.os)
+        messages.append(("human", f"Actionable elements available on current screen: {format_actionable_elements(trimmed_elements)}"))
+
+    source = "actionable" if request.actionable_elements else "xml"
+    fingerprint = await run_in_pool(request_fingerprint, processed_elements, image_payload,
+                                    request.config_data, request.os, source, trimmed_elements)
+    return PreparedRequest(request, messages, processed_elements, image_payload, fingerprint)
+
+
+async def complete_request(prepared, headers, llm_limiter=None):
+    """
+    Answers a prepared request from the response cache or the LLM. Concurrent requests
+    with the same fingerprint share one computation; every caller gets its own copy
+    of the response with its request_id (and fresh Faker values).
+
+    Args:
+        prepared (PreparedRequest): Output of prepare_request
+        headers (MutableMapping): Receives the cache status headers
+        llm_limiter: Optional async context manager held around the LLM call
+
+    Returns:
+        dict: The /invoke response body
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return await _complete_request(prepared, headers, llm_limiter)
+
+    request = prepared.request
+    leader_headers = {}
+    key = f"{prepared.fingerprint}:{int(bool(request.use_cache))}{int(bool(request.use_fast_path))}"
+    if SCREEN_DIFF_ENABLED and request.use_screen_diff and request.run_id:
+        # The answer also depends on the run's earlier screens
+        key += f":{request.run_id}"
+    result, joined = await singleflight.do(key, lambda: _complete_request(prepared, leader_headers, llm_limiter))
+    headers.update(leader_headers)
+    if not joined:
+        singleflight_requests.inc(role="leader")
+        return result
+    logger.info("Joined in-flight computation for key %s", prepared.fingerprint[:16], extra=_log_context(request))
+    singleflight_requests.inc(role="follower")
+    headers["X-Coalesced"] = "true"
+    return refresh_cached_response(request, copy.deepcopy(result))
+
+
+async def _complete_request(prepared, headers, llm_limiter=None):
+    """
+    Answers a prepared request with the rule-based fast path, from the response cache,
+    the run's earlier screens or the LLM.
+
+    Args:
+        prepared (PreparedRequest): Output of prepare_request
+        headers (MutableMapping): Receives the cache status headers
+        llm_limiter: Optional async context manager held around the LLM call
+
+    Returns:
+        dict: The /invoke response body
+    """
+    request = prepared.request
+    result = answer_locally(prepared)
+    if result is not None:
+        headers["X-Fast-Path"] = result["fast_path"]
+        await remember_screen(prepared, result)
+        return result
+
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED and request.use_cache:
+        cache_key = prepared.fingerprint
+        cached = await run_in_pool(response_cache.get, cache_key)
+        if cached is not None:
+            cached_response, age, tier = cached
+            logger.info("Response cache hit (%s) for key %s", tier, cache_key[:16])
+            headers["X-Cache"] = "HIT"
+            headers["X-Cache-Tier"] = tier
+            headers["X-Cache-Key"] = cache_key[:16]
+            headers["Age"] = str(int(age))
+            response_cache_requests.inc(result="hit", tier=tier)
+            result = refresh_cached_response(request, cached_response)
+            await remember_screen(prepared, result)
+            return result
+        headers["X-Cache"] = "MISS"
+        headers["X-Cache-Key"] = cache_key[:16]
+        response_cache_requests.inc(result="miss")
+    else:
+        headers["X-Cache"] = "BYPASS"
+        response_cache_requests.inc(result="bypass")
+
+    plan = await plan_screen_diff(prepared)
+    if plan is None or plan.mode == "full":
+        result = await agenerate_data(request=request, messages=prepared.messages, processed_elements=prepared.processed_elements,
+                                      encoded_image=prepared.image_payload, llm_limiter=llm_limiter)
+        if cache_key and result.get("status") == "success":
+            await run_in_pool(response_cache.set, cache_key, result)
+    else:
+        result = await complete_from_earlier_screen(prepared, plan, llm_limiter)
+    await remember_screen(prepared, result)
+    if plan is not None:
+        result["screen_diff"] = plan.summary()
+    return result
+
+
+def answer_locally(prepared):
+    """
+    Answers obvious screens with the rule-based fast path (see fast_path.py), without
+    the cache or the LLM.
+
+    Returns:
+        dict: The /invoke response body, or None if the screen needs the LLM
+    """
+    request = prepared.request
+    if not (fast_path.enabled and request.use_fast_path):
+        return None
+    with measure("fast_path"):
+        agent_response, reason = fast_path.classify(prepared.processed_elements, request.config_data)
+    fast_path_requests.inc(result="miss" if agent_response is None else "hit", reason=reason)
+    if agent_response is None:
+        return None
+    logger.info("Fast path answered the screen (%s)", reason, extra=_log_context(request))
+    fill_faker_fields(agent_response["fields"], request.config_data, request.locale)
+    for field in agent_response["fields"]:
+        attach_field_metadata(field, prepared.processed_elements)
+    return {"request_id": request.request_id, "status": "success", "message": "XML used for metadata processing",
+            "agent_response": agent_response, "fast_path": reason}
+
+
+def _screen_context_key(request):
+    # Everything besides the screen itself that shapes the model's answer
+    source = "actionable" if request.actionable_elements else "xml"
+    return request_fingerprint(None, None, request.config_data, request.os, source)
+
+
+async def plan_screen_diff(prepared):
+    """
+    Compares the screen with the earlier screens of its run (see screen_diff.py).
+
+    Returns:
+        DiffPlan: The plan, or None if screen diffing does not apply to this request
+    """
+    request = prepared.request
+    if not (SCREEN_DIFF_ENABLED and request.use_screen_diff and request.run_id and prepared.processed_elements):
+        return None
+    plan = await run_in_pool(screen_diff_store.plan, request.run_id, _screen_context_key(request), prepared.processed_elements)
+    screen_diff_requests.inc(mode=plan.mode)
+    if plan.mode != "full":
+        logger.info("Screen diff %s against %s (ratio %.3f)", plan.mode, plan.base.request_id, plan.diff_ratio,
+                    extra=_log_context(request))
+    return plan
+
+
+async def complete_from_earlier_screen(prepared, plan, llm_limiter=None):
+    """
+    Answers a screen that differs only slightly from an earlier one of the run. In
+    "reuse" mode no input changed and the earlier fields are returned as they are; in
+    "delta" mode only the new input elements are sent to the LLM and its answer is
+    merged with the earlier fields.
+    """
+    request = prepared.request
+    processed_elements = prepared.processed_elements
+    if plan.mode == "reuse":
+        result = {"request_id": request.request_id, "status": "success", "message": "XML used for metadata processing",
+                  "agent_response": plan.reused_agent_response()}
+    else:
+        known = ", ".join(sorted({str(field.get("field_name")) for field in plan.reused_fields()})) or "none"
+        messages = list(prepared.messages)
+        messages.append(("human", f"Fields of this screen that were already generated earlier: {known}. "
+                                  "Only the elements listed below are new; return fields for these elements only."))
+        result = await agenerate_data(request=request, messages=messages, processed_elements=plan.delta_elements(processed_elements),
+                                      encoded_image=prepared.image_payload, llm_limiter=llm_limiter)
+        if result.get("status") != "success":
+            return result
+        result["agent_response"] = plan.merge(result["agent_response"])
+
+    for field in result["agent_response"]["fields"]:
+        attach_field_metadata(field, processed_elements)
+    # Earlier Faker values are regenerated, as for cached responses
+    return refresh_cached_response(request, result)
+
+
+async def remember_screen(prepared, result):
+    request = prepared.request
+    if not (SCREEN_DIFF_ENABLED and request.use_screen_diff and request.run_id and prepared.processed_elements):
+        return
+    if result.get("status") != "success":
+        return
+    await run_in_pool(screen_diff_store.record, request.run_id, request.node_id, request.request_id,
+                      _screen_context_key(request), prepared.processed_elements, result.get("agent_response"))
+
+
+async def invoke_pipeline(request, response, image_payload=None, xml_source=None):
+    """
+    Runs the /invoke pipeline for one request.
+
+    Args:
+        request (APIRequest): The request
+        response (Response): Response whose headers are updated (cache status, Server-Timing)
+        image_payload (ImagePayload): Screenshot that arrived outside the JSON body, if any
+        xml_source (bytes or file-like object): XML that arrived outside the JSON body, if any
+
+    Returns:
+        dict: The /invoke response body
+    """
+    timer = start_timer(request.request_id, request.run_id, request.node_id)
+    admission.record_wait()
+    if request.priority:
+        llm_priority.set(request.priority)
+    try:
+        logger.info("Invoke endpoint called.", extra=_log_context(request))
+        prepared = await prepare_request(request, image_payload, xml_source)
+        return await complete_request(prepared, response.headers)
 
     except Exception as e:
-        logger.exception("An error occurred during the invoke process.")
-        return {"request_id": request.request_id, "status": "error", "message": str(e)}
+        logger.exception("An error occurred during the invoke process.", extra=_log_context(request))
+        return {"request_id": request.request_id, "status": "error", "message": error_message(e)}
+    finally:
+        response.headers["Server-Timing"] = timer.server_timing()
+        logger.info("Stage timings", extra={**_log_context(request), "timings_ms": timer.as_dict()})
+
+@traceable
+# Update the FastAPI endpoint to handle clickable elements
+@app.post("/invoke")
+async def run_service(request: APIRequest, response: Response):
+    return await invoke_pipeline(request, response)
+
+@app.post("/invoke/batch")
+async def run_service_batch(requests: list[APIRequest]):
+    """
+    Analyzes many screens in one call. Identical screens are analyzed once, parsing and
+    annotation run in parallel, and at most BATCH_LLM_CONCURRENCY LLM calls are in flight.
+    Results are streamed back as NDJSON lines in completion order, each tagged with the
+    index of its request in the batch.
+    """
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} requests")
+    logger.info("Batch endpoint called with %d requests.", len(requests))
+    admission.record_wait()
+    llm_limiter = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    shared = {}  # fingerprint -> (first index, task)
+
+    async def complete_shared(prepared):
+        headers = {}
+        result = await complete_request(prepared, headers, llm_limiter)
+        return result, headers.get("X-Cache")
+
+    async def run_one(index, request):
+        line = {"index": index, "request_id": request.request_id, "duplicate_of": None}
+        timer = start_timer(request.request_id, request.run_id, request.node_id)
+        # Batch work yields to interactive requests when the LLM budget runs short
+        llm_priority.set(request.priority or "low")
+        try:
+            prepared = await prepare_request(request)
+            if prepared.fingerprint in shared:
+                line["duplicate_of"], task = shared[prepared.fingerprint]
+            else:
+                task = asyncio.ensure_future(complete_shared(prepared))
+                shared[prepared.fingerprint] = (index, task)
+            result, cache_status = await asyncio.shield(task)
+            if line["duplicate_of"] is not None:
+                result = copy.deepcopy(result)
+                result["request_id"] = request.request_id
+            line["cache"] = cache_status
+            line["result"] = result
+        except Exception as e:
+            logger.exception("Batch item %d failed.", index)
+            line["result"] = {"request_id": request.request_id, "status": "error", "message": error_message(e)}
+        line["timings_ms"] = timer.as_dict()
+        return line
+
+    async def stream_results():
+        pending = [asyncio.ensure_future(run_one(index, request)) for index, request in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield orjson.dumps(await next_done) + b"\n"
+        finally:
+            # The client went away: stop the work that is still running
+            for task in pending:
+                task.cancel()
+            for _, task in shared.values():
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/invoke/stream")
+async def run_service_stream(request: APIRequest, http_request: Request):
+    """
+    Streaming variant of /invoke. Each generated field is sent as soon as the model has
+    finished writing it, followed by the complete /invoke response. Responds with
+    Server-Sent Events when the client accepts text/event-stream, NDJSON otherwise.
+    """
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    def encode(event, data):
+        if use_sse:
+            return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+        return orjson.dumps({"event": event, "data": data}) + b"\n"
+
+    async def stream_events():
+        timer = start_timer(request.request_id, request.run_id, request.node_id)
+        admission.record_wait()
+        if request.priority:
+            llm_priority.set(request.priority)
+        try:
+            logger.info("Stream endpoint called.", extra=_log_context(request))
+            prepared = await prepare_request(request)
+            result = answer_locally(prepared)
+            if result is not None:
+                for field in result["agent_response"]["fields"]:
+                    yield encode("field", field)
+                yield encode("result", {**result, "timings_ms": timer.as_dict()})
+                return
+            cache_key = prepared.fingerprint if RESPONSE_CACHE_ENABLED and request.use_cache else None
+            cached = await run_in_pool(response_cache.get, cache_key) if cache_key else None
+            if cached is not None:
+                response_cache_requests.inc(result="hit", tier=cached[2])
+                result = refresh_cached_response(request, cached[0])
+                for field in (result.get("agent_response") or {}).get("fields") or []:
+                    yield encode("field", field)
+                yield encode("result", {**result, "cache": "HIT", "timings_ms": timer.as_dict()})
+                return
+            response_cache_requests.inc(result="miss" if cache_key else "bypass")
+            async for event, data in agenerate_data_stream(request, prepared.messages, prepared.processed_elements,
+                                                           prepared.image_payload):
+                if event == "result":
+                    if cache_key and data.get("status") == "success":
+                        await run_in_pool(response_cache.set, cache_key, data)
+                    data = {**data, "timings_ms": timer.as_dict()}
+                yield encode(event, data)
+        except Exception as e:
+            logger.exception("An error occurred during the stream process.")
+            yield encode("result", {"request_id": request.request_id, "status": "error", "message": error_message(e)})
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(stream_events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.post("/invoke/upload")
+async def run_service_upload(
+    response: Response,
+    image: Optional[UploadFile] = File(None),
+    xml: Optional[UploadFile] = File(None),
+    payload: Optional[str] = Form(None),
+):
+    """
+    Multipart variant of /invoke. The screenshot and XML are sent as raw file parts, so
+    large screenshots skip base64 entirely; every other APIRequest field goes in the
+    optional 'payload' part as JSON. Parts are spooled to temporary files while the
+    body arrives, and the XML is parsed straight from its spooled file.
+    """
+    try:
+        request = APIRequest.model_validate_json(payload) if payload else APIRequest()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e}")
+    image_payload = ImagePayload.from_bytes(await image.read()) if image is not None else None
+    xml_source = None
+    if xml is not None:
+        await xml.seek(0)
+        xml_source = xml.file
+    return await invoke_pipeline(request, response, image_payload=image_payload, xml_source=xml_source)
+
+@app.on_event("startup")
+async def warm_faker_pools():
+    faker_provider.warm()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await close_http_client()
+    await run_in_pool(debug_capture.close)
+    await run_in_pool(faker_provider.close)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/llm/pool")
+async def llm_pool():
+    """
+    Saturation metrics for the pooled LLM clients, used to size workers and LLM_MAX_INFLIGHT.
+    """
+    return {"clients": pool_stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**response_cache.stats(), "singleflight": {**singleflight.stats, "in_flight": singleflight.in_flight()},
+            "screen_diff": screen_diff_store.stats()}
+
+@app.get("/fast_path/stats")
+async def fast_path_stats():
+    return fast_path.stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/faker/stats")
+async def faker_stats():
+    return faker_provider.stats()
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """
+    Prometheus metrics. Clients that accept OpenMetrics also get exemplars carrying the
+    request_id/run_id/node_id of a recent request in each latency bucket.
+    """
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return PlainTextResponse(registry.render(openmetrics=True),
+                                 media_type="application/openmetrics-text; version=1.0.0; charset=utf-8")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file
@@ -0,0 +1,307 @@
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cheap parsing stages up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0)
+# OpenMetrics caps the combined length of an exemplar's labels
+EXEMPLAR_MAX_CHARS = 128
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _family_name(self, openmetrics):
+        return self.name
+
+    def render(self, openmetrics=False):
+        family = self._family_name(openmetrics)
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value, openmetrics))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _family_name(self, openmetrics):
+        # OpenMetrics names the family without the _total suffix its samples carry
+        return self.name if openmetrics else f"{self.name}_total"
+
+    def _render_series(self, key, value, openmetrics):
+        return [f"{self.name}_total{_labels_text(self.labelnames, key)} {_number(value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def _render_series(self, key, value, openmetrics):
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram. Each bucket keeps the most recent exemplar (for example the
+    request_id of a slow request), which is only exposed in the OpenMetrics format.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, exemplar=None, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "exemplars": {}}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+            if exemplar:
+                series["exemplars"][index] = (exemplar, value, time.time())
+
+    def _render_series(self, key, series, openmetrics):
+        lines = []
+        cumulative = 0
+        for index, bound in enumerate(self.buckets):
+            cumulative += series["counts"][index]
+            le = 'le="%s"' % _number(bound)
+            line = f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}"
+            exemplar = series["exemplars"].get(index) if openmetrics else None
+            if exemplar:
+                exemplar_labels, value, timestamp = exemplar
+                names, values = zip(*exemplar_labels.items())
+                line += f" # {_labels_text(names, values)} {_number(value)} {timestamp:.3f}"
+            lines.append(line)
+        lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(series['sum'])}")
+        lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, openmetrics=False):
+        """
+        Returns all metrics in the Prometheus text format, or OpenMetrics (with exemplars).
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "euporie_http_request_seconds", "Wall time of HTTP requests", ("method", "route", "status"))
+stage_seconds = registry.histogram(
+    "euporie_stage_seconds", "Wall time of a pipeline stage", ("stage",))
+stage_cpu_seconds = registry.histogram(
+    "euporie_stage_cpu_seconds", "Thread CPU time of a pipeline stage run on the CPU pool", ("stage",))
+llm_tokens = registry.counter(
+    "euporie_llm_tokens", "LLM tokens by kind (input, cached, output)", ("kind",))
+response_cache_requests = registry.counter(
+    "euporie_response_cache_requests", "Response cache lookups by result", ("result", "tier"))
+screen_diff_requests = registry.counter(
+    "euporie_screen_diff_requests", "Requests by screen diff mode (full, delta, reuse)", ("mode",))
+singleflight_requests = registry.counter(
+    "euporie_singleflight_requests", "Requests that started (leader) or joined (follower) a computation", ("role",))
+llm_queue_depth = registry.gauge(
+    "euporie_llm_queue_depth", "LLM calls waiting for rate limit budget", ("priority",))
+llm_queue_wait_seconds = registry.histogram(
+    "euporie_llm_queue_wait_seconds", "Time LLM calls waited for rate limit budget", ("priority",))
+llm_rate_limited = registry.counter(
+    "euporie_llm_rate_limited", "LLM provider responses with status 429")
+llm_output_parse = registry.counter(
+    "euporie_llm_output_parse", "Model answers by how they parsed (direct, repaired, failed)", ("result",))
+llm_routing_decisions = registry.counter(
+    "euporie_llm_routing_decisions", "Model routing outcomes (fast, strong, escalated) by reason", ("decision", "reason"))
+llm_tier_seconds = registry.histogram(
+    "euporie_llm_tier_seconds", "Wall time of LLM calls per model", ("model",))
+llm_cost_usd = registry.counter(
+    "euporie_llm_cost_usd", "Estimated LLM cost in USD per model", ("model",))
+admission_in_flight = registry.gauge(
+    "euporie_admission_in_flight", "Admitted /invoke pipelines currently running")
+admission_reserved_bytes = registry.gauge(
+    "euporie_admission_reserved_bytes", "Estimated memory reserved by running pipelines")
+admission_queue_depth = registry.gauge(
+    "euporie_admission_queue_depth", "Requests waiting for admission")
+admission_rejected = registry.counter(
+    "euporie_admission_rejected", "Requests answered 503 at capacity by reason (queue_full, timeout)", ("reason",))
+fast_path_requests = registry.counter(
+    "euporie_fast_path_requests", "Rule-based fast path decisions by result (hit, miss) and reason", ("result", "reason"))
+
+
+_current_timer = contextvars.ContextVar("euporie_stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Collects the stage timings of one request. Every measurement is also observed in
+    the stage histograms, with the request's ids attached as exemplar.
+    """
+
+    def __init__(self, request_id=None, run_id=None, node_id=None):
+        ids = {"request_id": request_id, "run_id": run_id, "node_id": node_id}
+        self.exemplar = {}
+        for name, value in ids.items():
+            if value:
+                value = str(value)[:EXEMPLAR_MAX_CHARS // 3 - len(name)]
+                self.exemplar[name] = value
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}  # stage -> [wall seconds, cpu seconds or None]
+
+    def record(self, stage, wall, cpu=None):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, None])
+            totals[0] += wall
+            if cpu is not None:
+                totals[1] = (totals[1] or 0.0) + cpu
+        observe_stage(stage, wall, cpu, self.exemplar)
+
+    def server_timing(self):
+        """
+        Renders the timings as a Server-Timing header value (milliseconds).
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        parts = []
+        for stage, (wall, cpu) in stages:
+            part = f"{stage};dur={wall * 1000:.1f}"
+            if cpu is not None:
+                part += f';desc="cpu {cpu * 1000:.1f}ms"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self):
+        with self._lock:
+            return {stage: round(wall * 1000, 2) for stage, (wall, _) in self.stages.items()}
+
+
+def observe_stage(stage, wall, cpu=None, exemplar=None):
+    stage_seconds.observe(wall, exemplar, stage=stage)
+    if cpu is not None:
+        stage_cpu_seconds.observe(cpu, exemplar, stage=stage)
+
+
+def start_timer(request_id=None, run_id=None, node_id=None):
+    """
+    Creates a StageTimer and makes it current for the calling task; tasks and pool
+    jobs started from it afterwards inherit it.
+    """
+    timer = StageTimer(request_id, run_id, node_id)
+    _current_timer.set(timer)
+    return timer
+
+
+def record_stage(stage, wall, cpu=None):
+    """
+    Records a stage on the current request's timer, or only in the histograms if there is none.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(stage, wall, cpu)
+    else:
+        observe_stage(stage, wall, cpu)
+
+
+@contextmanager
+def measure(stage, cpu=False):
+    """
+    Times the enclosed block as `stage`. Set cpu=True only for blocks running on a
+    dedicated thread (e.g. inside a CPU pool job); on the event loop thread the CPU
+    time would include other requests.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time() if cpu else None
+    try:
+        yield
+    finally:
+        record_stage(
+            stage,
+            time.perf_counter() - wall_start,
+            time.thread_time() - cpu_start if cpu else None,
+        )
+
+
+def timed(stage, func):
+    """
+    Wraps a blocking function so that running it records wall and thread CPU time.
+    """
+    def wrapper(*args, **kwargs):
+        with measure(stage, cpu=True):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def record_usage(usage):
+    if not usage:
+        return
+    llm_tokens.inc(usage.get("input_tokens", 0), kind="input")
+    llm_tokens.inc(usage.get("cached_tokens", 0), kind="cached")
+    llm_tokens.inc(usage.get("output_tokens", 0), kind="output")
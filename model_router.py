@@ -0,0 +1,184 @@
+import json
+import os
+import time
+
+from llm import LLM_MODEL, LLM_TIMEOUT
+from logger_config import setup_logger
+from metrics import llm_routing_decisions, llm_tier_seconds, llm_cost_usd
+
+logger = setup_logger()
+
+# Set to false to send every screen to LLM_MODEL
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Faster, cheaper model tried first on simple screens; LLM_MODEL is the strong tier
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+# Screen complexity, in element equivalents, above which the strong model is used at once
+LLM_ROUTING_MAX_COMPLEXITY = float(os.getenv("LLM_ROUTING_MAX_COMPLEXITY", "60"))
+# Weights of the screenshot and of each config_data entry in the complexity score
+LLM_ROUTING_IMAGE_WEIGHT = float(os.getenv("LLM_ROUTING_IMAGE_WEIGHT", "20"))
+LLM_ROUTING_CONFIG_WEIGHT = float(os.getenv("LLM_ROUTING_CONFIG_WEIGHT", "2"))
+# Longest a fast model attempt may take, so that an escalation still has time left
+# within LLM_TIMEOUT, the deadline of the whole routed call
+LLM_FAST_TIMEOUT = float(os.getenv("LLM_FAST_TIMEOUT", "20"))
+
+# USD per million tokens: (input, cached input, output). LLM_PRICES (JSON of
+# model -> [input, cached, output]) adds or overrides entries.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_PRICES") or "{}").items()})
+
+
+def usage_cost(model, usage):
+    """
+    Cost in USD of a call's token usage, or None if the model has no known prices.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None or not usage:
+        return None
+    cached = usage.get("cached_tokens", 0)
+    uncached = max(0, usage.get("input_tokens", 0) - cached)
+    return (uncached * prices[0] + cached * prices[1] + usage.get("output_tokens", 0) * prices[2]) / 1e6
+
+
+def call_failure_reason(error):
+    """
+    The escalation reason of a failed model call: "timeout" or "call_failed".
+    """
+    if isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower():
+        return "timeout"
+    return "call_failed"
+
+
+def validate_output(parsed_output):
+    """
+    Checks the model's answer for the keys the response is built from.
+
+    Returns:
+        str: What is wrong with it, or None if it is valid
+    """
+    if not isinstance(parsed_output, dict):
+        return "not_an_object"
+    if not isinstance(parsed_output.get("data_generation_required"), bool):
+        return "missing_data_generation_required"
+    if parsed_output["data_generation_required"] and not isinstance(parsed_output.get("fields"), list):
+        return "missing_fields"
+    return None
+
+
+class Route:
+    """
+    The models a request tries in order, and the record of each attempt for the
+    response's "routing" object.
+    """
+
+    def __init__(self, models, reason, complexity):
+        self.models = models
+        self.reason = reason
+        self.complexity = complexity
+        self.attempts = []
+        self.escalation_reason = None
+        self.deadline = None
+
+    def start(self):
+        """
+        Starts the deadline of the routed call: LLM_TIMEOUT for all attempts together,
+        including their scheduler queue waits and retries.
+        """
+        self.deadline = time.monotonic() + LLM_TIMEOUT
+
+    def attempt_timeout(self, attempt):
+        """
+        Seconds the given attempt (1-based) may take: what is left of the deadline, and
+        at most LLM_FAST_TIMEOUT for an attempt that can still escalate.
+        """
+        remaining = self.deadline - time.monotonic()
+        if attempt < len(self.models):
+            return min(remaining, LLM_FAST_TIMEOUT)
+        return remaining
+
+    def record(self, model, seconds, usage, error=None):
+        """
+        Records one model call: its latency, token usage and cost, and why its output
+        was rejected or the call failed (error), if it was.
+        """
+        tier = "fast" if model != self.models[-1] else "strong"
+        cost = usage_cost(model, usage)
+        llm_tier_seconds.observe(seconds, model=model)
+        if cost:
+            llm_cost_usd.inc(cost, model=model)
+        self.attempts.append({"model": model, "tier": tier, "latency_ms": round(seconds * 1000, 1),
+                              "usage": usage, "cost_usd": None if cost is None else round(cost, 6), "error": error})
+
+    def escalate(self, reason):
+        """
+        Notes that the next model is tried because the last answer was rejected or
+        the call failed.
+        """
+        self.escalation_reason = reason
+        logger.info("Escalating from %s to %s: %s", self.models[len(self.attempts) - 1],
+                    self.models[len(self.attempts)], reason)
+
+    def finish(self):
+        decision = "escalated" if self.escalation_reason else ("fast" if len(self.models) > 1 else "strong")
+        llm_routing_decisions.inc(decision=decision, reason=self.escalation_reason or self.reason)
+
+    def summary(self):
+        costs = [attempt["cost_usd"] for attempt in self.attempts if attempt["cost_usd"] is not None]
+        return {
+            "model": self.attempts[-1]["model"] if self.attempts else None,
+            "reason": self.reason,
+            "complexity": round(self.complexity, 1),
+            "escalated": self.escalation_reason is not None,
+            "escalation_reason": self.escalation_reason,
+            "attempts": self.attempts,
+            "cost_usd": round(sum(costs), 6) if costs else None,
+        }
+
+
+class ModelRouter:
+    """
+    Picks the models for a screen: simple screens go to the fast model first and are
+    escalated to the strong model when its output fails validation; complex screens go
+    to the strong model directly.
+
+    Complexity counts the screen's elements plus LLM_ROUTING_IMAGE_WEIGHT for a
+    screenshot and LLM_ROUTING_CONFIG_WEIGHT per config_data entry. Screenshot-only
+    screens always use the strong model, as there are no elements to anchor on.
+    """
+
+    def __init__(self, enabled=LLM_ROUTING_ENABLED, fast_model=LLM_FAST_MODEL, strong_model=LLM_MODEL,
+                 max_complexity=LLM_ROUTING_MAX_COMPLEXITY):
+        self.enabled = enabled and fast_model and fast_model != strong_model
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.max_complexity = max_complexity
+
+    @staticmethod
+    def complexity(processed_elements, has_image, config_data):
+        return (len(processed_elements or ())
+                + (LLM_ROUTING_IMAGE_WEIGHT if has_image else 0)
+                + LLM_ROUTING_CONFIG_WEIGHT * len(config_data or ()))
+
+    def route(self, processed_elements, has_image, config_data):
+        """
+        Args:
+            processed_elements (dict): Elements sent to the model, if any
+            has_image (bool): Whether a screenshot is sent
+            config_data (dict): The request's config data
+
+        Returns:
+            Route: The models to try, in order
+        """
+        complexity = self.complexity(processed_elements, has_image, config_data)
+        if not self.enabled:
+            return Route([self.strong_model], "disabled", complexity)
+        if has_image and not processed_elements:
+            return Route([self.strong_model], "screenshot_only", complexity)
+        if complexity > self.max_complexity:
+            return Route([self.strong_model], "complex", complexity)
+        return Route([self.fast_model, self.strong_model], "simple", complexity)
+
+
+model_router = ModelRouter()
@@ -1,3 +1,5 @@
+import hashlib
+
 system_prompt = """
 You are Euporie, a reliable and intelligent AI agent specializing in generating test data for mobile applications. Your task is to analyze whether the current screen (provided as an XML file or a screenshot image with annotated clickable elements) requires data generation.
 
@@ -130,6 +132,9 @@ When assigning the "type" field, choose one of the following standardized field
 If none of these types is applicable for an input field, set the "type" value to null and ensure that the "reason" field includes an explanation stating that no valid standardized field type was available.
 """
 
+# Changes whenever the active system prompt changes; used to version cached responses
+PROMPT_VERSION = hashlib.sha256(system_prompt.encode()).hexdigest()[:12]
+
 
 # system_prompt = """
 # **System Prompt for Euporie**:
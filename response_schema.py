@@ -0,0 +1,112 @@
+import os
+from typing import Literal, Optional
+
+import orjson
+from pydantic import BaseModel, ConfigDict
+
+from logger_config import setup_logger
+from streaming import fix_python_literals
+
+logger = setup_logger()
+
+# Set to false to let the model answer in free-form (markdown-fenced) JSON
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# The standardized field types of prompts.system_prompt ("Field Types Reference")
+FIELD_TYPES = (
+    "email", "basic_phone_number", "country", "credit_card_number", "credit_card_expire", "date_of_birth",
+    "name", "first_name", "last_name", "gender", "password", "username", "code", "company", "website",
+    "language_name", "postalcode", "random_int", "ip_address", "date_time", "search_term", "product_name",
+    "location_name", "sentence",
+)
+
+
+class GeneratedField(BaseModel):
+    """
+    One entry of the "fields" array, as described in prompts.system_prompt. Optional
+    keys are nullable rather than omitted: strict structured output requires every
+    key to be present.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    id: Optional[str]
+    field_name: str
+    input_type: str
+    value: Optional[str]
+    source: Literal["config", "llm"]
+    type: Optional[Literal[FIELD_TYPES]]
+    context: Optional[str]
+
+
+class AgentOutput(BaseModel):
+    """
+    The model's answer for one screen; "fields" is empty when no data is needed.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    data_generation_required: bool
+    fields: list[GeneratedField]
+    reason: str
+
+
+def _strict_schema(schema):
+    # Titles are noise to the model and count against the schema size limits
+    if isinstance(schema, dict):
+        return {key: _strict_schema(value) for key, value in schema.items() if key != "title"}
+    if isinstance(schema, list):
+        return [_strict_schema(value) for value in schema]
+    return schema
+
+
+# Passed as response_format to the chat completions API
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "screen_analysis", "strict": True, "schema": _strict_schema(AgentOutput.model_json_schema())},
+}
+
+
+def llm_call_kwargs():
+    """
+    Extra arguments for the LLM calls that analyze a screen.
+    """
+    return {"response_format": RESPONSE_FORMAT} if LLM_STRUCTURED_OUTPUT else {}
+
+
+def strip_markdown_fences(content):
+    content = content.strip()
+    if content.startswith("```"):
+        # ```json or a bare fence, up to the end of its line
+        newline = content.find("\n")
+        content = content[newline + 1:] if newline != -1 else content[3:]
+        if content.startswith("json"):
+            content = content[4:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+
+def loads_agent_output(content):
+    """
+    Parses the model's answer. Structured output arrives as plain JSON and is parsed
+    directly; otherwise markdown fences are stripped and bare Python literals
+    (True/False/None outside of strings) converted before a second attempt.
+
+    Args:
+        content (str): Raw message content
+
+    Returns:
+        tuple: (parsed output, how it was parsed: "direct" or "repaired")
+
+    Raises:
+        orjson.JSONDecodeError: If the content is not JSON even after repairs
+    """
+    try:
+        return orjson.loads(content), "direct"
+    except orjson.JSONDecodeError:
+        pass
+    content = strip_markdown_fences(content)
+    try:
+        return orjson.loads(content), "repaired"
+    except orjson.JSONDecodeError:
+        # The literal scan is a pure Python loop, so it only runs when needed
+        return orjson.loads(fix_python_literals(content)), "repaired"
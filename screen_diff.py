@@ -0,0 +1,230 @@
+import copy
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from element_encoding import is_input_element
+from screen_elements import ScreenIndex
+
+SCREEN_DIFF_ENABLED = os.getenv("SCREEN_DIFF_ENABLED", "true").lower() in ("1", "true", "yes")
+# Largest share of changed elements for which an earlier screen is still reused
+SCREEN_DIFF_MAX_RATIO = float(os.getenv("SCREEN_DIFF_MAX_RATIO", "0.3"))
+SCREEN_DIFF_MAX_RUNS = int(os.getenv("SCREEN_DIFF_MAX_RUNS", "1000"))
+SCREEN_DIFF_SCREENS_PER_RUN = int(os.getenv("SCREEN_DIFF_SCREENS_PER_RUN", "8"))
+SCREEN_DIFF_RUN_TTL = float(os.getenv("SCREEN_DIFF_RUN_TTL", "3600"))
+
+
+def element_signature(element):
+    """
+    Identity of an element that survives re-layout (for example the keyboard opening)
+    and typing: input fields are identified by class and resource id, everything else
+    also by its visible text.
+    """
+    element_class = element.class_name or element.type
+    if is_input_element(element):
+        return ("input", element_class, element.resource_id or element.content_desc, element.password)
+    return ("other", element_class, element.resource_id, element.text, element.content_desc)
+
+
+def screen_signatures(processed_elements):
+    """
+    Maps every element id to a signature that is unique within the screen; repeated
+    elements (list rows) are numbered in document order.
+
+    Returns:
+        dict: element id -> signature
+    """
+    seen = Counter()
+    signatures = {}
+    for element_id, element in processed_elements.items():
+        signature = element_signature(element)
+        seen[signature] += 1
+        signatures[element_id] = (signature, seen[signature])
+    return signatures
+
+
+class ScreenRecord:
+    """
+    An analyzed screen of a run: its element signatures and the decision per input element.
+    """
+    __slots__ = ("node_id", "request_id", "context_key", "signatures", "inputs", "fields", "decision", "created")
+
+    def __init__(self, node_id, request_id, context_key, signatures, inputs, fields, decision):
+        self.node_id = node_id
+        self.request_id = request_id
+        self.context_key = context_key
+        self.signatures = signatures  # frozenset of all element signatures
+        self.inputs = inputs          # frozenset of input element signatures
+        self.fields = fields          # signature -> generated field (without metadata)
+        self.decision = decision      # agent_response without its fields
+        self.created = time.time()
+
+
+class DiffPlan:
+    """
+    How a request relates to the run's earlier screens.
+
+    mode is "full" (analyze the whole screen), "delta" (reuse earlier fields, send only
+    the new input elements to the LLM) or "reuse" (no input-related change, the earlier
+    decision is returned without an LLM call).
+    """
+
+    def __init__(self, mode, diff_ratio=None, base=None, ids_by_signature=None, added_ids=(), removed=0):
+        self.mode = mode
+        self.diff_ratio = diff_ratio
+        self.base = base
+        self.ids_by_signature = ids_by_signature or {}
+        self.added_ids = list(added_ids)
+        self.removed = removed
+
+    def delta_elements(self, processed_elements):
+        """
+        The elements the LLM still has to decide on in delta mode.
+        """
+        return ScreenIndex((element_id, processed_elements[element_id]) for element_id in self.added_ids)
+
+    def reused_fields(self):
+        """
+        The base screen's fields for inputs that are still present, with ids of the current screen.
+        """
+        fields = []
+        for signature, field in self.base.fields.items():
+            element_id = self.ids_by_signature.get(signature)
+            if element_id is not None:
+                field = copy.deepcopy(field)
+                field["id"] = element_id
+                fields.append(field)
+        return fields
+
+    def reused_agent_response(self):
+        fields = self.reused_fields()
+        agent_response = copy.deepcopy(self.base.decision)
+        agent_response["data_generation_required"] = bool(fields)
+        agent_response["fields"] = fields
+        return agent_response
+
+    def merge(self, agent_response):
+        """
+        Combines the LLM's answer for the delta elements with the reused fields.
+        """
+        added = {str(element_id) for element_id in self.added_ids}
+        new_fields = [field for field in agent_response.get("fields") or [] if str(field.get("id")) in added]
+        merged = dict(agent_response)
+        merged["fields"] = self.reused_fields() + new_fields
+        merged["data_generation_required"] = bool(merged["fields"])
+        return merged
+
+    def summary(self):
+        summary = {"mode": self.mode, "diff_ratio": None if self.diff_ratio is None else round(self.diff_ratio, 4)}
+        if self.base is not None:
+            summary.update(base_request_id=self.base.request_id, base_node_id=self.base.node_id,
+                           added_inputs=len(self.added_ids), removed_inputs=self.removed)
+        return summary
+
+
+class ScreenDiffStore:
+    """
+    Bounded per-run memory of analyzed screens. Runs are evicted least recently used
+    beyond max_runs and after ttl seconds without activity; each run keeps its last
+    screens_per_run screens.
+    """
+
+    def __init__(self, max_runs=SCREEN_DIFF_MAX_RUNS, screens_per_run=SCREEN_DIFF_SCREENS_PER_RUN,
+                 ttl=SCREEN_DIFF_RUN_TTL, max_ratio=SCREEN_DIFF_MAX_RATIO):
+        self.max_runs = max_runs
+        self.screens_per_run = screens_per_run
+        self.ttl = ttl
+        self.max_ratio = max_ratio
+        self._runs = OrderedDict()  # run_id -> (last used, [ScreenRecord, ...])
+        self._lock = threading.Lock()
+        self.stats_counters = {"full": 0, "delta": 0, "reuse": 0, "evicted_runs": 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats_counters[stat] += 1
+
+    def _screens(self, run_id):
+        now = time.time()
+        with self._lock:
+            entry = self._runs.get(run_id)
+            if entry is None or now - entry[0] > self.ttl:
+                return []
+            self._runs.move_to_end(run_id)
+            self._runs[run_id] = (now, entry[1])
+            return list(entry[1])
+
+    def plan(self, run_id, context_key, processed_elements):
+        """
+        Compares a screen with the run's earlier screens that were analyzed with the
+        same context (config, OS, prompt) and picks the most similar one.
+
+        Args:
+            run_id (str): Run identifier
+            context_key (str): Hash of everything besides the screen that shapes the answer
+            processed_elements (dict): Elements of the new screen
+
+        Returns:
+            DiffPlan: The plan for this request
+        """
+        if not run_id or not processed_elements:
+            return DiffPlan("full")
+        signatures = screen_signatures(processed_elements)
+        current = frozenset(signatures.values())
+        best, best_ratio = None, None
+        for record in self._screens(run_id):
+            if record.context_key != context_key:
+                continue
+            union = len(current | record.signatures)
+            ratio = 1 - len(current & record.signatures) / union if union else 0.0
+            if best_ratio is None or ratio < best_ratio:
+                best, best_ratio = record, ratio
+
+        if best is None or best_ratio > self.max_ratio:
+            self._count("full")
+            return DiffPlan("full", best_ratio)
+
+        ids_by_signature = {signature: element_id for element_id, signature in signatures.items()}
+        current_inputs = {signature for signature in current if signature[0][0] == "input"}
+        added_ids = [ids_by_signature[signature] for signature in current_inputs - best.inputs]
+        removed = len(best.inputs - current_inputs)
+        mode = "delta" if added_ids else "reuse"
+        self._count(mode)
+        return DiffPlan(mode, best_ratio, best, ids_by_signature, sorted(added_ids, key=str), removed)
+
+    def record(self, run_id, node_id, request_id, context_key, processed_elements, agent_response):
+        """
+        Remembers an analyzed screen and its decision for the run.
+        """
+        if not run_id or not processed_elements or not isinstance(agent_response, dict):
+            return
+        # Field ids come back from the model as strings
+        signatures = {str(element_id): signature for element_id, signature in screen_signatures(processed_elements).items()}
+        fields = {}
+        for field in agent_response.get("fields") or []:
+            signature = signatures.get(str(field.get("id")))
+            if signature is not None:
+                fields[signature] = {key: value for key, value in field.items() if key != "metadata"}
+        decision = {key: value for key, value in agent_response.items() if key != "fields"}
+        screen = ScreenRecord(
+            node_id, request_id, context_key, frozenset(signatures.values()),
+            frozenset(signature for signature in signatures.values() if signature[0][0] == "input"),
+            fields, copy.deepcopy(decision),
+        )
+        now = time.time()
+        with self._lock:
+            _, screens = self._runs.pop(run_id, (now, []))
+            screens.append(screen)
+            del screens[:-self.screens_per_run]
+            self._runs[run_id] = (now, screens)
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+                self.stats_counters["evicted_runs"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self.stats_counters, "runs": len(self._runs),
+                    "screens": sum(len(screens) for _, screens in self._runs.values())}
+
+
+screen_diff_store = ScreenDiffStore()
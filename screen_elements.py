@@ -0,0 +1,168 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Side length in pixels of the cells of the spatial index
+GRID_CELL_SIZE = 256
+# Elements covering more cells (huge or garbage bounds) are scanned linearly instead
+GRID_MAX_CELLS = 256
+
+
+@dataclass(slots=True)
+class ScreenElement:
+    """
+    One normalized screen element, as produced by process_xml and
+    process_clickable_elements and read by the prompt encoder, the annotation step,
+    the fast path and screen diffing.
+
+    rect holds the bounds as integer (x1, y1, x2, y2), parsed once here so that
+    annotation and lookups by position never re-parse the bounds string. node_id and
+    description are the crawler's own fields of actionable elements.
+    """
+    element_id: str
+    text: str = ""
+    resource_id: str = ""
+    type: str = ""
+    bounds: str = ""
+    class_name: str = ""
+    content_desc: str = ""
+    enabled: bool = True
+    password: bool = False
+    node_id: Any = None
+    description: Any = None
+    rect: Optional[tuple] = None
+
+    def as_dict(self):
+        """
+        The element in the metadata format of /invoke responses.
+        """
+        return {
+            "text": self.text,
+            "resource_id": self.resource_id,
+            "type": self.type,
+            "bounds": self.bounds,
+            "class": self.class_name,
+            "content_desc": self.content_desc,
+            "enabled": self.enabled,
+            "password": self.password,
+        }
+
+
+def parse_bounds(bounds):
+    """
+    Parses Android-style bounds: "[0,0][100,100]" -> (0, 0, 100, 100).
+
+    Returns:
+        tuple: (x1, y1, x2, y2), or None if bounds are missing or malformed
+    """
+    if not bounds or not isinstance(bounds, str) or bounds[0] != "[":
+        return None
+    try:
+        x1, y1, x2, y2 = map(int, bounds[1:-1].replace("][", ",").split(","))
+    except ValueError:
+        return None
+    return (x1, y1, x2, y2)
+
+
+def _short_resource_id(resource_id):
+    return resource_id.rsplit(":id/", 1)[-1]
+
+
+class ScreenIndex(dict):
+    """
+    Element id -> ScreenElement for one screen, with lookups by resource id and by
+    position (a uniform grid over the element rectangles). The secondary indexes are
+    built on first use, so requests that only need ids pay nothing for them.
+
+    parsed is set when the screen's source was read completely, so an empty index
+    means a screen without elements rather than a failed download or parse.
+    """
+
+    def __init__(self, *args, parsed=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed = parsed
+        self._by_resource_id = None
+        self._grid = None
+        self._oversized = None
+
+    def element(self, element_id):
+        """
+        The element with the given id; numeric ids from the model match string ids.
+        """
+        if element_id is None:
+            return None
+        return self.get(element_id if isinstance(element_id, str) else str(element_id))
+
+    def by_resource_id(self, resource_id):
+        """
+        The first element (in document order) with the given full or short resource id.
+        """
+        if self._by_resource_id is None:
+            by_resource_id = {}
+            for element in self.values():
+                if element.resource_id:
+                    by_resource_id.setdefault(element.resource_id, element)
+                    by_resource_id.setdefault(_short_resource_id(element.resource_id), element)
+            self._by_resource_id = by_resource_id
+        return self._by_resource_id.get(resource_id)
+
+    def at(self, x, y):
+        """
+        The smallest element whose rectangle contains the point, or None.
+        """
+        if self._grid is None:
+            grid = defaultdict(list)
+            oversized = []
+            for element in self.values():
+                if element.rect is None:
+                    continue
+                x1, y1, x2, y2 = element.rect
+                cells_x = range(x1 // GRID_CELL_SIZE, x2 // GRID_CELL_SIZE + 1)
+                cells_y = range(y1 // GRID_CELL_SIZE, y2 // GRID_CELL_SIZE + 1)
+                if len(cells_x) * len(cells_y) > GRID_MAX_CELLS:
+                    oversized.append(element)
+                    continue
+                for cell_x in cells_x:
+                    for cell_y in cells_y:
+                        grid[cell_x, cell_y].append(element)
+            self._grid = grid
+            self._oversized = oversized
+        best, best_area = None, None
+        candidates = self._grid.get((int(x) // GRID_CELL_SIZE, int(y) // GRID_CELL_SIZE), ())
+        for element in (*candidates, *self._oversized):
+            x1, y1, x2, y2 = element.rect
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                area = (x2 - x1) * (y2 - y1)
+                if best_area is None or area < best_area:
+                    best, best_area = element, area
+        return best
+
+    def resolve(self, field):
+        """
+        Finds the element a generated field refers to: by its id, else by a
+        resource_id, else by coordinates (x/y or the center of its bounds).
+
+        Returns:
+            ScreenElement: The element, or None
+        """
+        element = self.element(field.get("id"))
+        if element is None and field.get("resource_id"):
+            element = self.by_resource_id(field["resource_id"])
+        if element is None:
+            point = None
+            if isinstance(field.get("x"), (int, float)) and isinstance(field.get("y"), (int, float)):
+                point = (field["x"], field["y"])
+            elif (rect := parse_bounds(field.get("bounds"))) is not None:
+                point = ((rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2)
+            if point is not None:
+                element = self.at(*point)
+        return element
+
+
+def screen_index(processed_elements):
+    """
+    Returns processed_elements as a ScreenIndex, wrapping plain dicts.
+    """
+    if isinstance(processed_elements, ScreenIndex):
+        return processed_elements
+    return ScreenIndex(processed_elements or {})
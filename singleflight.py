@@ -0,0 +1,76 @@
+import asyncio
+import os
+
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+# Set to false to give every request its own computation
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one computation.
+
+    The first caller for a key starts the computation as a task; callers arriving
+    while it runs await the same task. Each caller awaits through a shield, so a
+    cancelled caller (for example a client that disconnected) does not cancel the
+    work for the others. The computation is cancelled only when every caller has
+    gone, and it is then forgotten at once so a new caller starts afresh.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.stats = {"leaders": 0, "followers": 0, "abandoned": 0}
+
+    async def do(self, key, func):
+        """
+        Runs func() for key, or joins the run already in flight.
+
+        Args:
+            key (str): Coalescing key
+            func (callable): Returns the awaitable to run when no call is in flight
+
+        Returns:
+            tuple: (result, joined) where joined is True if another caller started the run
+        """
+        call = self._calls.get(key)
+        joined = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, call=call: self._forget(key, call))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), joined
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled, nobody needs the result any more
+                self.stats["abandoned"] += 1
+                self._forget(key, call)
+                call.task.cancel()
+                logger.info("Cancelled abandoned computation for key %s", str(key)[:16])
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,160 @@
+import json
+
+
+def fix_python_literals(text):
+    """
+    Replaces Python's True/False/None with JSON literals, but only where they appear
+    as bare tokens outside of strings, so field values containing those words are
+    left untouched.
+
+    Args:
+        text (str): JSON-like text
+
+    Returns:
+        str: The text with bare Python literals converted
+    """
+    replacements = {"True": "true", "False": "false", "None": "null"}
+    out = []
+    i = 0
+    length = len(text)
+    in_string = False
+    escaped = False
+    while i < length:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            i += 1
+            continue
+        if char == '"':
+            in_string = True
+            out.append(char)
+            i += 1
+            continue
+        if char in "TFN":
+            for literal, replacement in replacements.items():
+                end = i + len(literal)
+                if text.startswith(literal, i) and (end == length or not (text[end].isalnum() or text[end] == "_")) \
+                        and (i == 0 or not (text[i - 1].isalnum() or text[i - 1] == "_")):
+                    out.append(replacement)
+                    i = end
+                    break
+            else:
+                out.append(char)
+                i += 1
+            continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+class IncrementalFieldParser:
+    """
+    Scans the model's JSON answer as it streams in and returns every entry of the
+    top-level "fields" array as soon as its closing brace arrives.
+
+    Anything before the first '{' (such as a markdown fence) is ignored. The scanner
+    tracks strings and escapes, so braces inside values do not confuse it.
+    """
+
+    def __init__(self):
+        self.text = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        self._key = None           # string being read at depth 1, i.e. a top-level key or value
+        self._last_string = None   # last complete top-level string
+        self._fields_depth = None  # depth of the "fields" array, while inside it
+        self._capturing = False
+        self._buffer = ""          # text of the field object currently being captured
+
+    def feed(self, chunk):
+        """
+        Consumes the next chunk of model output.
+
+        Args:
+            chunk (str): Streamed text
+
+        Returns:
+            list: Field dicts completed by this chunk
+        """
+        completed = []
+        if not chunk:
+            return completed
+        self.text.append(chunk)
+        capture_from = 0 if self._capturing else None
+
+        for index, char in enumerate(chunk):
+            if self._done:
+                break
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key is not None:
+                        self._last_string, self._key = self._key, None
+                    continue
+                if self._key is not None:
+                    self._key += char
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key = ""
+            elif char == "{" or char == "[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._last_string == "fields":
+                    self._fields_depth = self._depth
+                elif char == "{" and self._fields_depth is not None and self._depth == self._fields_depth + 1:
+                    self._capturing = True
+                    self._buffer = ""
+                    capture_from = index
+            elif char == "}" or char == "]":
+                if char == "}" and self._capturing and self._depth == self._fields_depth + 1:
+                    self._buffer += chunk[capture_from:index + 1]
+                    capture_from = None
+                    self._capturing = False
+                    field = self._parse_field(self._buffer)
+                    if field is not None:
+                        completed.append(field)
+                elif char == "]" and self._depth == self._fields_depth:
+                    self._fields_depth = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._done = True
+            elif char == "," and self._depth == 1:
+                self._last_string = None
+
+        if capture_from is not None and self._capturing:
+            self._buffer += chunk[capture_from:]
+        return completed
+
+    @staticmethod
+    def _parse_field(text):
+        try:
+            field = json.loads(fix_python_literals(text))
+        except json.JSONDecodeError:
+            return None
+        return field if isinstance(field, dict) else None
+
+    def content(self):
+        """
+        Returns everything fed so far.
+        """
+        return "".join(self.text)
@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_FILE", "")
+
+from utils import process_clickable_elements
+
+ATTRIBUTES = {"class": "android.widget.EditText", "resource-id": "app:id/email", "content-desc": "Email",
+              "clickable": "true", "password": "false", "bounds": "[0,10][100,60]", "focused": "false"}
+
+
+def actionable(attributes):
+    return [{"elementId": "e1", "node_id": 7, "description": "Email address", "attributes": attributes}]
+
+
+def test_attribute_list_and_mapping_give_the_same_record():
+    from_list = process_clickable_elements(actionable([{"name": name, "value": value} for name, value in ATTRIBUTES.items()]))
+    from_mapping = process_clickable_elements(actionable(ATTRIBUTES))
+    assert from_list.parsed and from_mapping.parsed
+    assert from_list["e1"] == from_mapping["e1"]
+    element = from_list["e1"]
+    assert (element.type, element.resource_id, element.content_desc, element.enabled) == ("EditText", "app:id/email", "Email", True)
+    assert (element.node_id, element.description, element.rect) == (7, "Email address", (0, 10, 100, 60))
+
+
+def test_ios_type_attribute_is_the_widget_type():
+    elements = process_clickable_elements(actionable([{"name": "type", "value": "XCUIElementTypeSecureTextField"}]), "ios")
+    assert elements["e1"].type == "SecureTextField"
+
+
+def test_malformed_elements_are_not_parsed():
+    elements = process_clickable_elements([{"attributes": [None]}])
+    assert not elements.parsed and not elements
+
+
+def test_prompt_table_carries_node_id_and_description():
+    from element_encoding import encode_elements_compact
+
+    table = encode_elements_compact(process_clickable_elements(actionable(ATTRIBUTES)))
+    assert table.splitlines() == ["id|type|rid|desc|bounds|node|description",
+                                  "e1|EditText|email|Email|0,10,100,60|7|Email address"]
@@ -0,0 +1,80 @@
+import base64
+import os
+import sys
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LOG_FILE", "")
+
+import main
+from fast_path import FastPath
+from utils import process_xml
+
+ANSWER = '{"data_generation_required": true, "fields": [], "reason": "From the screenshot"}'
+NO_INPUTS_XML = ('<hierarchy><node class="android.widget.Button" clickable="true" enabled="true" '
+                 'resource-id="app:id/next" bounds="[0,0][100,50]"/></hierarchy>')
+
+
+class _Chunk:
+    usage_metadata = None
+    response_metadata = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+class StubLLM:
+    calls = 0
+
+    async def astream(self, messages, **kwargs):
+        StubLLM.calls += 1
+        yield _Chunk(ANSWER)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    StubLLM.calls = 0
+    monkeypatch.setattr(main, "initialize_llm", lambda key, model=None: StubLLM())
+    with TestClient(main.app) as client:
+        yield client
+
+
+def screenshot():
+    buffered = BytesIO()
+    Image.new("RGB", (360, 640), "white").save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def invoke(client, **payload):
+    return client.post("/invoke", json={"use_cache": False, "use_screen_diff": False, **payload})
+
+
+def test_empty_unparsed_screen_is_not_answered():
+    assert FastPath().classify(process_xml("<hierarchy><node")) == (None, "no_elements")
+
+
+def test_parsed_screen_without_inputs_is_answered():
+    agent_response, reason = FastPath().classify(process_xml(NO_INPUTS_XML))
+    assert reason == "no_inputs"
+    assert agent_response["data_generation_required"] is False
+
+
+def test_malformed_xml_goes_to_the_llm_with_the_screenshot(client):
+    response = invoke(client, xml="<hierarchy><node", image=screenshot())
+    assert response.status_code == 200
+    assert "fast_path" not in response.json()
+    assert response.json()["agent_response"]["reason"] == "From the screenshot"
+    assert StubLLM.calls == 1
+
+
+def test_unreachable_xml_url_goes_to_the_llm_with_the_screenshot(client):
+    response = invoke(client, xml_url="http://127.0.0.1:9/screen.xml", image=screenshot())
+    assert response.status_code == 200
+    assert "fast_path" not in response.json()
+    assert response.json()["agent_response"]["reason"] == "From the screenshot"
+    assert StubLLM.calls == 1
@@ -0,0 +1,68 @@
+import gzip
+import os
+import resource
+import sys
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import DecompressionMiddleware
+
+MAX_BODY = 2**20
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(DecompressionMiddleware, max_body=MAX_BODY)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        body = await request.body()
+        return {"length": len(body), "head": body[:16].decode()}
+
+    return TestClient(app)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def test_gzip_body_is_decompressed():
+    body = b"x" * 100_000
+    response = make_client().post("/echo", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.json() == {"length": len(body), "head": "x" * 16}
+
+
+def test_zstd_body_is_decompressed():
+    zstandard = pytest.importorskip("zstandard")
+    body = os.urandom(300_000).hex().encode()[:MAX_BODY]
+    response = make_client().post("/echo", content=zstandard.ZstdCompressor().compress(body),
+                                  headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 200
+    assert response.json() == {"length": len(body), "head": body[:16].decode()}
+
+
+def test_zstd_bomb_is_refused_without_expanding():
+    zstandard = pytest.importorskip("zstandard")
+    # 1 GiB of zeros in about 32 KB
+    compressor = zstandard.ZstdCompressor().compressobj()
+    bomb = b"".join(compressor.compress(bytes(2**20)) for _ in range(1024)) + compressor.flush()
+    rss_before = max_rss_mb()
+    response = make_client().post("/echo", content=bomb, headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 413
+    assert max_rss_mb() - rss_before < 64
+
+
+def test_gzip_bomb_is_refused():
+    bomb = gzip.compress(bytes(64 * 2**20))
+    response = make_client().post("/echo", content=bomb, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+
+
+def test_unknown_encoding_is_refused():
+    response = make_client().post("/echo", content=b"abc", headers={"Content-Encoding": "br"})
+    assert response.status_code == 415
@@ -1,17 +1,227 @@
 import xml.etree.ElementTree as ET
+import asyncio
 import base64
+import contextvars
 import os
 import requests
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime
-import uuid
 import re
 import json
 # import matplotlib.pyplot as plt
 from logger_config import setup_logger
+from debug_capture import debug_capture
+from image_payload import ImagePayload
+from metrics import measure, timed
+from screen_elements import ScreenElement, ScreenIndex, parse_bounds
 
 logger = setup_logger()
+
+# Bounded pool for CPU-bound Pillow and XML work so it never runs on the event loop
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="euporie-cpu")
+_http_client = None
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """
+    Runs a blocking function on the shared CPU thread pool. Context variables (such
+    as the request's stage timer) are carried over to the worker thread.
+
+    Args:
+        func (callable): Blocking function to run
+        *args, **kwargs: Arguments passed to func
+
+    Returns:
+        The return value of func
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_cpu_pool, lambda: context.run(func, *args, **kwargs))
+
+
+def get_http_client():
+    """
+    Returns the process-wide async HTTP client used for image and XML downloads.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+async def fetch_url(url):
+    """
+    Downloads a URL without blocking the event loop.
+
+    Args:
+        url (str): http(s) URL to fetch
+
+    Returns:
+        httpx.Response: The successful response
+    """
+    response = await get_http_client().get(url)
+    response.raise_for_status()
+    return response
+
+
+def _is_url(value):
+    return isinstance(value, str) and (value.startswith('http://') or value.startswith('https://'))
+
+
+IOS_INPUT_FIELD_TYPES = (
+    'XCUIElementTypeTextField',
+    'XCUIElementTypeSecureTextField',
+    'XCUIElementTypeTextView',
+    'XCUIElementTypeSearchField',
+)
+
+
+def _ios_element_details(element_id, elem):
+    element_type = elem.tag
+    # Extract coordinates directly from attributes for iOS
+    try:
+        x = int(elem.get('x', 0))
+        y = int(elem.get('y', 0))
+        width = int(elem.get('width', 0))
+        height = int(elem.get('height', 0))
+        # Format in Android bounds style
+        rect = (x, y, x + width, y + height)
+        bounds = f"[{x},{y}][{x+width},{y+height}]"
+    except (ValueError, TypeError):
+        rect = None
+        bounds = ''
+
+    # Map iOS attributes to Android format
+    return ScreenElement(
+        element_id,
+        text=elem.get('value', '') or elem.get('label', ''),
+        resource_id=elem.get('resource-id', '') or elem.get('name', ''),
+        type=element_type.split('XCUIElementType')[-1],  # Extract just the element type
+        bounds=bounds,
+        class_name=element_type,  # Using full element type as class
+        content_desc=elem.get('label', ''),
+        enabled=elem.get('enabled', 'true') == 'true',
+        password='Secure' in element_type,
+        rect=rect,
+    )
+
+
+def _android_element_details(element_id, elem):
+    bounds = elem.get('bounds', '')
+    return ScreenElement(
+        element_id,
+        text=elem.get('text', ''),
+        resource_id=elem.get('resource-id', ''),
+        type=elem.tag.split('.')[-1],
+        bounds=bounds,
+        class_name=elem.get('class', ''),
+        content_desc=elem.get('content-desc', ''),
+        enabled=elem.get('enabled', 'true') == 'true',
+        password=elem.get('password', 'false') == 'true',
+        rect=parse_bounds(bounds),
+    )
+
+
+XML_CHUNK_SIZE = 64 * 1024
+
+
+def _xml_chunks(xml_input):
+    """
+    Yields the accepted process_xml inputs as str/bytes chunks for an incremental parser.
+    """
+    if isinstance(xml_input, str):
+        if _is_url(xml_input):
+            response = requests.get(xml_input, stream=True)
+            response.raise_for_status()
+            yield from response.iter_content(XML_CHUNK_SIZE)
+            return
+        if len(xml_input) < 4096 and os.path.isfile(xml_input):
+            with open(xml_input, 'rb') as f:
+                yield from iter(lambda: f.read(XML_CHUNK_SIZE), b'')
+            return
+        for offset in range(0, len(xml_input), XML_CHUNK_SIZE):
+            yield xml_input[offset:offset + XML_CHUNK_SIZE]
+    elif isinstance(xml_input, (bytes, bytearray, memoryview)):
+        view = memoryview(xml_input)
+        for offset in range(0, len(view), XML_CHUNK_SIZE):
+            yield view[offset:offset + XML_CHUNK_SIZE].tobytes()
+    elif hasattr(xml_input, 'read'):
+        yield from iter(lambda: xml_input.read(XML_CHUNK_SIZE), type(xml_input.read(0))())
+    else:
+        raise ValueError("Invalid XML input type.")
+
+
+def iter_xml_elements(xml_input):
+    """
+    Streams interactable elements out of an Appium XML dump in a single pass.
+
+    The platform is decided by the first element below the root (or the root itself):
+    an XCUIElementType tag means iOS, anything else Android. Elements are emitted from
+    their start event and each finished subtree is detached, so memory stays flat
+    regardless of dump size.
+
+    Args:
+        xml_input (str, bytes or file-like object): XML file path, URL, or XML content
+
+    Yields:
+        tuple: (element_id, ScreenElement) in the same Android-style format as process_xml
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    is_ios = None
+    ios_index = 0
+    android_index = 0
+    stack = []
+    ios_input_tags = {}
+
+    for chunk in _xml_chunks(xml_input):
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "end":
+                stack.pop()
+                if stack:
+                    # The finished element is always its parent's last child
+                    del stack[-1][-1]
+                continue
+
+            stack.append(elem)
+            if len(stack) == 1:
+                if "XCUIElementType" in elem.tag:
+                    is_ios = True
+                continue
+            if is_ios is None:
+                is_ios = "XCUIElementType" in elem.tag
+
+            if is_ios:
+                ios_index += 1
+                is_input = ios_input_tags.get(elem.tag)
+                if is_input is None:
+                    is_input = ios_input_tags[elem.tag] = any(field_type in elem.tag for field_type in IOS_INPUT_FIELD_TYPES)
+                # Check if the element is an input field and enabled/visible
+                if (is_input and
+                        elem.get('enabled', 'true') == 'true' and
+                        elem.get('visible', 'true') == 'true'):
+                    element_id = str(ios_index)
+                    yield element_id, _ios_element_details(element_id, elem)
+            elif elem.get('clickable') == 'true':
+                android_index += 1
+                element_id = str(android_index)
+                yield element_id, _android_element_details(element_id, elem)
+    parser.close()
+
+
 def process_xml(xml_input):
     """
     Extracts all input field elements from the given XML input (Android or iOS).
@@ -21,96 +231,17 @@ def process_xml(xml_input):
         xml_input (str): XML file path, URL, or XML content representing the screen hierarchy
 
     Returns:
-        dict: A dictionary of dictionaries, each containing details of an input field element in Android format
+        ScreenIndex: Element id -> ScreenElement, each describing an input field element in Android format
     """
     try:
-        # Parse XML input
-        if isinstance(xml_input, str):
-            if xml_input.startswith('http://') or xml_input.startswith('https://'):
-                response = requests.get(xml_input)
-                response.raise_for_status()
-                xml_content = response.text
-                root = ET.fromstring(xml_content)
-            elif os.path.isfile(xml_input):
-                tree = ET.parse(xml_input)
-                root = tree.getroot()
-            else:
-                root = ET.fromstring(xml_input)
-        else:
-            raise ValueError("Invalid XML input type.")
-
-        # Determine if XML is Android or iOS
-        is_ios = any("XCUIElementType" in elem.tag for elem in root.iter())
-        interactable_elements = {}
-
-        if is_ios:
-            # iOS XML processing with Android-compatible output format
-            ios_input_field_types = {
-                'XCUIElementTypeTextField',
-                'XCUIElementTypeSecureTextField',
-                'XCUIElementTypeTextView',
-                'XCUIElementTypeSearchField'
-            }
-
-            # Find all elements that are likely input fields
-            input_elements = root.findall('.//*')
-            for idx, elem in enumerate(input_elements, start=1):
-                element_type = elem.tag
-                # Check if the element is an input field and enabled/visible
-                if (any(field_type in element_type for field_type in ios_input_field_types) and
-                    elem.get('enabled', 'true') == 'true' and
-                    elem.get('visible', 'true') == 'true'):
-                    
-                    # Extract coordinates directly from attributes for iOS
-                    try:
-                        x = int(elem.get('x', 0))
-                        y = int(elem.get('y', 0))
-                        width = int(elem.get('width', 0))
-                        height = int(elem.get('height', 0))
-                        # Format in Android bounds style
-                        bounds = f"[{x},{y}][{x+width},{y+height}]"
-                    except (ValueError, TypeError):
-                        bounds = ''
-
-                    # Map iOS attributes to Android format
-                    action_details = {
-                        'text': elem.get('value', '') or elem.get('label', ''),
-                        'resource_id': elem.get('resource-id', '') or elem.get('name', ''),
-                        'type': element_type.split('XCUIElementType')[-1],  # Extract just the element type
-                        'bounds': bounds,
-                        'class': element_type,  # Using full element type as class
-                        'content_desc': elem.get('label', ''),
-                        'enabled': elem.get('enabled', 'true') == 'true',
-                        'password': 'Secure' in element_type
-                    }
-                    interactable_elements[str(idx)] = action_details
-        else:
-            # Android XML processing (unchanged)
-
-
-            clickable_elements = root.findall('.//*[@clickable="true"]')
-            for idx, action_elem in enumerate(clickable_elements, start=1):
-                element_type = action_elem.tag.split('.')[-1]
-                action_details = {
-                        'text': action_elem.get('text', ''),
-                        'resource_id': action_elem.get('resource-id', ''),
-                        'type': element_type,
-                        'bounds': action_elem.get('bounds', ''),
-                        'class': action_elem.get('class', ''),
-                        'content_desc': action_elem.get('content-desc', ''),
-                        'enabled': action_elem.get('enabled', 'true') == 'true',
-                        'password': action_elem.get('password', 'false') == 'true'
-                    }
-                interactable_elements[str(idx)] = action_details
-
-        return interactable_elements
+        return ScreenIndex(iter_xml_elements(xml_input), parsed=True)
 
     except ET.ParseError as e:
-        print(f"XML Parse Error: {e}")
-        return {}
+        logger.error("XML Parse Error: %s", e)
+        return ScreenIndex()
     except Exception as e:
-        print(f"Unexpected error: {e}")
-        return {}
+        logger.error("Unexpected error: %s", e)
+        return ScreenIndex()
 
 def encode_image(input_source):
     """
@@ -144,133 +275,233 @@ def encode_image(input_source):
         return encoded_image
 
     except Exception as e:
-        print(f"Error encoding image: {e}")
+        logger.error("Error encoding image: %s", e)
+        return None
+
+async def aprocess_xml(xml_input):
+    """
+    Async variant of process_xml. URLs are downloaded with the async HTTP client and
+    parsing runs on the CPU thread pool.
+
+    Args:
+        xml_input (str): XML URL, file path or XML content
+
+    Returns:
+        ScreenIndex: Same structure as process_xml
+    """
+    if _is_url(xml_input):
+        try:
+            with measure("xml_download"):
+                response = await fetch_url(xml_input)
+            xml_input = response.text
+        except Exception as e:
+            logger.error("Error downloading XML: %s", e)
+            return ScreenIndex()
+    return await run_in_pool(timed("xml_parse", process_xml), xml_input)
+
+async def aload_image(input_source):
+    """
+    Loads an image from a URL, file path or file object into an ImagePayload without
+    base64-encoding it; the payload encodes lazily only if the raw image is sent on.
+
+    Args:
+        input_source (str or file-like object): The image URL, file path, or file object.
+
+    Returns:
+        ImagePayload: The loaded image, or None on failure.
+    """
+    try:
+        if _is_url(input_source):
+            with measure("image_download"):
+                response = await fetch_url(input_source)
+            return ImagePayload.from_bytes(response.content)
+        if isinstance(input_source, str):
+            if not os.path.isfile(input_source):
+                raise ValueError("Invalid file path or URL.")
+            with open(input_source, 'rb') as image_file:
+                return ImagePayload.from_bytes(await run_in_pool(image_file.read))
+        return ImagePayload.from_bytes(await run_in_pool(input_source.read))
+    except Exception as e:
+        logger.error("Error loading image: %s", e)
         return None
 
-def process_clickable_elements(clickable_elements):
+# Attributes of actionable elements read by process_clickable_elements
+ACTIONABLE_ATTRIBUTES = frozenset(('resource-id', 'content-desc', 'clickable', 'password', 'text', 'class', 'type', 'bounds'))
+
+def process_clickable_elements(clickable_elements, os_name="android"):
     """
     Processes clickable elements from the JSON format and returns in a consistent format
     similar to process_xml() output.
 
+    Each element is read in a single pass: its attributes (a list of name/value objects,
+    or a mapping) go into one lookup table instead of being compared name by name, and
+    the records keep the crawler's node_id and description, so the prompt needs no
+    second pass over the elements.
+
     Args:
         clickable_elements (list): List of clickable element objects in the specified format
+        os_name (str): Target platform
 
     Returns:
-        dict: A dictionary of dictionaries, each containing details of a clickable element
+        ScreenIndex: Element id -> ScreenElement for every clickable element
     """
-    interactable_elements = {}
+    interactable_elements = ScreenIndex()
+    type_attribute = 'type' if os_name == 'ios' else 'class'
     
     try:
         for idx, element in enumerate(clickable_elements, start=1):
+            attributes = element.get('attributes') or {}
+            if not isinstance(attributes, dict):
+                values = {}
+                for attr in attributes:
+                    name = attr.get('name')
+                    if name in ACTIONABLE_ATTRIBUTES:
+                        values[name] = attr.get('value')
+                attributes = values
+
             # Extract element ID using elementId
-            element_id = element.get('elementId', idx)
+            element_id = str(element.get('elementId', idx))
             
-            # Get class name from className property
-            element_type = element.get('className', '')
+            # Without className the widget type is only in the attributes
+            # (class on Android, type on iOS, e.g. XCUIElementTypeTextField)
+            element_type = element.get('className') or attributes.get(type_attribute) or ''
             
             # Format bounds - use provided bounds or construct from coordinates
             bounds = element.get('bounds', '')
             if not bounds and 'x1' in element and 'y1' in element and 'x2' in element and 'y2' in element:
                 bounds = f"[{element['x1']},{element['y1']}][{element['x2']},{element['y2']}]"
+            bounds = bounds or attributes.get('bounds') or ''
             
-            # Initialize values to extract from attributes
-            resource_id = ''
-            content_desc = ''
-            enabled = False
-            password = False
-            text = element.get('text', '')
-            
-            # Extract values from attributes list
-            if 'attributes' in element:
-                for attr in element['attributes']:
-                    if attr.get('name') == 'resource-id':
-                        resource_id = attr.get('value', '')
-                    elif attr.get('name') == 'content-desc':
-                        content_desc = attr.get('value', '')
-                    elif attr.get('name') == 'clickable':
-                        enabled = attr.get('value') == 'true'
-                    elif attr.get('name') == 'password':
-                        password = attr.get('value') == 'true'
-                    elif attr.get('name') == 'text' and not text:
-                        text = attr.get('value', '')
-            
-            # Format consistent with process_xml output
-            action_details = {
-                'text': text,
-                'resource_id': resource_id,
-                'type': element_type.split('.')[-1] if element_type else '',
-                'bounds': bounds,
-                'class': element_type,
-                'content_desc': content_desc,
-                'enabled': enabled,
-                'password': password
-            }
-            
-            # Store by elementId or index
-            interactable_elements[str(element_id)] = action_details
+            # Format consistent with process_xml output. Positional arguments, in field
+            # order: noticeably cheaper than keywords on screens with thousands of elements
+            interactable_elements[element_id] = ScreenElement(
+                element_id,
+                element.get('text') or attributes.get('text') or '',
+                attributes.get('resource-id') or '',
+                element_type.split('.')[-1].split('XCUIElementType')[-1],
+                bounds,
+                element_type,
+                attributes.get('content-desc') or '',
+                attributes.get('clickable') in ('true', True),
+                attributes.get('password') in ('true', True),
+                element.get('node_id'),
+                element.get('description'),
+                parse_bounds(bounds),
+            )
             
+        interactable_elements.parsed = True
         return interactable_elements
     except Exception as e:
-        print(f"Error processing clickable elements: {e}")
-        return {}
-def annotate_image(base64_image, xml_data):
+        logger.error("Error processing clickable elements: %s", e)
+        return ScreenIndex()
+# Annotation engine settings. The defaults match the resolution gpt-4o actually
+# looks at in high-detail mode (fit in 2048x2048, then shortest side 768).
+ANNOTATE_MAX_LONG_SIDE = int(os.getenv("ANNOTATE_MAX_LONG_SIDE", "2048"))
+ANNOTATE_MAX_SHORT_SIDE = int(os.getenv("ANNOTATE_MAX_SHORT_SIDE", "768"))
+ANNOTATE_FORMAT = os.getenv("ANNOTATE_FORMAT", "jpeg").lower()  # jpeg, webp or png
+ANNOTATE_QUALITY = int(os.getenv("ANNOTATE_QUALITY", "85"))
+ANNOTATE_FONT_SIZE = 60
+
+_ANNOTATE_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+def annotation_mime_type():
+    """
+    Returns the MIME type of the images produced by annotate_image.
+    """
+    return _ANNOTATE_MIME_TYPES.get(ANNOTATE_FORMAT, "image/jpeg")
+
+
+@lru_cache(maxsize=16)
+def _load_font(size):
+    # Try to load a font, use default if not available
+    for path in ("Arial.ttf", os.path.join(os.path.dirname(os.path.abspath(__file__)), "Arial.ttf")):
+        try:
+            return ImageFont.truetype(path, size)
+        except IOError:
+            continue
+    return ImageFont.load_default()
+
+
+def annotation_scale(width, height):
+    """
+    Returns the factor that brings a screenshot down to the model's effective input resolution.
+    """
+    if not width or not height:
+        return 1.0
+    return min(1.0, ANNOTATE_MAX_LONG_SIDE / max(width, height), ANNOTATE_MAX_SHORT_SIDE / min(width, height))
+
+
+def _open_image(base64_image, image_data):
+    if isinstance(image_data, Image.Image):
+        return image_data
+    if image_data is None:
+        if isinstance(base64_image, ImagePayload):
+            return base64_image.open()
+        image_data = base64.b64decode(base64_image)
+    return Image.open(BytesIO(image_data))
+
+
+def annotate_image(base64_image, xml_data, image_data=None, capture=False, request_id=None, run_id=None):
     """
     Annotate the image with bounding boxes and element IDs for all interactable elements.
-    Scales bounds based on XML resolution.
+    The screenshot is downscaled to the model's effective input resolution before
+    drawing and the bounds are scaled to match.
     
     Args:
-        base64_image (str): Base64 encoded image string
-        xml_data (dict): Processed XML data containing interactable elements
+        base64_image (str or ImagePayload): Base64 encoded image string or image payload
+        xml_data (dict): Element id -> ScreenElement of the interactable elements
+        image_data (bytes or PIL.Image.Image): Already decoded screenshot, skips base64 decoding
+        capture (bool): Queue the annotated image for the debug capture writer
+        request_id (str), run_id (str): Used to name the debug capture
         
     Returns:
-        str: Base64 encoded annotated image
+        str: Base64 encoded annotated image in ANNOTATE_FORMAT (see annotation_mime_type)
     """
-    # Decode base64 image
-    image_data = base64.b64decode(base64_image)
-    image = Image.open(BytesIO(image_data))
+    image = _open_image(base64_image, image_data)
+    width, height = image.size
+    scale = annotation_scale(width, height)
+    target_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1.0:
+        if image.format == "JPEG":
+            # Let the JPEG decoder do most of the downscaling
+            image.draft("RGB", target_size)
+        image = image.resize(target_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
 
-    if image.mode == 'RGBA':
+    if ANNOTATE_FORMAT == "jpeg" and image.mode != 'RGB':
         image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    if image is image_data:
+        # Never draw on the caller's image
+        image = image.copy()
     draw = ImageDraw.Draw(image)
-    
-    # Try to load a font, use default if not available
-    try:
-        font = ImageFont.truetype("Arial.ttf", 60)
-    except IOError:
-        font = ImageFont.load_default()
+    font = _load_font(max(12, round(ANNOTATE_FONT_SIZE * scale)))
+    outline_width = max(1, round(3 * scale))
     
     # Draw bounding boxes and element IDs for all interactable elements
     for element_id, element_data in xml_data.items():
-        if "bounds" in element_data:
-            bounds = element_data["bounds"]
-            if isinstance(bounds, str):
-                # Parse bounds string like "[0,0][100,100]"
-                coords = bounds.replace("][", ",").strip("[]").split(",")
-                if len(coords) == 4:
-                    x1, y1, x2, y2 = map(int, coords)
-                    # Draw rectangle
-                    draw.rectangle([(x1, y1), (x2, y2)], outline="red", width=3)  # Increased outline width
-                    draw.text((x1 - 30, y1+20), element_id, fill="red", font=font)  # Position text at left center
-
-    # plt.figure(figsize=(8, 8))
-    # plt.imshow(image)
-    # plt.axis('off')  # Hide the axis
-    # plt.show()
+        if element_data.rect is not None:
+            # Bounds were parsed into integers when the elements were normalized
+            x1, y1, x2, y2 = (c * scale for c in element_data.rect)
+            # Draw rectangle
+            draw.rectangle([(x1, y1), (x2, y2)], outline="red", width=outline_width)
+            draw.text((x1 - 30 * scale, y1 + 20 * scale), element_id, fill="red", font=font)  # Position text at left center
+
     # Convert back to base64
     buffered = BytesIO()
-    image.save(buffered, format="JPEG")
+    if ANNOTATE_FORMAT == "webp":
+        image.save(buffered, format="WEBP", quality=ANNOTATE_QUALITY, method=4)
+    elif ANNOTATE_FORMAT == "png":
+        image.save(buffered, format="PNG", compress_level=1)
+    else:
+        image.save(buffered, format="JPEG", quality=ANNOTATE_QUALITY)
     annotated_base64 = base64.b64encode(buffered.getvalue()).decode()
 
-    # Save the annotated image (optional)
-    os.makedirs("screenshot_combined_debug", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = uuid.uuid4().hex
-    filename = f"screenshot_combined_debug/annotated_image_{timestamp}_{unique_id}.jpg"
-    try:
-        image.save(filename)
-        print(f"Annotated image saved as {filename}")
-    except Exception as e:
-        print(f"Error saving annotated image: {e}")
+    # Hand the encoded bytes to the background debug writer (optional)
+    if capture:
+        debug_capture.submit(buffered.getvalue(), 'jpg' if ANNOTATE_FORMAT == 'jpeg' else ANNOTATE_FORMAT,
+                             request_id=request_id, run_id=run_id)
 
     return annotated_base64
 
@@ -304,8 +535,9 @@ def trim_element_jsons(request_id, elements_to_trim, os: str):
 
         return trimmed_elements
     except Exception as e:
-        logger.error(f"requestid :: {request_id} :: Exception in trimming tokens in filtered elements before prioritization; returning as is: {str(e)}")
+        logger.error("requestid :: %s :: Exception in trimming tokens in filtered elements before prioritization; returning as is: %s", request_id, e)
         return elements_to_trim
+
 def validate_base64(base64_string: str) -> bool:
     try:
         base64.b64decode(base64_string)